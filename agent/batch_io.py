@@ -0,0 +1,125 @@
+import json
+import os
+import time
+import zlib
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+def parse_shard(value: Optional[str]) -> Optional[Tuple[int, int]]:
+    """'i/n' -> (i, n) with 0 <= i < n; None for no sharding."""
+    if not value:
+        return None
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{value}', expected i/n (e.g. 0/4)")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard '{value}': i must be in [0, n)")
+    return index, count
+
+def in_shard(question_id: Any, shard: Optional[Tuple[int, int]]) -> bool:
+    """Stable assignment of a question to one of n shards (by its id, not its position)."""
+    if shard is None:
+        return True
+    index, count = shard
+    return zlib.crc32(str(question_id).encode("utf-8")) % count == index
+
+def iter_jsonl(path: str, start: int = 0) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Streams (byte offset after the line, item) from a JSONL file, one line in
+    memory at a time. Blank lines are skipped, invalid JSON is reported and
+    skipped. `start` resumes at a byte offset returned earlier.
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        for raw in iter(f.readline, b""):
+            line = raw.decode("utf-8")
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"⚠️ Skipping invalid JSON line: {line[:50]}...")
+                continue
+            yield f.tell(), item
+
+def completed_ids(out_path: str) -> Set[str]:
+    """
+    IDs already written to an output file. A partial last line (the process
+    died mid-write) is cut off so appending starts on a clean line.
+    """
+    if not os.path.exists(out_path):
+        return set()
+
+    with open(out_path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            print(f"⚠️ Dropping a partial record at the end of {out_path}")
+            f.truncate(end)
+            data = data[:end]
+
+    ids = set()
+    for line in data.decode("utf-8").splitlines():
+        try:
+            ids.add(str(json.loads(line)["id"]))
+        except (json.JSONDecodeError, KeyError, TypeError):
+            continue
+    return ids
+
+class Checkpoint:
+    """
+    Progress metadata for a batch run, kept next to the output as
+    `<out>.checkpoint.json` (written atomically). Records the input byte
+    offset after the last written record so --resume can seek instead of
+    re-reading the input from the start.
+    """
+
+    def __init__(self, out_path: str, batch_path: str, shard: Optional[Tuple[int, int]], every: int = 25):
+        self.path = out_path + ".checkpoint.json"
+        self.every = max(1, every)
+        self.state = {
+            "input": os.path.abspath(batch_path),
+            "shard": f"{shard[0]}/{shard[1]}" if shard else None,
+            "input_offset": 0,
+            "last_id": None,
+            "written": 0,
+            "skipped": 0,
+            "complete": False,
+            "started_at": time.time(),
+            "updated_at": None,
+        }
+        self._pending = 0
+
+    def resume_offset(self) -> int:
+        """Input offset to resume from, 0 unless a checkpoint for the same input and shard exists."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return 0
+        if saved.get("input") != self.state["input"] or saved.get("shard") != self.state["shard"]:
+            return 0
+        offset = int(saved.get("input_offset") or 0)
+        if offset > os.path.getsize(self.state["input"]):
+            return 0  # the input was replaced
+        self.state.update(written=saved.get("written", 0), last_id=saved.get("last_id"),
+                          input_offset=offset, started_at=saved.get("started_at", self.state["started_at"]))
+        return offset
+
+    def record(self, question_id: Any, input_offset: int):
+        """Notes one written record; saves every `every` records."""
+        self.state.update(last_id=question_id, input_offset=input_offset, written=self.state["written"] + 1)
+        self._pending += 1
+        if self._pending >= self.every:
+            self.save()
+
+    def skip(self):
+        self.state["skipped"] += 1
+
+    def save(self, complete: bool = False):
+        self.state.update(complete=complete, updated_at=time.time())
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp, self.path)
+        self._pending = 0
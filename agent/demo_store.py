@@ -0,0 +1,141 @@
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, TypedDict
+
+from agent.rag.context_packer import estimate_tokens
+from agent.rag.index import BM25Index
+
+_TABLES = re.compile(r"\b(?:FROM|JOIN)\s+([A-Za-z_]\w*)", re.I)
+# Prompt scaffolding around each demo's fields (DSPy's field headers)
+_DEMO_OVERHEAD_TOKENS = 30
+# Sources kept in the tracked store file; anything else is learned
+CURATED_SOURCES = ("seed", "manual")
+
+class Demo(TypedDict):
+    question: str
+    db_schema: str  # short "Tables: ..." line, as in the optimized module's demos
+    sql_query: str
+    source: str  # "seed", "manual" (both curated) or "benchmark" (learned: scored correct)
+    added_at: float
+
+def demo_schema(sql_query: str) -> str:
+    """'Tables: a, b' for the tables a query reads."""
+    tables = list(dict.fromkeys(t.lower() for t in _TABLES.findall(sql_query)))
+    return f"Tables: {', '.join(tables)}"
+
+def _normalize(question: str) -> str:
+    return " ".join(question.lower().split())
+
+class DemoStore:
+    """
+    Question -> SQL pairs used as TextToSQL few-shot demos picked per
+    question instead of a fixed set.
+
+    Curated pairs (seeded from the optimized module or added by hand, SQL
+    checked to run) live in `path`, which is tracked. Learned pairs
+    (benchmark answers scored correct, see `learn()`) go to `learned_path`,
+    an untracked file merged at load; a curated pair wins over a learned one
+    for the same question.
+
+    Questions are indexed with BM25 (agent.rag.index); `select()` returns the
+    k most similar ones that fit a token budget. One pair is kept per
+    distinct question (the latest SQL wins); the index is rebuilt on the
+    next select after a change.
+    """
+
+    def __init__(self, path: str, learned_path: Optional[str] = None):
+        self.path = path
+        self.learned_path = learned_path
+        self._lock = threading.Lock()
+        self._demos: Dict[str, Demo] = {}  # normalized question -> demo
+        self._index: Optional[BM25Index] = None
+        self._ordered: List[Demo] = []
+        self.selections = 0
+        self.appended = 0
+        for source_path in (learned_path, path):
+            if source_path and os.path.exists(source_path):
+                with open(source_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            demo = json.loads(line)
+                            self._demos[_normalize(demo["question"])] = demo
+
+    def __len__(self) -> int:
+        return len(self._demos)
+
+    def _ensure_index(self) -> BM25Index:
+        # Under self._lock
+        if self._index is None:
+            self._ordered = list(self._demos.values())
+            self._index = BM25Index(None)
+            self._index.index_chunks("demos", [
+                {"id": str(i), "content": demo["question"], "source": "demos"}
+                for i, demo in enumerate(self._ordered)
+            ])
+        return self._index
+
+    def select(self, question: str, k: int = 3, budget: Optional[int] = None) -> List[Demo]:
+        """
+        Up to k demos most similar to `question` (BM25 over the demo
+        questions, best first), skipping any that would overflow `budget`
+        estimated tokens. Demos sharing no term with the question are left out.
+        """
+        with self._lock:
+            self.selections += 1
+            if not self._demos:
+                return []
+            index = self._ensure_index()
+            ordered = self._ordered
+        scores = index.get_scores(question)
+        picked: List[Demo] = []
+        used = 0
+        for idx in index.top_k(scores, len(ordered)):
+            if len(picked) >= k or scores[idx] <= 0:
+                break
+            demo = ordered[idx]
+            cost = estimate_tokens(demo["question"] + demo["db_schema"] + demo["sql_query"]) + _DEMO_OVERHEAD_TOKENS
+            if budget is not None and used + cost > budget:
+                continue
+            picked.append(demo)
+            used += cost
+        return picked
+
+    def append(self, question: str, sql_query: str, source: str = "manual") -> bool:
+        """
+        Adds a curated pair ("seed" / "manual") to `path`, or a learned one to
+        `learned_path`; False when the store already has this exact pair, or a
+        curated pair for the question when learning.
+        """
+        curated = source in CURATED_SOURCES
+        target = self.path if curated else self.learned_path
+        if target is None:
+            raise ValueError(f"No learned_path to store '{source}' demos in")
+        key = _normalize(question)
+        sql_query = sql_query.strip()
+        with self._lock:
+            existing = self._demos.get(key)
+            if existing is not None and (existing["sql_query"] == sql_query or
+                                         (not curated and existing["source"] in CURATED_SOURCES)):
+                return False
+            demo: Demo = {"question": question.strip(), "db_schema": demo_schema(sql_query), "sql_query": sql_query,
+                          "source": source, "added_at": round(time.time(), 3)}
+            self._demos[key] = demo
+            self._index = None
+            self.appended += 1
+            if os.path.dirname(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, "a", encoding="utf-8") as f:
+                f.write(json.dumps(demo) + "\n")
+        return True
+
+    def learn(self, question: str, sql_query: str) -> bool:
+        """Adds the SQL of an answer scored correct against a reference (benchmark.py --learn-demos)."""
+        return self.append(question, sql_query, source="benchmark")
+
+    def stats(self) -> Dict[str, Any]:
+        learned = sum(1 for demo in self._demos.values() if demo["source"] not in CURATED_SOURCES)
+        return {"path": self.path, "learned_path": self.learned_path, "demos": len(self._demos),
+                "learned": learned, "selections": self.selections, "appended": self.appended}
@@ -0,0 +1,120 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+from agent.rag.retrieval import LocalRetriever
+
+# Phrases that point at the markdown knowledge base
+DOC_CUES = [
+    r"\baccording to\b", r"\bas defined\b", r"\bdefined in\b", r"\bper the\b", r"\bdefinitions?\b",
+    r"\bpolicy\b", r"\bpolicies\b", r"\bdocs?\b", r"\bdocumentation\b", r"\bcalendar\b",
+    r"\bcatalog\b", r"\bmentioned in\b", r"\bkpi\b", r"\breturn window\b",
+]
+
+# Phrases that need numbers out of the database
+DATA_CUES = [
+    r"\btotal\b", r"\bsum\b", r"\baverage\b", r"\bavg\b", r"\bcount\b", r"\bhow many\b",
+    r"\bnumber of\b", r"\btop \d+\b", r"\btop\b", r"\bhighest\b", r"\blowest\b", r"\bmost\b",
+    r"\bleast\b", r"\brevenue\b", r"\bsales\b", r"\bsold\b", r"\bquantity\b", r"\bfreight\b",
+    r"\bmargin\b", r"\baov\b", r"\border value\b", r"\borderid\b", r"\bemployees?\b",
+    r"\b(?:19|20)\d{2}\b",
+]
+
+_DOC_RE = [re.compile(p) for p in DOC_CUES]
+_DATA_RE = [re.compile(p) for p in DATA_CUES]
+
+def _heading_phrases(retriever: LocalRetriever) -> List[str]:
+    """
+    Markdown headings of the corpus ("Summer Beverages", "Gross Margin",
+    "Average Order Value (AOV)" -> "average order value" + "aov"). A question
+    naming one of them needs the docs.
+    """
+    phrases = set()
+    for chunk in retriever.chunks:
+        for line in chunk["content"].splitlines():
+            if not line.startswith("#"):
+                continue
+            heading = line.lstrip("#").strip().lower()
+            for acronym in re.findall(r"\(([^)]+)\)", heading):
+                if len(acronym) > 1 and "year" not in acronym:
+                    phrases.add(acronym.strip())
+            heading = re.sub(r"\([^)]*\)", "", heading).strip()
+            if len(heading) > 3:
+                phrases.add(heading)
+    return sorted(phrases)
+
+class FastRouter:
+    """
+    Deterministic pre-classifier for the Router signature.
+
+    Combines keyword lexicons, the corpus headings, the format hint and the
+    BM25 score mass the docs put on the question into a route ('sql', 'rag',
+    'hybrid') and a confidence. router_node only calls the LLM when the
+    confidence is below `threshold`.
+    """
+
+    def __init__(self, retriever: LocalRetriever, threshold: float = 0.75,
+                 min_doc_mass: float = 15.0, strong_doc_mass: float = 45.0):
+        self.retriever = retriever
+        self.threshold = threshold
+        self.min_doc_mass = min_doc_mass
+        self.strong_doc_mass = strong_doc_mass
+        self.headings = _heading_phrases(retriever)
+
+        # Per route: questions decided here vs handed to the LLM
+        self.fast: Dict[str, int] = {}
+        self.fallbacks = 0
+
+    def _doc_mass(self, question: str) -> float:
+        return sum(hit["score"] for hit in self.retriever.retrieve(question, top_k=3))
+
+    def features(self, question: str, format_hint: Optional[str] = None) -> Dict[str, float]:
+        q = question.lower()
+        doc_cues = sum(1 for rx in _DOC_RE if rx.search(q))
+        doc_cues += sum(1 for phrase in self.headings if phrase in q)
+        data_cues = sum(1 for rx in _DATA_RE if rx.search(q))
+
+        # Structured numeric answers ({..:int}, list[{..:float}]) come from SQL
+        hint = (format_hint or "").lower().replace(" ", "")
+        if "{" in hint and (":int" in hint or ":float" in hint):
+            data_cues += 1
+
+        return {"doc_cues": doc_cues, "data_cues": data_cues, "doc_mass": self._doc_mass(question)}
+
+    def classify(self, question: str, format_hint: Optional[str] = None) -> Tuple[str, float]:
+        """Returns (route, confidence); confidence 0.0 means no opinion."""
+        f = self.features(question, format_hint)
+        doc, data, mass = f["doc_cues"], f["data_cues"], f["doc_mass"]
+
+        if doc and data:
+            route = "hybrid"
+            confidence = 0.55 + 0.1 * min(doc, 2) + 0.1 * min(data, 2)
+            if mass < self.min_doc_mass:
+                confidence -= 0.3
+        elif doc:
+            route = "rag"
+            confidence = 0.65 + 0.1 * min(doc, 3)
+            if mass < self.min_doc_mass:
+                confidence -= 0.3
+        elif data:
+            route = "sql"
+            confidence = 0.65 + 0.1 * min(data, 3)
+            if mass >= self.strong_doc_mass:
+                # Docs match strongly even without an explicit reference
+                confidence -= 0.15
+        else:
+            return "hybrid", 0.0
+
+        return route, round(min(confidence, 0.95), 2)
+
+    def route(self, question: str, format_hint: Optional[str] = None) -> Optional[str]:
+        """The route if confident enough, else None (caller asks the LLM)."""
+        route, confidence = self.classify(question, format_hint)
+        if confidence >= self.threshold:
+            self.fast[route] = self.fast.get(route, 0) + 1
+            return route
+        self.fallbacks += 1
+        return None
+
+    def stats(self) -> Dict[str, object]:
+        return {"fast": dict(self.fast), "llm_fallbacks": self.fallbacks,
+                "llm_calls_saved": sum(self.fast.values())}
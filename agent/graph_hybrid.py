@@ -1,38 +1,271 @@
-import os
-os.environ["DSP_CACHEBOOL"] = "False"
-
-import dspy
-from typing import TypedDict, List, Annotated, Literal, Any
+import asyncio
+import contextvars
+import functools
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING, TypedDict, List, Annotated, Literal, Any, Optional
 from langgraph.graph import StateGraph, END
 import operator
 
-# Import your components
-from agent.rag.retrieval import LocalRetriever
-from agent.tools.sqlite_tool import SQLiteTool
-from agent.dspy_signatures import Router, TextToSQL, HybridSynthesizer
-from agent.output_parser import parse_final_answer, extract_format_hint_from_question
-import json
+# Light imports only: dspy, the retriever (numpy/scipy) and the SQL tool are
+# imported by the Components that need them, on first use.
+from agent import metrics
+from agent.output_parser import parse_final_answer, extract_format_hint_from_question, answer_from_sql_result
+from agent.speculative_sql import SAMPLINGS, SELECTIONS, Candidate, run_candidate, sampling_config, vote, votes
+from agent.tools.sqlite_tool import CancelToken, to_records
+from agent.tools.sql_guard import GUARD_CANCELLED, GUARD_COST, GUARD_STEPS, GUARD_TIMEOUT, guard_kind
+
+if TYPE_CHECKING:
+    from agent.lm_cache import LMCache
+    from agent.rag.context_packer import PackedContext
 
 # --- 0. Configuration & Setup ---
 
-# Configure DSPy with strict settings
-lm = dspy.LM(
-    model="ollama/phi3.5:3.8b-mini-instruct-q4_K_M", 
-    api_base="http://localhost:11434",
-    temperature=0.0,
-    num_predict=1000, 
-    num_ctx=8192
-)
+class AgentConfig(TypedDict, total=False):
+    model: str
+    api_base: str
+    temperature: float
+    num_predict: int
+    num_ctx: int
+    lm_cache_path: str
+    docs_path: str
+    bm25_index_path: str
+    db_path: str
+    sql_cache_path: str
+    query_log_path: Optional[str]
+    sql_rollups: bool
+    sql_date_dimension: bool
+    schema_linking: bool
+    sql_context_tokens: Optional[int]
+    synth_context_tokens: Optional[int]
+    sql_candidates: int
+    candidate_selection: str
+    candidate_sampling: str
+    candidate_temperature: float
+    demo_store_path: str
+    demo_learned_path: Optional[str]
+    sql_demos: Optional[int]
+    demo_tokens: int
+    optimized_sql_module: str
+
+DEFAULT_CONFIG: AgentConfig = {
+    "model": "ollama/phi3.5:3.8b-mini-instruct-q4_K_M",
+    "api_base": "http://localhost:11434",
+    "temperature": 0.0,
+    "num_predict": 1000,
+    "num_ctx": 8192,
+    "lm_cache_path": ".cache/lm_responses.sqlite",
+    "docs_path": "docs",
+    "bm25_index_path": ".cache/bm25_index.json",
+    "db_path": "data/northwind.sqlite",
+    "sql_cache_path": ".cache/sql_results.sqlite",
+    "query_log_path": ".cache/query_log.jsonl",
+    # KPI rollup tables (see agent.tools.sql_rewrite); off until they beat the base tables on the workload
+    "sql_rollups": False,
+    # dim_date + Orders(OrderDate) index (see agent.tools.sql_dates), written into the DB when on
+    "sql_date_dimension": False,
+    "schema_linking": True,
+    # Token budgets for the retrieved docs in each prompt (None: every retrieved chunk, whole)
+    "sql_context_tokens": 200,
+    "synth_context_tokens": 350,
+    # Speculative SQL (see agent.speculative_sql): K > 1 generates and runs K candidates per attempt
+    "sql_candidates": 1,
+    "candidate_selection": "first",
+    "candidate_sampling": "concurrent",
+    "candidate_temperature": 0.7,
+    # TextToSQL demos picked per question from the demo store (None: the optimized module's fixed demos)
+    "demo_store_path": "agent/sql_demos.jsonl",
+    # Untracked demos learned from correct benchmark answers, merged at load
+    "demo_learned_path": ".cache/sql_demos.learned.jsonl",
+    "sql_demos": 3,
+    "demo_tokens": 600,
+    "optimized_sql_module": "agent/optimized_sql_module.json",
+}
+
+def _lazy(factory):
+    """Component property built on first access (thread-safe) and reused afterwards."""
+    name = factory.__name__
+
+    @functools.wraps(factory)
+    def getter(self):
+        with self._lock:
+            if name not in self._built:
+                self._built[name] = factory(self)
+            return self._built[name]
+    return property(getter)
+
+class Components:
+    """
+    The agent's tools and DSPy modules for one AgentConfig. Nothing is loaded
+    until a node first needs it, so importing this module and compiling the
+    graph stay cheap; `warm_up()` builds everything eagerly.
+    """
+
+    def __init__(self, config: Optional[AgentConfig] = None):
+        self.config: AgentConfig = {**DEFAULT_CONFIG, **(config or {})}
+        self._lock = threading.RLock()
+        self._built: dict = {}
+
+    @_lazy
+    def lm_cache(self) -> Optional["LMCache"]:
+        from agent.lm_cache import LMCache
+        return LMCache(self.config["lm_cache_path"])
+
+    @_lazy
+    def lm_transport(self):
+        return None  # live provider calls; see configure_lm_transport
+
+    @_lazy
+    def lm(self):
+        # Configure DSPy with strict settings. Responses go through our on-disk
+        # LMCache (see configure_lm_cache); DSPy's own cache is disabled by CachedLM.
+        import dspy
+        from agent.lm_cache import CachedLM
+        lm = CachedLM(
+            model=self.config["model"], 
+            lm_cache=self.lm_cache,
+            transport=self.lm_transport,
+            api_base=self.config["api_base"],
+            temperature=self.config["temperature"],
+            num_predict=self.config["num_predict"], 
+            num_ctx=self.config["num_ctx"]
+        )
+        dspy.configure(lm=lm)
+        return lm
+
+    # --- Tools ---
+
+    @_lazy
+    def retriever(self):
+        from agent.rag.retrieval import LocalRetriever
+        return LocalRetriever(self.config["docs_path"], self.config["bm25_index_path"])
+
+    @_lazy
+    def context_packer(self):
+        from agent.rag.context_packer import ContextPacker
+        budgets = {"sql": self.config["sql_context_tokens"], "synth": self.config["synth_context_tokens"]}
+        return ContextPacker(self.retriever.chunks, {k: v for k, v in budgets.items() if v is not None})
+
+    @_lazy
+    def demo_store(self):
+        from agent.demo_store import DemoStore
+        if not self.config["sql_demos"]:
+            return None
+        return DemoStore(self.config["demo_store_path"], self.config["demo_learned_path"])
+
+    @_lazy
+    def fast_router(self):
+        from agent.fast_router import FastRouter
+        return FastRouter(self.retriever)
+
+    @_lazy
+    def sql_tool(self):
+        from agent.tools.sqlite_tool import SQLiteTool
+        from agent.tools.result_cache import SQLResultCache
+        from agent.tools.query_log import QueryLog
+        query_log = QueryLog(self.config["query_log_path"]) if self.config["query_log_path"] else None
+        return SQLiteTool(self.config["db_path"], result_cache=SQLResultCache(self.config["sql_cache_path"]),
+                          query_log=query_log, rollups=self.config["sql_rollups"],
+                          date_dimension=self.config["sql_date_dimension"])
+
+    # --- DSPy Modules (one LM per signature so the cache can key and configure them separately) ---
+
+    @_lazy
+    def router_module(self):
+        import dspy
+        from agent.dspy_signatures import Router
+        module = dspy.Predict(Router)
+        module.set_lm(self.lm.for_signature("Router"))
+        return module
+
+    @_lazy
+    def sql_generator(self):
+        import dspy
+        from agent.dspy_signatures import TextToSQL
+        # LOAD OPTIMIZED MODULE IF EXISTS
+        try:
+            module = dspy.ChainOfThought(TextToSQL)
+            module.load(self.config["optimized_sql_module"])
+            print("🧠 Loaded Optimized SQL Module!")
+        except Exception as e:
+            print(f"⚠️ Could not load optimized module, using default. Error: {e}")
+            module = dspy.ChainOfThought(TextToSQL)
+        module.set_lm(self.lm.for_signature("TextToSQL"))
+        return module
+
+    @_lazy
+    def fallback_sql_generator(self):
+        # Vanilla predictor used when the optimized module crashes
+        import dspy
+        from agent.dspy_signatures import TextToSQL
+        module = dspy.Predict(TextToSQL)
+        module.set_lm(self.lm.for_signature("TextToSQL"))
+        return module
+
+    @_lazy
+    def synthesizer(self):
+        import dspy
+        from agent.dspy_signatures import HybridSynthesizer
+        module = dspy.ChainOfThought(HybridSynthesizer)
+        module.set_lm(self.lm.for_signature("HybridSynthesizer"))
+        return module
+
+    MODULES = ("router_module", "sql_generator", "fallback_sql_generator", "synthesizer")
+    TOOLS = ("retriever", "context_packer", "demo_store", "fast_router", "sql_tool")
 
-dspy.configure(lm=lm)
+    def warm_up(self):
+        """Builds every component now (e.g. before a batch starts)."""
+        for name in ("lm",) + self.TOOLS + self.MODULES:
+            getattr(self, name)
 
-# Initialize Tools
-retriever = LocalRetriever()
-sql_tool = SQLiteTool()
+    def configure_lm_cache(self, cache: Optional["LMCache"]):
+        """Points every agent LM at `cache`; None turns LM response caching off."""
+        with self._lock:
+            self._built["lm_cache"] = cache
+            if "lm" not in self._built:
+                return  # built later with this cache
+            self.lm.lm_cache = cache
+            for name in self.MODULES:
+                if name in self._built:
+                    for predictor in self._built[name].predictors():
+                        predictor.lm.lm_cache = cache
+
+    def configure_lm_transport(self, transport: Any):
+        """
+        Routes every agent LM's provider calls through `transport` (an
+        agent.lm_replay RecordingTransport / ReplayTransport); None calls the
+        provider directly.
+        """
+        with self._lock:
+            self._built["lm_transport"] = transport
+            if "lm" not in self._built:
+                return
+            self.lm.transport = transport
+            for name in self.MODULES:
+                if name in self._built:
+                    for predictor in self._built[name].predictors():
+                        predictor.lm.transport = transport
+
+_components: dict = {}
+_components_lock = threading.Lock()
+
+def get_components(config: Optional[AgentConfig] = None) -> Components:
+    """Shared Components per distinct config (the default config when None)."""
+    key = json.dumps({**DEFAULT_CONFIG, **(config or {})}, sort_keys=True)
+    with _components_lock:
+        if key not in _components:
+            _components[key] = Components(config)
+        return _components[key]
+
+def configure_lm_cache(cache: Optional["LMCache"]):
+    """configure_lm_cache on the default components."""
+    get_components().configure_lm_cache(cache)
 
 # --- 1. Define Agent State ---
 class AgentState(TypedDict):
     question: str
+    format_hint: str
     router_decision: str  # 'sql', 'rag', 'hybrid'
     
     # RAG Data
@@ -41,6 +274,7 @@ class AgentState(TypedDict):
     # SQL Data
     sql_query: str
     sql_result: List[dict] | str
+    sql_truncated: bool
     sql_error: str | None
     
     # Logic & Output
@@ -49,43 +283,62 @@ class AgentState(TypedDict):
     explanation: str
     citations: List[str]
 
-# --- 2. Define DSPy Modules ---
-router_module = dspy.Predict(Router)
-
-# LOAD OPTIMIZED MODULE IF EXISTS
-try:
-    sql_generator = dspy.ChainOfThought(TextToSQL)
-    sql_generator.load("agent/optimized_sql_module.json")
-    print("🧠 Loaded Optimized SQL Module!")
-except Exception as e:
-    print(f"⚠️ Could not load optimized module, using default. Error: {e}")
-    sql_generator = dspy.ChainOfThought(TextToSQL)
-
-synthesizer = dspy.ChainOfThought(HybridSynthesizer)
-
 # --- 3. Define Graph Nodes ---
 
-def router_node(state: AgentState):
+def _normalize_decision(decision: str) -> str:
+    """Cleans the raw router classification into one of 'sql', 'rag', 'hybrid'."""
+    decision = decision.replace(".", "").replace("'", "")
+    
+    if decision not in ['sql', 'rag', 'hybrid']:
+        decision = 'hybrid'
+    return decision
+
+def router_node(state: AgentState, components: Components):
     """Decides if we need RAG, SQL, or Both."""
     print(f"--- ROUTER: Analyzing '{state['question']}' ---")
+    fast = components.fast_router.route(state['question'], state.get('format_hint'))
+    if fast:
+        print(f"   ⚡ Fast route: {fast} (LLM router skipped)")
+        metrics.count("fast_route")
+        return {"router_decision": fast}
+
     try:
-        pred = router_module(question=state['question'])
+        pred = components.router_module(question=state['question'])
         decision = pred.classification.lower().strip()
     except Exception as e:
         print(f"⚠️ Router Error: {e}. Defaulting to 'hybrid'")
         decision = 'hybrid'
 
-    decision = decision.replace(".", "").replace("'", "")
-    
-    if decision not in ['sql', 'rag', 'hybrid']:
+    return {"router_decision": _normalize_decision(decision)}
+
+async def arouter_node(state: AgentState, components: Components):
+    """Async variant of router_node."""
+    print(f"--- ROUTER: Analyzing '{state['question']}' ---")
+    fast = await asyncio.to_thread(components.fast_router.route, state['question'], state.get('format_hint'))
+    if fast:
+        print(f"   ⚡ Fast route: {fast} (LLM router skipped)")
+        metrics.count("fast_route")
+        return {"router_decision": fast}
+
+    try:
+        pred = await components.router_module.acall(question=state['question'])
+        decision = pred.classification.lower().strip()
+    except Exception as e:
+        print(f"⚠️ Router Error: {e}. Defaulting to 'hybrid'")
         decision = 'hybrid'
-    
-    return {"router_decision": decision}
 
-def retriever_node(state: AgentState):
+    return {"router_decision": _normalize_decision(decision)}
+
+def retriever_node(state: AgentState, components: Components):
     """Fetches relevant docs using BM25."""
     print("--- RETRIEVER: Searching docs ---")
-    docs = retriever.retrieve(state['question'], top_k=3)
+    docs = components.retriever.retrieve(state['question'], top_k=3)
+    return {"retrieved_docs": docs}
+
+async def aretriever_node(state: AgentState, components: Components):
+    """Async variant of retriever_node (BM25 runs in a worker thread)."""
+    print("--- RETRIEVER: Searching docs ---")
+    docs = await asyncio.to_thread(components.retriever.retrieve, state['question'], 3)
     return {"retrieved_docs": docs}
 
 def planner_node(state: AgentState):
@@ -93,31 +346,86 @@ def planner_node(state: AgentState):
     print("--- PLANNER: Analyzing constraints ---")
     return {}
 
-def sql_generation_node(state: AgentState):
-    """Generates SQL using DSPy."""
-    current_retries = state.get('retry_count', 0)
-    print(f"--- SQL GEN (Attempt {current_retries + 1}) ---")
-    
-    schema_context = sql_tool.get_schema()
-    
+def _packed_context(state: AgentState, components: Components, purpose: str) -> Optional["PackedContext"]:
+    """
+    The retrieved docs packed into the `purpose` token budget ("sql" /
+    "synth"), or None when that budget is off or nothing was retrieved.
+    Cached per question, so SQL retries reuse the first packing.
+    """
+    budget = components.config["sql_context_tokens" if purpose == "sql" else "synth_context_tokens"]
+    if budget is None or not state.get('retrieved_docs'):
+        return None
+    packed = components.context_packer.pack(state['question'], state['retrieved_docs'], purpose, budget)
+    metrics.count("rag_tokens_saved", max(packed["input_tokens"] - packed["tokens"], 0))
+    return packed
+
+def _build_sql_input(state: AgentState, packed: Optional["PackedContext"] = None) -> str:
+    """Builds the question text for the SQL generator (RAG context + previous error)."""
     combined_input = state['question']
     
     # Inject RAG Context if available
-    if state.get('retrieved_docs'):
+    if packed is not None:
+        if packed["text"]:
+            combined_input += "\n\n--- RELEVANT KNOWLEDGE ---\n" + packed["text"]
+    elif state.get('retrieved_docs'):
         combined_input += "\n\n--- RELEVANT KNOWLEDGE ---"
         for d in state['retrieved_docs']:
             combined_input += f"\n- {d['content']}"
     
     # Inject Previous Error if available
     if state.get('sql_error'):
-        combined_input += f"\n\n--- PREVIOUS ERROR ---\nThe query failed: {state['sql_error']}\nPlease correct the SQL syntax."
+        combined_input += "\n\n--- PREVIOUS ERROR ---"
+        if state.get('sql_query'):
+            combined_input += f"\nPrevious SQL: {state['sql_query']}"
+        combined_input += f"\nThe query failed: {state['sql_error']}"
+        if guard_kind(state['sql_error']) in (GUARD_COST, GUARD_TIMEOUT, GUARD_STEPS):
+            combined_input += "\nThe query is too expensive: join every table with an ON condition and filter before aggregating."
+        else:
+            combined_input += "\nPlease correct the SQL syntax."
+    return combined_input
+
+def _schema_context(state: AgentState, components: Components) -> str:
+    """
+    Schema for the SQL generator: on the first attempt only the tables and
+    columns linked to the question and retrieved docs (shorter prompt); the
+    full schema on retries, in case the linker left out what the fix needs.
+    """
+    if not components.config["schema_linking"] or state.get('retry_count', 0) > 0:
+        return components.sql_tool.get_schema()
+    context = "\n".join(d['content'] for d in state.get('retrieved_docs') or [])
+    return components.sql_tool.get_linked_schema(state['question'], context)
+
+def _clean_sql(text: str) -> str:
+    return text.replace("```sql", "").replace("```", "").strip()
 
-    clean_sql = "SELECT 1" # Default safety
+def _select_demos(state: AgentState, components: Components) -> Optional[list]:
+    """
+    The demo store's nearest demos for the question, within demo_tokens; None
+    (keep the optimized module's fixed demos) when the store is off or empty.
+    """
+    store = components.demo_store
+    if store is None or not len(store):
+        return None
+    import dspy
+    demos = store.select(state['question'], components.config["sql_demos"], components.config["demo_tokens"])
+    metrics.count("sql_demos", len(demos))
+    return [dspy.Example(question=d['question'], db_schema=d['db_schema'], sql_query=d['sql_query']) for d in demos]
 
+def _generation_kwargs(config: Optional[dict], demos: Optional[list] = None) -> dict:
+    """Predictor call kwargs: sampling config and picked demos (the vanilla fallback gets no demos)."""
+    extra = {"config": config} if config else {}
+    if demos is not None:
+        extra["demos"] = demos
+    return extra
+
+def _generate_sql(components: Components, combined_input: str, schema_context: str,
+                  config: Optional[dict] = None, demos: Optional[list] = None) -> str:
+    """One SQL generation: the optimized module, else the vanilla predictor, else 'SELECT 1'."""
     try:
         # Attempt 1: Try the Optimized Module
-        pred = sql_generator(question=combined_input, db_schema=schema_context)
-        clean_sql = pred.sql_query.replace("```sql", "").replace("```", "").strip()
+        pred = components.sql_generator(question=combined_input, db_schema=schema_context,
+                                        **_generation_kwargs(config, demos))
+        clean_sql = _clean_sql(pred.sql_query)
         print("   ✅ Generated via Optimized Module")
         
     except Exception as e:
@@ -128,69 +436,383 @@ def sql_generation_node(state: AgentState):
         # This saves you from the "SELECT 1" death spiral.
         try:
             print("   🔄 Attempting Fallback (Vanilla DSPy)...")
-            fallback_gen = dspy.Predict(TextToSQL)
-            pred = fallback_gen(question=combined_input, db_schema=schema_context)
-            clean_sql = pred.sql_query.replace("```sql", "").replace("```", "").strip()
+            pred = components.fallback_sql_generator(question=combined_input, db_schema=schema_context,
+                                                     **_generation_kwargs(config))
+            clean_sql = _clean_sql(pred.sql_query)
+            print("   ✅ Generated via Fallback")
+        except Exception as e2:
+            print(f"   ❌ Fallback Failed: {e2}")
+            clean_sql = "SELECT 1" # Default safety
+    return clean_sql
+
+async def _agenerate_sql(components: Components, combined_input: str, schema_context: str,
+                         config: Optional[dict] = None, demos: Optional[list] = None) -> str:
+    """Async variant of _generate_sql."""
+    try:
+        pred = await components.sql_generator.acall(question=combined_input, db_schema=schema_context,
+                                                    **_generation_kwargs(config, demos))
+        clean_sql = _clean_sql(pred.sql_query)
+        print("   ✅ Generated via Optimized Module")
+    except Exception as e:
+        print(f"   ⚠️ Optimized Module Failed: {e}")
+        try:
+            print("   🔄 Attempting Fallback (Vanilla DSPy)...")
+            pred = await components.fallback_sql_generator.acall(question=combined_input, db_schema=schema_context,
+                                                                  **_generation_kwargs(config))
+            clean_sql = _clean_sql(pred.sql_query)
             print("   ✅ Generated via Fallback")
         except Exception as e2:
             print(f"   ❌ Fallback Failed: {e2}")
             clean_sql = "SELECT 1"
-        
-    return {"sql_query": clean_sql}
+    return clean_sql
 
-def sql_executor_node(state: AgentState):
-    """Runs the SQL and captures results or errors."""
-    print("--- EXECUTOR: Running Query ---")
-    query = state['sql_query']
-    result = sql_tool.execute_query(query)
+def sql_generation_node(state: AgentState, components: Components):
+    """Generates SQL using DSPy."""
+    current_retries = state.get('retry_count', 0)
+    print(f"--- SQL GEN (Attempt {current_retries + 1}) ---")
+    
+    schema_context = _schema_context(state, components)
+    combined_input = _build_sql_input(state, _packed_context(state, components, "sql"))
+    demos = _select_demos(state, components)
+    return {"sql_query": _generate_sql(components, combined_input, schema_context, demos=demos)}
+
+async def asql_generation_node(state: AgentState, components: Components):
+    """Async variant of sql_generation_node."""
+    current_retries = state.get('retry_count', 0)
+    print(f"--- SQL GEN (Attempt {current_retries + 1}) ---")
+    
+    schema_context = await asyncio.to_thread(_schema_context, state, components)
+    combined_input = _build_sql_input(state, _packed_context(state, components, "sql"))
+    demos = await asyncio.to_thread(_select_demos, state, components)
+    return {"sql_query": await _agenerate_sql(components, combined_input, schema_context, demos=demos)}
+
+def _validator_update(state: AgentState, error: str | None, statement: str) -> dict:
+    """Turns a validation outcome into a state update (invalid → retry_count + 1, like a failed run)."""
+    if error:
+        print(f"   ❌ Rejected before execution: {error}")
+        return {"sql_query": statement or state['sql_query'], "sql_result": None, "sql_error": error,
+                "retry_count": state.get('retry_count', 0) + 1}
+    print("   ✅ Valid")
+    return {"sql_query": statement, "sql_error": None}
+
+def sql_validator_node(state: AgentState, components: Components):
+    """Checks the SQL (single SELECT, known names, compiles) without running it."""
+    print("--- VALIDATOR: Checking Query ---")
+    error, statement = components.sql_tool.validate(state['sql_query'])
+    return _validator_update(state, error, statement)
+
+async def asql_validator_node(state: AgentState, components: Components):
+    """Async variant of sql_validator_node."""
+    print("--- VALIDATOR: Checking Query ---")
+    error, statement = await asyncio.to_thread(components.sql_tool.validate, state['sql_query'])
+    return _validator_update(state, error, statement)
+
+def _executor_update(state: AgentState, result) -> dict:
+    """Turns a run_query result into a state update (error → retry_count + 1)."""
     current_retries = state.get('retry_count', 0)
     
     if isinstance(result, str) and (result.startswith("Error") or result.startswith("SQL Error")):
         print(f"   ❌ Failed: {result}")
         # Increment retry count on failure
         return {"sql_result": None, "sql_error": result, "retry_count": current_retries + 1}
+
+    if result["row_count"] == 0:
+        print("   ✅ Success: 0 rows")
+        return {"sql_result": "Query executed successfully but returned no results.",
+                "sql_truncated": False, "sql_error": None}
+
+    if result["truncated"]:
+        print(f"   ⚠️ Result truncated at {result['row_count']} rows")
+    print(f"   ✅ Success: {result['row_count']} rows")
+    return {"sql_result": to_records(result), "sql_truncated": result["truncated"], "sql_error": None}
+
+def sql_executor_node(state: AgentState, components: Components):
+    """Runs the SQL and captures results or errors."""
+    print("--- EXECUTOR: Running Query ---")
+    result = components.sql_tool.run_query(state['sql_query'])
+    return _executor_update(state, result)
+
+async def asql_executor_node(state: AgentState, components: Components):
+    """Async variant of sql_executor_node (SQLite runs in a worker thread)."""
+    print("--- EXECUTOR: Running Query ---")
+    cancel = CancelToken()
+    try:
+        result = await asyncio.to_thread(components.sql_tool.run_query, state['sql_query'], cancel)
+    except asyncio.CancelledError:
+        # The worker thread keeps running otherwise: stop this question's query (only)
+        cancel.cancel()
+        raise
+    return _executor_update(state, result)
+
+def _report_candidate(candidate: Candidate):
+    outcome = f"❌ {candidate['error']}" if candidate['error'] else f"✅ {candidate['result']['row_count']} rows"
+    print(f"   🎲 Candidate {candidate['index'] + 1}: {outcome}")
+
+def _candidates_update(state: AgentState, candidates: List[Candidate], policy: str) -> dict:
+    """
+    Picks the candidate per `policy` and turns it into an executor-style
+    state update; no successful candidate counts as one failed attempt.
+    `candidates` are in completion order.
+    """
+    ok = [c for c in candidates if c['error'] is None]
+    metrics.count("sql_candidates", len(candidates))
+    metrics.count("sql_candidates_ok", len(ok))
+    winner = vote(candidates) if policy == "vote" else (ok[0] if ok else None)
+    if winner is None:
+        failed = min(candidates, key=lambda c: c['index'])
+        print(f"   ❌ No candidate ran: {failed['error']}")
+        return {"sql_query": failed['sql_query'], "sql_result": None, "sql_error": failed['error'],
+                "retry_count": state.get('retry_count', 0) + 1}
+
+    detail = f"{votes(candidates, winner)}/{len(candidates)} agree" if policy == "vote" else "first success"
+    print(f"   🏁 Candidate {winner['index'] + 1} selected ({detail})")
+    update = _executor_update(state, winner['result'])
+    update["sql_query"] = winner['sql_query']
+    return update
+
+def _sample_candidates_n(components: Components, combined_input: str, schema_context: str, k: int,
+                         demos: Optional[list] = None) -> List[str]:
+    """K SQL candidates from one n-completions call; a single generation if the call fails."""
+    config = {"n": k, "temperature": components.config["candidate_temperature"]}
+    try:
+        pred = components.sql_generator(question=combined_input, db_schema=schema_context,
+                                        **_generation_kwargs(config, demos))
+        queries = [_clean_sql(q) for q in pred.completions.sql_query]
+        print(f"   ✅ Generated {len(queries)} candidates in one call")
+        return queries
+    except Exception as e:
+        print(f"   ⚠️ n-completions call failed: {e}")
+        return [_generate_sql(components, combined_input, schema_context, demos=demos)]
+
+async def _asample_candidates_n(components: Components, combined_input: str, schema_context: str,
+                                k: int, demos: Optional[list] = None) -> List[str]:
+    """Async variant of _sample_candidates_n."""
+    config = {"n": k, "temperature": components.config["candidate_temperature"]}
+    try:
+        pred = await components.sql_generator.acall(question=combined_input, db_schema=schema_context,
+                                                    **_generation_kwargs(config, demos))
+        queries = [_clean_sql(q) for q in pred.completions.sql_query]
+        print(f"   ✅ Generated {len(queries)} candidates in one call")
+        return queries
+    except Exception as e:
+        print(f"   ⚠️ n-completions call failed: {e}")
+        return [await _agenerate_sql(components, combined_input, schema_context, demos=demos)]
+
+def sql_candidates_node(state: AgentState, components: Components):
+    """
+    Speculative replacement for sql_gen -> validator -> executor: samples
+    `sql_candidates` queries, validates and runs them in parallel and keeps
+    the first success or the majority result (`candidate_selection`).
+    """
+    config = components.config
+    k, policy = config["sql_candidates"], config["candidate_selection"]
+    print(f"--- SQL CANDIDATES (Attempt {state.get('retry_count', 0) + 1}, "
+          f"{k} x {config['candidate_sampling']}, {policy}) ---")
+    schema_context = _schema_context(state, components)
+    combined_input = _build_sql_input(state, _packed_context(state, components, "sql"))
+    demos = _select_demos(state, components)
+
+    cancels = [CancelToken() for _ in range(k)]
+
+    def candidate(index: int) -> Candidate:
+        sql = _generate_sql(components, combined_input, schema_context,
+                            sampling_config(index, config["candidate_temperature"]), demos)
+        return run_candidate(components.sql_tool, index, sql, cancels[index])
+
+    pool = ThreadPoolExecutor(max_workers=k)
+    # Each worker gets a copy of this context, so LM calls count towards this node's metrics span
+    submit = lambda fn, *args: pool.submit(contextvars.copy_context().run, fn, *args)
+    candidates: List[Candidate] = []
+    try:
+        if config["candidate_sampling"] == "n":
+            queries = _sample_candidates_n(components, combined_input, schema_context, k, demos)
+            futures = [submit(run_candidate, components.sql_tool, i, sql, cancels[i]) for i, sql in enumerate(queries)]
+        else:
+            futures = [submit(candidate, i) for i in range(k)]
+        for future in as_completed(futures):
+            candidates.append(future.result())
+            _report_candidate(candidates[-1])
+            if policy == "first" and candidates[-1]['error'] is None:
+                break
+    finally:
+        # "first" does not wait for the slower candidates: stop their queries too
+        pool.shutdown(wait=False, cancel_futures=True)
+        for cancel in cancels:
+            cancel.cancel()
+    return _candidates_update(state, candidates, policy)
+
+async def asql_candidates_node(state: AgentState, components: Components):
+    """Async variant of sql_candidates_node (candidates are tasks; SQLite runs in worker threads)."""
+    config = components.config
+    k, policy = config["sql_candidates"], config["candidate_selection"]
+    print(f"--- SQL CANDIDATES (Attempt {state.get('retry_count', 0) + 1}, "
+          f"{k} x {config['candidate_sampling']}, {policy}) ---")
+    schema_context = await asyncio.to_thread(_schema_context, state, components)
+    combined_input = _build_sql_input(state, _packed_context(state, components, "sql"))
+    demos = await asyncio.to_thread(_select_demos, state, components)
+
+    cancels = [CancelToken() for _ in range(k)]
+
+    async def run(index: int, sql: str) -> Candidate:
+        return await asyncio.to_thread(run_candidate, components.sql_tool, index, sql, cancels[index])
+
+    async def candidate(index: int) -> Candidate:
+        sql = await _agenerate_sql(components, combined_input, schema_context,
+                                   sampling_config(index, config["candidate_temperature"]), demos)
+        return await run(index, sql)
+
+    if config["candidate_sampling"] == "n":
+        queries = await _asample_candidates_n(components, combined_input, schema_context, k, demos)
+        tasks = [asyncio.create_task(run(i, sql)) for i, sql in enumerate(queries)]
     else:
-        print(f"   ✅ Success: {len(result)} rows")
-        return {"sql_result": result, "sql_error": None}
+        tasks = [asyncio.create_task(candidate(i)) for i in range(k)]
+    candidates: List[Candidate] = []
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            candidates.append(await next_done)
+            _report_candidate(candidates[-1])
+            if policy == "first" and candidates[-1]['error'] is None:
+                break
+    finally:
+        for task, cancel in zip(tasks, cancels):
+            task.cancel()  # the LM calls still pending
+            cancel.cancel()  # and the queries already running in worker threads
+    return _candidates_update(state, candidates, policy)
 
-def synthesizer_node(state: AgentState):
-    """Combines everything into the final answer with proper type conversion."""
-    print("--- SYNTHESIZER: Formatting Answer ---")
-    
-    
+def _synthesizer_inputs(state: AgentState, components: Components):
+    """Collects the synthesizer prompt inputs, doc citations and the expected format."""
     doc_context = ""
     citations = []
     
-    # Gather doc citations
-    if state.get('retrieved_docs'):
+    # Gather doc citations (only the chunks that made it into the packed context)
+    packed = _packed_context(state, components, "synth")
+    if packed is not None:
+        doc_context = packed["text"] + "\n" if packed["text"] else ""
+        citations.extend(packed["sources"])
+    elif state.get('retrieved_docs'):
         for d in state['retrieved_docs']:
             doc_context += f"[Source: {d['id']}] {d['content']}\n"
             citations.append(d['id'])
             
     sql_ctx = state.get('sql_query', "N/A")
     res_ctx = str(state.get('sql_result', "No data"))
+    if state.get('sql_truncated'):
+        res_ctx += f"\n(Result truncated to the first {len(state['sql_result'])} rows.)"
     
     # Extract format hint from question
     format_hint = state.get('format_hint') or extract_format_hint_from_question(state['question'])
     print(f"   Expected format: {format_hint}")
 
+    inputs = {
+        "question": state['question'],
+        "context": doc_context,
+        "sql_query": sql_ctx,
+        "sql_result": res_ctx,
+        "format_hint": format_hint
+    }
+    return inputs, citations, format_hint
+
+def _sql_table_citations(sql_query: str | None) -> List[str]:
+    """Maps the tables a query touches to the exact names from the assignment."""
+    citations = []
+    if sql_query:
+        sql_lower = sql_query.lower()
+        
+        # Map to exact names from assignment
+        if 'from orders' in sql_lower or 'join orders' in sql_lower:
+            citations.append('Orders')
+        if 'order_items' in sql_lower or '"order details"' in sql_lower:
+            citations.append('Order Details')
+        if 'from products' in sql_lower or 'join products' in sql_lower:
+            citations.append('Products')
+        if 'from customers' in sql_lower or 'join customers' in sql_lower:
+            citations.append('Customers')
+        if 'categories' in sql_lower:
+            citations.append('Categories')
+    return citations
+
+def _dedupe(citations: List[str]) -> List[str]:
+    # Deduplicate while preserving order
+    seen = set()
+    unique_citations = []
+    for c in citations:
+        if c not in seen:
+            seen.add(c)
+            unique_citations.append(c)
+    return unique_citations
+
+def _fast_synthesis(state: AgentState, format_hint: str, citations: List[str]) -> dict | None:
+    """
+    Deterministic answer for int/float/dict hints when the SQL step returned
+    exactly one unambiguous row; skips the LLM synthesizer. None otherwise.
+    """
+    if state.get('sql_error') or not state.get('sql_query'):
+        return None
+    if state['sql_query'].strip().rstrip(';').upper() == "SELECT 1":
+        return None  # safety default after generation failed, not an answer
+    answer = answer_from_sql_result(format_hint, state.get('sql_result'))
+    if answer is None:
+        return None
+
+    tables = _sql_table_citations(state['sql_query'])
+    row = state['sql_result'][0]
+    columns = ", ".join(f"{k}={v}" for k, v in row.items())
+    explanation = f"Taken directly from the SQL result ({columns})"
+    if tables:
+        explanation += f" computed over {', '.join(tables)}"
+    explanation += "."
+
+    print(f"   ⚡ Fast synthesis: {answer} (LLM synthesizer skipped)")
+    metrics.count("fast_synthesis")
+    return {
+        "final_answer": answer,
+        "explanation": explanation[:300],
+        "citations": _dedupe(citations + tables)
+    }
+
+def _synthesizer_error(e: Exception):
+    print(f"   Warning: Synthesizer error: {e}")
+    return type('obj', (object,), {
+        'final_answer': 'Error',
+        'explanation': str(e),
+        'citations': []
+    })
+
+def synthesizer_node(state: AgentState, components: Components):
+    """Combines everything into the final answer with proper type conversion."""
+    print("--- SYNTHESIZER: Formatting Answer ---")
+    inputs, citations, format_hint = _synthesizer_inputs(state, components)
+
+    fast = _fast_synthesis(state, format_hint, citations)
+    if fast:
+        return fast
+
     # Call DSPy synthesizer
     try:
-        pred = synthesizer(
-            question=state['question'],
-            context=doc_context,
-            sql_query=sql_ctx,
-            sql_result=res_ctx,
-            format_hint=format_hint
-        )
+        pred = components.synthesizer(**inputs)
     except Exception as e:
-        print(f"   Warning: Synthesizer error: {e}")
-        pred = type('obj', (object,), {
-            'final_answer': 'Error',
-            'explanation': str(e),
-            'citations': []
-        })
+        pred = _synthesizer_error(e)
     
+    return _finalize_answer(state, pred, format_hint, citations)
+
+async def asynthesizer_node(state: AgentState, components: Components):
+    """Async variant of synthesizer_node."""
+    print("--- SYNTHESIZER: Formatting Answer ---")
+    inputs, citations, format_hint = _synthesizer_inputs(state, components)
+
+    fast = _fast_synthesis(state, format_hint, citations)
+    if fast:
+        return fast
+
+    try:
+        pred = await components.synthesizer.acall(**inputs)
+    except Exception as e:
+        pred = _synthesizer_error(e)
+    
+    return _finalize_answer(state, pred, format_hint, citations)
+
+def _finalize_answer(state: AgentState, pred, format_hint: str, citations: List[str]):
+    """Parses the synthesizer output and assembles answer, explanation and citations."""
     # CRITICAL: Parse the LLM output into correct format
     parsed_answer = parse_final_answer(
         raw_answer=pred.final_answer,
@@ -202,20 +824,7 @@ def synthesizer_node(state: AgentState):
     print(f"   Parsed answer: {parsed_answer} (type: {type(parsed_answer).__name__})")
     
     # Auto-detect SQL table citations
-    if state.get('sql_query'):
-        sql_lower = state['sql_query'].lower()
-        
-        # Map to exact names from assignment
-        if 'from orders' in sql_lower or 'join orders' in sql_lower:
-            citations.append('Orders')
-        if 'order_items' in sql_lower or '"order details"' in sql_lower:
-            citations.append('Order Details')
-        if 'from products' in sql_lower or 'join products' in sql_lower:
-            citations.append('Products')
-        if 'from customers' in sql_lower or 'join customers' in sql_lower:
-            citations.append('Customers')
-        if 'categories' in sql_lower:
-            citations.append('Categories')
+    citations.extend(_sql_table_citations(state.get('sql_query')))
     
     # Add LLM-provided citations (clean them up)
     try:
@@ -245,13 +854,7 @@ def synthesizer_node(state: AgentState):
     except:
         pass
     
-    # Deduplicate while preserving order
-    seen = set()
-    unique_citations = []
-    for c in citations:
-        if c not in seen:
-            seen.add(c)
-            unique_citations.append(c)
+    unique_citations = _dedupe(citations)
     
     # Truncate explanation to ~2 sentences
     explanation = pred.explanation if hasattr(pred, 'explanation') else ""
@@ -273,10 +876,16 @@ def should_repair(state: AgentState):
     error = state.get('sql_error')
     retries = state.get('retry_count', 0)
     
-    if error and retries < 2:
+    if error and retries < 2 and guard_kind(error) != GUARD_CANCELLED:
         return "retry"
     return "synthesize"
 
+def validation_edge(state: AgentState):
+    """Conditional Edge: Run valid SQL; send invalid SQL straight back to generation."""
+    if state.get('sql_error'):
+        return should_repair(state)
+    return "execute"
+
 def router_edge(state: AgentState):
     """Conditional Edge: Route based on classification."""
     return state['router_decision']
@@ -287,50 +896,147 @@ def post_retrieval_edge(state: AgentState):
         return "planner"
     return "synthesizer"
 
-workflow = StateGraph(AgentState)
-
-# Add Nodes
-workflow.add_node("router", router_node)
-workflow.add_node("retriever", retriever_node)
-workflow.add_node("planner", planner_node)
-workflow.add_node("sql_gen", sql_generation_node)
-workflow.add_node("executor", sql_executor_node)
-workflow.add_node("synthesizer", synthesizer_node)
-
-# Add Edges
-workflow.set_entry_point("router")
-
-workflow.add_conditional_edges(
-    "router",
-    router_edge,
-    {
-        "rag": "retriever",
-        "sql": "planner",
-        "hybrid": "retriever" 
-    }
-)
-
-workflow.add_conditional_edges(
-    "retriever",
-    post_retrieval_edge,
-    {
-        "planner": "planner",
-        "synthesizer": "synthesizer"
-    }
-)
+def build_workflow(nodes: dict, speculative: bool = False) -> StateGraph:
+    """
+    Wires the agent graph. `nodes` maps node names to callables so the same
+    topology can be compiled with the sync or the async node implementations.
+    `speculative` replaces sql_gen -> validator -> executor with the single
+    sql_candidates node (retried the same way).
+    """
+    workflow = StateGraph(AgentState)
 
-workflow.add_edge("planner", "sql_gen")
-workflow.add_edge("sql_gen", "executor")
+    # Add Nodes
+    workflow.add_node("router", nodes["router"])
+    workflow.add_node("retriever", nodes["retriever"])
+    workflow.add_node("planner", nodes["planner"])
+    if speculative:
+        workflow.add_node("sql_candidates", nodes["sql_candidates"])
+    else:
+        workflow.add_node("sql_gen", nodes["sql_gen"])
+        workflow.add_node("validator", nodes["validator"])
+        workflow.add_node("executor", nodes["executor"])
+    workflow.add_node("synthesizer", nodes["synthesizer"])
+
+    # Add Edges
+    workflow.set_entry_point("router")
+
+    workflow.add_conditional_edges(
+        "router",
+        router_edge,
+        {
+            "rag": "retriever",
+            "sql": "planner",
+            "hybrid": "retriever" 
+        }
+    )
+
+    workflow.add_conditional_edges(
+        "retriever",
+        post_retrieval_edge,
+        {
+            "planner": "planner",
+            "synthesizer": "synthesizer"
+        }
+    )
 
-workflow.add_conditional_edges(
-    "executor",
-    should_repair,
-    {
-        "retry": "sql_gen",
-        "synthesize": "synthesizer"
+    if speculative:
+        workflow.add_edge("planner", "sql_candidates")
+        workflow.add_conditional_edges(
+            "sql_candidates",
+            should_repair,
+            {
+                "retry": "sql_candidates",
+                "synthesize": "synthesizer"
+            }
+        )
+    else:
+        workflow.add_edge("planner", "sql_gen")
+        workflow.add_edge("sql_gen", "validator")
+
+        workflow.add_conditional_edges(
+            "validator",
+            validation_edge,
+            {
+                "execute": "executor",
+                "retry": "sql_gen",
+                "synthesize": "synthesizer"
+            }
+        )
+
+        workflow.add_conditional_edges(
+            "executor",
+            should_repair,
+            {
+                "retry": "sql_gen",
+                "synthesize": "synthesizer"
+            }
+        )
+
+    workflow.add_edge("synthesizer", END)
+
+    return workflow
+
+SYNC_NODES = {
+    "router": router_node,
+    "retriever": retriever_node,
+    "planner": planner_node,
+    "sql_gen": sql_generation_node,
+    "validator": sql_validator_node,
+    "executor": sql_executor_node,
+    "sql_candidates": sql_candidates_node,
+    "synthesizer": synthesizer_node,
+}
+
+ASYNC_NODES = {
+    "router": arouter_node,
+    "retriever": aretriever_node,
+    "planner": planner_node,
+    "sql_gen": asql_generation_node,
+    "validator": asql_validator_node,
+    "executor": asql_executor_node,
+    "sql_candidates": asql_candidates_node,
+    "synthesizer": asynthesizer_node,
+}
+
+def bind_nodes(nodes: dict, components: Components, metrics_sink: Optional["metrics.Metrics"] = None) -> dict:
+    """Binds the nodes that use tools/modules to `components`, timing each one into `metrics_sink` if given."""
+    bound = {
+        name: node if node is planner_node else functools.partial(node, components=components)
+        for name, node in nodes.items()
     }
-)
+    if metrics_sink is not None:
+        bound = {name: metrics_sink.instrument(name, node) for name, node in bound.items()}
+    return bound
 
-workflow.add_edge("synthesizer", END)
+def build_app(config: Optional[AgentConfig] = None, use_async: bool = False,
+              metrics_sink: Optional["metrics.Metrics"] = None):
+    """
+    Compiles the agent graph for `config`. Components are shared per config
+    and only loaded when a node first runs. `use_async=True` compiles the
+    async nodes (drive it with `ainvoke`). With `metrics_sink`, every node
+    run is recorded as a span (latency, LM tokens, retries, SQL rows).
+    `sql_candidates` > 1 in the config compiles the speculative SQL step.
+    """
+    components = get_components(config)
+    config = components.config
+    speculative = config["sql_candidates"] > 1
+    if speculative and (config["candidate_selection"] not in SELECTIONS
+                        or config["candidate_sampling"] not in SAMPLINGS):
+        raise ValueError(f"candidate_selection must be one of {SELECTIONS} and candidate_sampling one of "
+                         f"{SAMPLINGS}, got '{config['candidate_selection']}' / '{config['candidate_sampling']}'")
+    nodes = bind_nodes(ASYNC_NODES if use_async else SYNC_NODES, components, metrics_sink)
+    return build_workflow(nodes, speculative).compile()
 
-app = workflow.compile()
\ No newline at end of file
+def __getattr__(name: str):
+    # Backwards compatible module attributes, created on first access:
+    # `app` keeps the original blocking API; `async_app` is driven with `ainvoke`
+    if name == "app":
+        value = build_app()
+    elif name == "async_app":
+        value = build_app(use_async=True)
+    elif name in ("lm", "lm_cache") + Components.TOOLS + Components.MODULES:
+        return getattr(get_components(), name)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+import dspy
+import litellm
+
+from agent import metrics
+from agent.cache import DiskLRUCache
+
+class LMCache:
+    """
+    Persistent cache of LM responses, shared by all CachedLM instances.
+
+    Each CachedLM has a namespace (the signature it serves, e.g. "Router");
+    `policies` can switch caching off or set a TTL per namespace:
+
+        LMCache(policies={"HybridSynthesizer": {"enabled": False},
+                          "Router": {"ttl": 3600}})
+    """
+
+    def __init__(self, path: str = ".cache/lm_responses.sqlite", max_bytes: int = 256 * 1024 * 1024,
+                 ttl: Optional[float] = None, policies: Optional[Dict[str, Dict[str, Any]]] = None,
+                 enabled: bool = True):
+        self.store = DiskLRUCache(path, max_bytes=max_bytes)
+        self.ttl = ttl
+        self.policies = policies or {}
+        self.enabled = enabled
+
+        self._lock = threading.Lock()
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+
+    def __deepcopy__(self, memo):
+        # Shared resource: dspy deep-copies LMs (LM.copy) and modules, the copies keep this cache
+        return self
+
+    def _policy(self, namespace: str) -> Dict[str, Any]:
+        policy = self.policies.get(namespace, {})
+        return {
+            "enabled": self.enabled and policy.get("enabled", True),
+            "ttl": policy.get("ttl", self.ttl),
+        }
+
+    def is_enabled(self, namespace: str) -> bool:
+        return self._policy(namespace)["enabled"]
+
+    def get(self, namespace: str, key: str) -> Optional[Dict[str, Any]]:
+        value = self.store.get(key)
+        with self._lock:
+            counter = self.misses if value is None else self.hits
+            counter[namespace] = counter.get(namespace, 0) + 1
+        return value
+
+    def set(self, namespace: str, key: str, value: Dict[str, Any]):
+        self.store.set(key, value, ttl=self._policy(namespace)["ttl"])
+
+    def stats(self) -> Dict[str, Any]:
+        namespaces = sorted(set(self.hits) | set(self.misses))
+        return {
+            "per_signature": {
+                ns: {"hits": self.hits.get(ns, 0), "misses": self.misses.get(ns, 0)} for ns in namespaces
+            },
+            **self.store.stats(),
+        }
+
+class CachedLM(dspy.LM):
+    """
+    dspy.LM that answers from an LMCache before calling the provider.
+
+    The key covers the model name, the namespace (signature) and the full
+    rendered request: the messages DSPy builds already contain the signature
+    instructions, the demos and the inputs, plus the sampling kwargs.
+    DSPy's own request cache is turned off so there is a single cache layer.
+
+    Cache misses go to the provider through litellm. With a `transport` set
+    (see agent.lm_replay: record / replay fixtures) the cache is bypassed and
+    every call goes through the transport.
+    """
+
+    def __init__(self, model: str, lm_cache: Optional[LMCache], namespace: str = "default",
+                 transport: Any = None, **kwargs):
+        kwargs["cache"] = False
+        super().__init__(model, **kwargs)
+        self.lm_cache = lm_cache
+        self.namespace = namespace
+        self.transport = transport
+
+    def for_signature(self, namespace: str) -> "CachedLM":
+        """Copy of this LM reporting to another namespace (same model settings)."""
+        lm = self.copy()
+        lm.namespace = namespace
+        return lm
+
+    def request(self, prompt, messages, kwargs) -> Dict[str, Any]:
+        """The parts of a call that determine its response (credentials and endpoints left out)."""
+        return {
+            "model": self.model,
+            "namespace": self.namespace,
+            "messages": messages or [{"role": "user", "content": prompt}],
+            "kwargs": {k: v for k, v in {**self.kwargs, **kwargs}.items() if not k.startswith("api_")},
+        }
+
+    def _cache_key(self, prompt, messages, kwargs) -> Optional[str]:
+        # A transport (record / replay) sees every call and keeps its responses out of the cache
+        if self.transport is not None or self.lm_cache is None or not self.lm_cache.is_enabled(self.namespace):
+            return None
+        raw = json.dumps(self.request(prompt, messages, kwargs), sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _cached(self, key: Optional[str]):
+        if key is None:
+            return None
+        data = self.lm_cache.get(self.namespace, key)
+        if data is None:
+            return None
+        response = litellm.ModelResponse(**data)
+        response.cache_hit = True
+        return response
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        key = self._cache_key(prompt, messages, kwargs)
+        response = self._cached(key)
+        if response is None:
+            if self.transport is None:
+                response = super().forward(prompt=prompt, messages=messages, **kwargs)
+            else:
+                response = self.transport.forward(
+                    self, prompt, messages, kwargs,
+                    lambda: super(CachedLM, self).forward(prompt=prompt, messages=messages, **kwargs))
+            if key is not None:
+                self.lm_cache.set(self.namespace, key, response.model_dump())
+        metrics.record_lm_call(response, cache_hit=getattr(response, "cache_hit", False))
+        return response
+
+    async def aforward(self, prompt=None, messages=None, **kwargs):
+        key = self._cache_key(prompt, messages, kwargs)
+        response = self._cached(key)
+        if response is None:
+            if self.transport is None:
+                response = await super().aforward(prompt=prompt, messages=messages, **kwargs)
+            else:
+                response = await self.transport.aforward(
+                    self, prompt, messages, kwargs,
+                    lambda: super(CachedLM, self).aforward(prompt=prompt, messages=messages, **kwargs))
+            if key is not None:
+                self.lm_cache.set(self.namespace, key, response.model_dump())
+        metrics.record_lm_call(response, cache_hit=getattr(response, "cache_hit", False))
+        return response
+
+def parse_policies(disabled: Iterable[str] = (), ttls: Iterable[str] = ()) -> Dict[str, Dict[str, Any]]:
+    """
+    Builds LMCache policies from CLI-style values: signature names to disable
+    and "Signature=SECONDS" TTL overrides.
+    """
+    policies: Dict[str, Dict[str, Any]] = {}
+    for name in disabled:
+        policies.setdefault(name, {})["enabled"] = False
+    for item in ttls:
+        name, _, seconds = item.partition("=")
+        if not seconds:
+            raise ValueError(f"Expected Signature=SECONDS, got '{item}'")
+        policies.setdefault(name, {})["ttl"] = float(seconds)
+    return policies
@@ -0,0 +1,166 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import litellm
+
+ON_MISS = ("error", "live")
+
+class ReplayMiss(LookupError):
+    """No recorded response for a request in replay mode."""
+
+def fixture_key(request: Dict[str, Any]) -> str:
+    """
+    Key of a CachedLM.request(). The model name is left out so a fixture
+    recorded against one model tag replays under another config.
+    """
+    request = {k: v for k, v in request.items() if k != "model"}
+    raw = json.dumps(request, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def _last_message(messages) -> str:
+    return str(messages[-1].get("content", "")) if messages else ""
+
+class LMFixture:
+    """
+    Recorded LM calls, one JSON object per line:
+    {"key", "namespace", "model", "messages", "kwargs", "response", "elapsed_s"}.
+    A key recorded twice keeps its latest response.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[entry["key"]] = entry
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.entries.get(key)
+
+    def append(self, entry: Dict[str, Any]):
+        with self._lock:
+            self.entries[entry["key"]] = entry
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, default=str) + "\n")
+
+    def find_text(self, text: str) -> Optional[Dict[str, Any]]:
+        """
+        Entry whose last message is `text` or, for a flattened prompt
+        (Ollama /api/generate), the longest last message contained in it.
+        """
+        best = None
+        for entry in self.entries.values():
+            message = _last_message(entry["messages"])
+            if message == text:
+                return entry
+            if message and message in text and (best is None or len(message) > len(_last_message(best["messages"]))):
+                best = entry
+        return best
+
+class RecordingTransport:
+    """Calls the provider and appends every request / response pair to a fixture."""
+
+    def __init__(self, path: str):
+        self.fixture = LMFixture(path)
+        self.recorded = 0
+
+    def __deepcopy__(self, memo):
+        return self  # shared by the per-signature LM copies
+
+    def _record(self, lm, prompt, messages, kwargs, response, elapsed: float):
+        request = lm.request(prompt, messages, kwargs)
+        self.fixture.append({
+            "key": fixture_key(request),
+            **request,
+            "response": response.model_dump(),
+            "elapsed_s": round(elapsed, 4),
+            "recorded_at": time.time(),
+        })
+        self.recorded += 1
+
+    def forward(self, lm, prompt, messages, kwargs, call: Callable[[], Any]):
+        start = time.perf_counter()
+        response = call()
+        self._record(lm, prompt, messages, kwargs, response, time.perf_counter() - start)
+        return response
+
+    async def aforward(self, lm, prompt, messages, kwargs, call: Callable[[], Awaitable[Any]]):
+        start = time.perf_counter()
+        response = await call()
+        self._record(lm, prompt, messages, kwargs, response, time.perf_counter() - start)
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        return {"mode": "record", "path": self.fixture.path, "recorded": self.recorded}
+
+class ReplayTransport:
+    """
+    Answers from a fixture without calling the provider. Each response is
+    delayed by `latency_ms` if given, else by its recorded time scaled by
+    `latency_scale` (0 for no delay). Unknown requests raise ReplayMiss, or
+    go to the provider with `on_miss="live"`.
+    """
+
+    def __init__(self, path: str, latency_ms: Optional[float] = None, latency_scale: float = 1.0,
+                 on_miss: str = "error"):
+        if on_miss not in ON_MISS:
+            raise ValueError(f"on_miss must be one of {ON_MISS}, got '{on_miss}'")
+        self.fixture = LMFixture(path)
+        self.latency_ms = latency_ms
+        self.latency_scale = latency_scale
+        self.on_miss = on_miss
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def _lookup(self, lm, prompt, messages, kwargs) -> Optional[Dict[str, Any]]:
+        entry = self.fixture.get(fixture_key(lm.request(prompt, messages, kwargs)))
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if entry is None and self.on_miss == "error":
+            raise ReplayMiss(f"No recorded response for {lm.namespace} in {self.fixture.path} "
+                             f"(last message: {_last_message(messages or [{'content': prompt}])[:80]!r})")
+        return entry
+
+    def _delay(self, entry: Dict[str, Any]) -> float:
+        if self.latency_ms is not None:
+            return self.latency_ms / 1000
+        return entry.get("elapsed_s", 0.0) * self.latency_scale
+
+    def forward(self, lm, prompt, messages, kwargs, call: Callable[[], Any]):
+        entry = self._lookup(lm, prompt, messages, kwargs)
+        if entry is None:
+            return call()
+        time.sleep(self._delay(entry))
+        return litellm.ModelResponse(**entry["response"])
+
+    async def aforward(self, lm, prompt, messages, kwargs, call: Callable[[], Awaitable[Any]]):
+        entry = self._lookup(lm, prompt, messages, kwargs)
+        if entry is None:
+            return await call()
+        await asyncio.sleep(self._delay(entry))
+        return litellm.ModelResponse(**entry["response"])
+
+    def stats(self) -> Dict[str, Any]:
+        return {"mode": "replay", "path": self.fixture.path, "entries": len(self.fixture),
+                "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,259 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+# The span of the node running in this task / thread (asyncio.to_thread copies it)
+_current_span: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("span", default=None)
+_current_question: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("question", default=None)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+def count(name: str, value: float = 1):
+    """Adds to a counter of the current node span; a no-op outside of one."""
+    span = _current_span.get()
+    if span is not None:
+        span["counters"][name] = span["counters"].get(name, 0) + value
+
+def record_lm_call(response: Any, cache_hit: bool):
+    """Token usage of one LM response, attributed to the current node span."""
+    span = _current_span.get()
+    if span is None:
+        return
+    usage = getattr(response, "usage", None) or {}
+    if not isinstance(usage, dict):
+        usage = usage.model_dump() if hasattr(usage, "model_dump") else dict(usage)
+    span["lm_calls"] += 1
+    if cache_hit:
+        span["lm_cache_hits"] += 1
+    else:
+        # Cached responses carry the original usage, but those tokens were not spent again
+        span["prompt_tokens"] += usage.get("prompt_tokens") or 0
+        span["completion_tokens"] += usage.get("completion_tokens") or 0
+
+def quantile(values: List[float], q: float) -> float:
+    """Nearest-rank quantile of an unsorted list."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(1, int(-(-q * len(ordered) // 1)))  # ceil(q * n)
+    return ordered[min(rank, len(ordered)) - 1]
+
+# Span totals summed per node, and per question by by_question()
+_TOTALS = ("lm_calls", "lm_cache_hits", "prompt_tokens", "completion_tokens", "sql_rows")
+
+class Metrics:
+    """
+    Collects one event per node run (wall time, LM calls / tokens / cache
+    hits, retry count, SQL rows, counters such as fast routes) and one per
+    question. Events are appended to `events_path` as JSONL; `summary()` and
+    `write_prometheus()` aggregate what this process recorded.
+
+    Events are folded into per-node totals as they arrive, so memory does not
+    grow with the batch: latency quantiles come from a uniform sample of at
+    most `max_samples` runs per node (exact below that), and per-question
+    totals are only kept with `per_question`.
+    """
+
+    def __init__(self, events_path: Optional[str] = None, run_id: Optional[str] = None,
+                 per_question: bool = False, max_samples: int = 10_000):
+        self.events_path = events_path
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._nodes: Dict[str, Dict[str, Any]] = {}
+        self._questions: Optional[Dict[str, Dict[str, Any]]] = {} if per_question else None
+        self._random = random.Random(0)
+        if events_path and os.path.dirname(events_path):
+            os.makedirs(os.path.dirname(events_path), exist_ok=True)
+
+    def emit(self, event: Dict[str, Any]):
+        event = {"ts": round(time.time(), 3), "run_id": self.run_id, **event}
+        with self._lock:
+            self._add(event)
+            if self.events_path:
+                with open(self.events_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(event, default=str) + "\n")
+
+    def _add(self, event: Dict[str, Any]):
+        node = self._nodes.get(event["node"])
+        if node is None:
+            node = self._nodes[event["node"]] = {"count": 0, "sum_ms": 0.0, "samples": [], "errors": 0,
+                                                 "counters": {}, **{key: 0 for key in _TOTALS}}
+        node["count"] += 1
+        node["sum_ms"] += event["wall_ms"]
+        # Reservoir sampling: every run so far is in the sample with the same probability
+        samples = node["samples"]
+        if len(samples) < self.max_samples:
+            samples.append(event["wall_ms"])
+        else:
+            slot = self._random.randrange(node["count"])
+            if slot < self.max_samples:
+                samples[slot] = event["wall_ms"]
+        if event["node"] != "question":
+            for key in _TOTALS:
+                node[key] += event.get(key, 0)
+            node["errors"] += bool(event.get("error") or event.get("sql_error"))
+            for key, value in event["counters"].items():
+                node["counters"][key] = node["counters"].get(key, 0) + value
+
+        if self._questions is None or event.get("question_id") is None:
+            return
+        entry = self._questions.setdefault(event["question_id"], {
+            "wall_ms": 0.0, "lm_calls": 0, "lm_cache_hits": 0, "prompt_tokens": 0, "completion_tokens": 0,
+        })
+        if event["node"] == "question":
+            entry["wall_ms"] = event["wall_ms"]
+        else:
+            for key in ("lm_calls", "lm_cache_hits", "prompt_tokens", "completion_tokens"):
+                entry[key] += event.get(key, 0)
+
+    @contextmanager
+    def question(self, question_id: Any):
+        """Tags the node events inside with the question id and emits its total latency."""
+        token = _current_question.set(str(question_id))
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            _current_question.reset(token)
+            self.emit({"event": "question", "node": "question", "question_id": str(question_id),
+                       "wall_ms": round((time.perf_counter() - start) * 1000, 3)})
+
+    # --- Node spans ---
+
+    def _start(self, name: str):
+        span = {"node": name, "lm_calls": 0, "lm_cache_hits": 0, "prompt_tokens": 0,
+                "completion_tokens": 0, "counters": {}}
+        return span, _current_span.set(span), time.perf_counter()
+
+    def _finish(self, span, token, start, state: Dict[str, Any], update: Any, error: Optional[Exception]):
+        _current_span.reset(token)
+        span["wall_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        span["question_id"] = _current_question.get()
+        update = update if isinstance(update, dict) else {}
+        span["retry_count"] = update.get("retry_count", state.get("retry_count", 0))
+        if isinstance(update.get("sql_result"), list):
+            span["sql_rows"] = len(update["sql_result"])
+        if update.get("sql_error"):
+            span["sql_error"] = str(update["sql_error"])[:200]
+        if error is not None:
+            span["error"] = repr(error)[:200]
+        self.emit({"event": "node", **span})
+
+    def instrument(self, name: str, node: Callable) -> Callable:
+        """Wraps a (sync or async) graph node in a timing span."""
+        if inspect.iscoroutinefunction(node):
+            async def wrapper(state):
+                span, token, start = self._start(name)
+                update, error = None, None
+                try:
+                    update = await node(state)
+                    return update
+                except Exception as e:
+                    error = e
+                    raise
+                finally:
+                    self._finish(span, token, start, state, update, error)
+        else:
+            def wrapper(state):
+                span, token, start = self._start(name)
+                update, error = None, None
+                try:
+                    update = node(state)
+                    return update
+                except Exception as e:
+                    error = e
+                    raise
+                finally:
+                    self._finish(span, token, start, state, update, error)
+        functools.update_wrapper(wrapper, getattr(node, "func", node))
+        return wrapper
+
+    # --- Aggregates ---
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Per node (and 'question'): runs, latency quantiles in ms, LM calls/tokens, counters."""
+        summary = {}
+        with self._lock:
+            for name, node in self._nodes.items():
+                entry = {
+                    "count": node["count"],
+                    "sum_ms": round(node["sum_ms"], 3),
+                    **{f"p{int(q * 100)}_ms": round(quantile(node["samples"], q), 3) for q in QUANTILES},
+                }
+                if name != "question":
+                    entry.update({key: node[key] for key in _TOTALS})
+                    entry["errors"] = node["errors"]
+                    entry["counters"] = dict(node["counters"])
+                summary[name] = entry
+        return summary
+
+    def by_question(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Per question id: total wall time plus the LM calls / cache hits /
+        tokens of its nodes (needs per_question=True).
+        """
+        if self._questions is None:
+            raise ValueError("Metrics was created without per_question")
+        with self._lock:
+            return {qid: dict(entry) for qid, entry in self._questions.items()}
+
+    def write_prometheus(self, path: str):
+        """Prometheus text-format snapshot of summary() (node latency summaries + counters)."""
+        summary = self.summary()
+        lines = [
+            "# HELP agent_node_latency_seconds Wall time per graph node run (question = whole question).",
+            "# TYPE agent_node_latency_seconds summary",
+        ]
+        for node, s in summary.items():
+            for q in QUANTILES:
+                lines.append(f'agent_node_latency_seconds{{node="{node}",quantile="{q}"}} '
+                             f'{s[f"p{int(q * 100)}_ms"] / 1000:.6f}')
+            lines.append(f'agent_node_latency_seconds_sum{{node="{node}"}} {s["sum_ms"] / 1000:.6f}')
+            lines.append(f'agent_node_latency_seconds_count{{node="{node}"}} {s["count"]}')
+
+        counters = [
+            ("agent_lm_calls_total", "LM calls (including cache hits).", "lm_calls"),
+            ("agent_lm_cache_hits_total", "LM calls answered from the LM cache.", "lm_cache_hits"),
+            ("agent_lm_prompt_tokens_total", "Prompt tokens sent to the LM.", "prompt_tokens"),
+            ("agent_lm_completion_tokens_total", "Completion tokens generated by the LM.", "completion_tokens"),
+            ("agent_sql_rows_total", "Rows returned to the graph by SQL queries.", "sql_rows"),
+            ("agent_node_errors_total", "Node runs that raised or produced an SQL error.", "errors"),
+        ]
+        for metric, help_text, key in counters:
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            for node, s in summary.items():
+                if node != "question":
+                    lines.append(f'{metric}{{node="{node}"}} {s[key]}')
+
+        lines += ["# HELP agent_node_events_total Node-specific counters (fast routes, cache hits, ...).",
+                  "# TYPE agent_node_events_total counter"]
+        for node, s in summary.items():
+            for key, value in sorted(s.get("counters", {}).items()):
+                lines.append(f'agent_node_events_total{{node="{node}",event="{key}"}} {value}')
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, path)
+
+    def format_table(self) -> str:
+        """p50/p95/p99 per node as a printable table."""
+        rows = [f"{'node':<12} {'runs':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'LM calls':>9} "
+                f"{'cached':>7} {'tokens':>9}"]
+        for node, s in sorted(self.summary().items(), key=lambda kv: kv[0] == "question"):
+            tokens = s.get("prompt_tokens", 0) + s.get("completion_tokens", 0)
+            rows.append(f"{node:<12} {s['count']:>6} {s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} {s['p99_ms']:>9.1f} "
+                        f"{s.get('lm_calls', '-'):>9} {s.get('lm_cache_hits', '-'):>7} "
+                        f"{tokens if node != 'question' else '-':>9}")
+        return "\n".join(rows)
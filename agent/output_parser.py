@@ -1,6 +1,214 @@
 import json
 import re
-from typing import Any
+from functools import lru_cache
+from itertools import repeat
+from operator import itemgetter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Field and item types a hint can name; anything else is read as str
+_TYPES = ("int", "float", "str")
+_INT = re.compile(r'\d+')
+_FLOAT = re.compile(r'\d+\.?\d*')
+_JSON_LIST = re.compile(r'\[.*\]', re.DOTALL)
+_JSON_DICT = re.compile(r'\{[^}]+\}')
+_DICT_HINT = re.compile(r'\{[^}]*\}')
+# Column plans kept per schema (one per distinct result header)
+_MAX_PLANS = 64
+
+
+def _to_int(value: Any) -> int:
+    try:
+        return int(round(float(value)))
+    except (TypeError, ValueError, OverflowError):
+        return 0
+
+
+def _truncate_int(value: Any) -> int:
+    """int() of a scalar SQL value (floats truncate, as the SQL fallback always did)."""
+    try:
+        return int(value)
+    except (TypeError, ValueError, OverflowError):
+        try:
+            return int(float(value))
+        except (TypeError, ValueError, OverflowError):
+            return 0
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return round(float(value), 2)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _to_str(value: Any) -> str:
+    return "" if value is None else str(value)
+
+
+# Column-at-a-time converters: one C-level map over the column, redone cell
+# by cell (None and anything unconvertible -> 0, 0.0 or "") only if it fails
+def _int_column(values: List[Any]) -> List[int]:
+    try:
+        return list(map(round, map(float, values)))
+    except (TypeError, ValueError, OverflowError):
+        return list(map(_to_int, values))
+
+
+def _float_column(values: List[Any]) -> List[float]:
+    try:
+        return list(map(round, map(float, values), repeat(2)))
+    except (TypeError, ValueError):
+        return list(map(_to_float, values))
+
+
+def _str_column(values: List[Any]) -> List[str]:
+    return list(map(_to_str if None in values else str, values))
+
+
+_COLUMN_CONVERTERS = {"int": _int_column, "float": _float_column, "str": _str_column}
+
+
+class FormatSchema:
+    """
+    A format hint parsed once (see compile_format_hint).
+
+    `kind` is "int", "float", "dict", "list" or "text" (the answer is kept
+    as the LLM wrote it). `fields` holds the (name, type) pairs of a dict
+    hint or of a list of dicts, `item` the type of a list of scalars.
+    Rows are coerced through a column plan (which column feeds which field,
+    and its converter) built once per result header, a column at a time.
+    """
+
+    def __init__(self, hint: str, kind: str, fields: Tuple[Tuple[str, str], ...] = (),
+                 item: Optional[str] = None):
+        self.hint = hint
+        self.kind = kind
+        self.fields = fields
+        self.item = item
+        self._names = tuple(name for name, _ in fields)
+        self._plans: Dict[Tuple, Tuple[Tuple[Optional[str], Callable[[List[Any]], List[Any]]], ...]] = {}
+
+    def __repr__(self) -> str:
+        return f"FormatSchema({self.hint!r}, kind={self.kind!r}, fields={self.fields!r}, item={self.item!r})"
+
+    def _plan(self, row: Dict[str, Any]):
+        header = (tuple(row), tuple(map(type, row.values())))
+        plan = self._plans.get(header)
+        if plan is None:
+            columns = _match_columns(self.fields, row)
+            plan = tuple((column, _COLUMN_CONVERTERS.get(type_name, _str_column))
+                         for (_, type_name), column in zip(self.fields, columns))
+            if len(self._plans) >= _MAX_PLANS:
+                self._plans.clear()
+            self._plans[header] = plan
+        return plan
+
+    def records(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Rows as dicts of the hinted fields (the column plan comes from the first row)."""
+        if not rows or not self.fields:
+            return [{} for _ in rows]
+        columns = [
+            convert(list(map(itemgetter(column), rows))) if column is not None else convert([None]) * len(rows)
+            for column, convert in self._plan(rows[0])
+        ]
+        names = self._names
+        return [dict(zip(names, row)) for row in zip(*columns)]
+
+    def parse_text(self, answer: str) -> Any:
+        """The answer read from the LLM's text, None when it holds no value of this kind."""
+        if self.kind == "int":
+            match = _INT.search(answer)
+            return int(match.group()) if match else None
+        if self.kind == "float":
+            match = _FLOAT.search(answer)
+            return round(float(match.group()), 2) if match else None
+        if self.kind in ("list", "dict"):
+            pattern, expected = (_JSON_LIST, list) if self.kind == "list" else (_JSON_DICT, dict)
+            match = pattern.search(answer.replace("'", '"'))
+            if match:
+                try:
+                    parsed = json.loads(match.group())
+                except ValueError:
+                    return None
+                if isinstance(parsed, expected) and (parsed or expected is list):
+                    return parsed
+        return None
+
+    def from_sql(self, sql_result: Any) -> Any:
+        """The answer built from the SQL rows (the empty value of the kind when there are none)."""
+        rows = sql_result if isinstance(sql_result, list) and sql_result and isinstance(sql_result[0], dict) else []
+        if self.kind in ("int", "float"):
+            convert = _truncate_int if self.kind == "int" else _to_float
+            return convert(next(iter(rows[0].values()), None) if rows else None)
+        if self.kind == "dict":
+            return self.records(rows[:1])[0] if rows else {}
+        if self.kind == "list":
+            if self.fields:
+                return self.records(rows)
+            if not rows or not rows[0]:
+                return []
+            return _COLUMN_CONVERTERS[self.item or "str"](list(map(itemgetter(next(iter(rows[0]))), rows)))
+        return None
+
+
+def _names_match(key: str, column: str) -> bool:
+    """Field and column names agree once normalized: OrderID ~ order_id, TotalRevenue ~ revenue."""
+    column = norm_name(column)
+    return bool(key and column) and (key in column or column in key)
+
+
+def _match_columns(fields: Tuple[Tuple[str, str], ...], row: Dict[str, Any]) -> List[Optional[str]]:
+    """
+    The column feeding each field: a column whose name matches the field
+    (an exact match first) and whose value fits its type, else the first
+    unused column of the right type, else None (the field gets its default).
+    """
+    def fits(value: Any, type_name: str) -> bool:
+        return value is None or _fits(value, type_name)  # a NULL in the first row fits any field
+
+    columns: List[Optional[str]] = [None] * len(fields)
+    used = set()
+    for i, (name, type_name) in enumerate(fields):
+        key = norm_name(name)
+        matches = [c for c in row if c not in used and _names_match(key, c) and fits(row[c], type_name)]
+        if matches:
+            exact = [c for c in matches if norm_name(c) == key]
+            columns[i] = (exact or matches)[0]
+            used.add(columns[i])
+    for i, (_, type_name) in enumerate(fields):
+        if columns[i] is None:
+            rest = [c for c in row if c not in used and fits(row[c], type_name)]
+            if rest:
+                columns[i] = rest[0]
+                used.add(rest[0])
+    return columns
+
+
+@lru_cache(maxsize=256)
+def compile_format_hint(format_hint: str) -> FormatSchema:
+    """
+    Parses a format hint into a FormatSchema, once per distinct hint:
+    "int", "float", "{customer:str, margin:float}", "list[str]", "list" (of
+    str) or "list[{product:str, revenue:float}]". Any other hint is "text".
+    """
+    hint = format_hint.strip()
+    if hint in ("int", "float"):
+        return FormatSchema(hint, hint)
+    if hint.startswith("list"):
+        inner = hint[len("list"):].strip()
+        inner = inner[1:-1].strip() if inner.startswith("[") and inner.endswith("]") else ""
+        if inner.startswith("{"):
+            return FormatSchema(hint, "list", fields=_schema_fields(inner))
+        return FormatSchema(hint, "list", item=inner.lower() if inner.lower() in _TYPES else "str")
+    match = _DICT_HINT.search(hint)
+    if match:
+        return FormatSchema(hint, "dict", fields=_schema_fields(match.group()))
+    return FormatSchema(hint, "text")
+
+
+def _schema_fields(dict_hint: str) -> Tuple[Tuple[str, str], ...]:
+    return tuple((name, type_name.lower()) for name, type_name in _dict_fields(dict_hint) if name)
+
 
 def parse_final_answer(raw_answer: str, format_hint: str, sql_result: Any) -> Any:
     """
@@ -15,217 +223,15 @@ def parse_final_answer(raw_answer: str, format_hint: str, sql_result: Any) -> An
     Returns:
         Properly typed answer matching format_hint
     """
-    
-    # Clean the answer
+    schema = compile_format_hint(format_hint)
     answer = str(raw_answer).strip()
-    
-    # Handle "int" format
-    if format_hint == "int":
-        # Try parsing from answer text
-        match = re.search(r'\d+', answer)
-        if match:
-            return int(match.group())
-        
-        # Fallback: check SQL result
-        if isinstance(sql_result, list) and len(sql_result) > 0:
-            first_val = list(sql_result[0].values())[0]
-            if first_val is not None:
-                return int(first_val)
-        return 0
-    
-    # Handle "float" format
-    if format_hint == "float":
-        # Try parsing from answer text
-        match = re.search(r'\d+\.?\d*', answer)
-        if match:
-            return round(float(match.group()), 2)
-        
-        # Fallback: SQL result
-        if isinstance(sql_result, list) and len(sql_result) > 0:
-            first_val = list(sql_result[0].values())[0]
-            if first_val is not None:
-                return round(float(first_val), 2)
-        return 0.0
-    
-    # Handle list format FIRST (before dict) to avoid confusion
-    if format_hint.startswith("list"):
-        # Try JSON parsing from answer
-        try:
-            # Clean up the string
-            list_str = answer.replace("'", '"')
-            json_match = re.search(r'\[.*\]', list_str, re.DOTALL)
-            if json_match:
-                parsed = json.loads(json_match.group())
-                if isinstance(parsed, list):
-                    return parsed
-        except:
-            pass
-        
-        # Fallback: construct from SQL result
-        if isinstance(sql_result, list) and len(sql_result) > 0:
-            result_list = []
-            
-            # Check if it's a list of strings (like categories)
-            if "list[str]" in format_hint.lower() or format_hint == "list":
-                for row in sql_result:
-                    # Get first column value
-                    val = list(row.values())[0]
-                    result_list.append(str(val))
-                return result_list
-            
-            # List of dicts with product and revenue
-            for row in sql_result:
-                if "product" in format_hint and "revenue" in format_hint:
-                    product = (row.get("ProductName") or 
-                              row.get("product") or 
-                              row.get("Product") or "")
-                    
-                    revenue = (row.get("total_revenue") or
-                              row.get("TotalRevenue") or 
-                              row.get("revenue") or 
-                              row.get("Revenue") or 0)
-                    
-                    result_list.append({
-                        "product": str(product),
-                        "revenue": round(float(revenue), 2)
-                    })
-            
-            return result_list
-        
-        return []
-    
-    # Handle dict format: {category:str, quantity:int} or {customer:str, margin:float}
-    if "{" in format_hint and "}" in format_hint:
-        # Try to parse as JSON from answer first
-        try:
-            # Remove single quotes, replace with double quotes
-            json_str = answer.replace("'", '"')
-            json_match = re.search(r'\{[^}]+\}', json_str)
-            if json_match:
-                parsed = json.loads(json_match.group())
-                if parsed and isinstance(parsed, dict):
-                    return parsed
-        except:
-            pass
-        
-        # Fallback: construct from SQL result (SINGLE ROW ONLY)
-        if isinstance(sql_result, list) and len(sql_result) > 0:
-            row = sql_result[0]
-            
-            # Pattern 1: {category:str, quantity:int}
-            if "category" in format_hint and "quantity" in format_hint:
-                category = (row.get("CategoryName") or 
-                           row.get("category") or 
-                           row.get("Category") or 
-                           row.get("TotalQuantitySold") or "")
-                
-                quantity = (row.get("TotalQuantity") or 
-                           row.get("TotalQuantitySold") or
-                           row.get("total_quantity") or 
-                           row.get("quantity") or 
-                           row.get("Quantity") or 0)
-                
-                return {
-                    "category": str(category),
-                    "quantity": int(quantity)
-                }
-            
-            # Pattern 2: {customer:str, margin:float}
-            elif "customer" in format_hint and "margin" in format_hint:
-                customer = (row.get("CompanyName") or 
-                           row.get("customer") or 
-                           row.get("Customer") or "")
-                
-                margin = (row.get("gross_margin") or 
-                         row.get("total_gross_margin") or
-                         row.get("margin") or 
-                         row.get("Margin") or 0)
-                
-                return {
-                    "customer": str(customer),
-                    "margin": round(float(margin), 2)
-                }
-            
-            # Pattern 3: {product:str, revenue:float}
-            elif "product" in format_hint and "revenue" in format_hint:
-                product = (row.get("ProductName") or 
-                          row.get("product") or 
-                          row.get("Product") or "")
-                
-                revenue = (row.get("TotalRevenue") or 
-                          row.get("total_revenue") or
-                          row.get("revenue") or 
-                          row.get("Revenue") or 0)
-                
-                return {
-                    "product": str(product),
-                    "revenue": round(float(revenue), 2)
-                }
-            
-            # Pattern 4: {order_id:int, freight:float}
-            elif "order_id" in format_hint and "freight" in format_hint:
-                order_id = (row.get("OrderID") or 
-                           row.get("order_id") or 0)
-                
-                freight = (row.get("freight") or 
-                          row.get("Freight") or 0)
-                
-                return {
-                    "order_id": int(order_id),
-                    "freight": round(float(freight), 2)
-                }
-        
-        return {}
-    
-    # Handle list format: list[{product:str, revenue:float}] or list[str]
-    if format_hint.startswith("list"):
-        # Try JSON parsing from answer
-        try:
-            # Clean up the string
-            list_str = answer.replace("'", '"')
-            json_match = re.search(r'\[.*\]', list_str, re.DOTALL)
-            if json_match:
-                parsed = json.loads(json_match.group())
-                if isinstance(parsed, list):
-                    return parsed
-        except:
-            pass
-        
-        # Fallback: construct from SQL result
-        if isinstance(sql_result, list) and len(sql_result) > 0:
-            result_list = []
-            
-            # Check if it's a list of strings (like categories)
-            if "list[str]" in format_hint.lower() or format_hint == "list":
-                for row in sql_result:
-                    # Get first column value
-                    val = list(row.values())[0]
-                    result_list.append(str(val))
-                return result_list
-            
-            # List of dicts with product and revenue
-            for row in sql_result:
-                if "product" in format_hint and "revenue" in format_hint:
-                    product = (row.get("ProductName") or 
-                              row.get("product") or 
-                              row.get("Product") or "")
-                    
-                    revenue = (row.get("TotalRevenue") or 
-                              row.get("total_revenue") or
-                              row.get("revenue") or 
-                              row.get("Revenue") or 0)
-                    
-                    result_list.append({
-                        "product": str(product),
-                        "revenue": round(float(revenue), 2)
-                    })
-            
-            return result_list
-        
-        return []
-    
-    # Default: return as-is
-    return answer
+    if schema.kind == "text":
+        return answer
+
+    parsed = schema.parse_text(answer)
+    if parsed is not None:
+        return parsed
+    return schema.from_sql(sql_result)
 
 
 def extract_format_hint_from_question(question: str) -> str:
@@ -263,4 +269,88 @@ def extract_format_hint_from_question(question: str) -> str:
     if "return list of" in question_lower or "return a list" in question_lower:
         return "list"
     
-    return "str"
\ No newline at end of file
+    return "str"
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _fits(value: Any, type_name: str) -> bool:
+    return _is_number(value) if type_name in ("int", "float") else isinstance(value, str)
+
+
+def _coerce(value: Any, type_name: str) -> Any:
+    if type_name == "int":
+        return int(round(value))
+    if type_name == "float":
+        return round(float(value), 2)
+    return str(value)
+
+
+def _dict_fields(format_hint: str) -> List[Tuple[str, str]]:
+    """'{customer:str, margin: float}' -> [('customer', 'str'), ('margin', 'float')]"""
+    body = format_hint.strip()[1:-1]
+    fields = []
+    for part in body.split(","):
+        name, _, type_name = part.partition(":")
+        fields.append((name.strip(), type_name.strip() or "str"))
+    return fields
+
+
+def norm_name(name: str) -> str:
+    """A field or column name compared loosely: 'Order ID' and 'order_id' -> 'orderid'."""
+    return re.sub(r'[^a-z0-9]', '', str(name).lower())
+
+
+def answer_from_sql_result(format_hint: str, sql_result: Any) -> Optional[Any]:
+    """
+    Builds the final answer straight from a single-row SQL result when the
+    shape leaves no doubt: one numeric cell for int/float, or exactly one
+    column per field for a dict hint (matched by name, else by position or
+    type when each field is the only one of its kind). Returns None when the
+    LLM synthesizer is still needed.
+    """
+    if not isinstance(sql_result, list) or len(sql_result) != 1 or not isinstance(sql_result[0], dict):
+        return None
+    row = sql_result[0]
+    values = list(row.values())
+
+    schema = compile_format_hint(format_hint)
+    if schema.kind in ("int", "float"):
+        if len(values) != 1 or not _is_number(values[0]):
+            return None
+        return _coerce(values[0], schema.kind)
+
+    if schema.kind != "dict":
+        return None
+
+    fields = schema.fields
+    if len(fields) != len(values) or any(t not in _TYPES for _, t in fields):
+        return None
+
+    # 1) Column names match field names (OrderID ~ order_id, Freight ~ freight)
+    by_name = {}
+    for name, type_name in fields:
+        key = norm_name(name)
+        matches = [c for c in row if _names_match(key, c)]
+        if len(matches) == 1 and matches[0] not in by_name.values() and _fits(row[matches[0]], type_name):
+            by_name[name] = matches[0]
+    if len(by_name) == len(fields):
+        return {name: _coerce(row[by_name[name]], t) for name, t in fields}
+
+    # 2) Position / type, only when no two fields are of the same kind
+    kinds = ["str" if t == "str" else "number" for _, t in fields]
+    if len(set(kinds)) != len(kinds):
+        return None
+
+    if all(_fits(v, t) for v, (_, t) in zip(values, fields)):
+        return {name: _coerce(v, t) for v, (name, t) in zip(values, fields)}
+
+    answer = {}
+    for name, type_name in fields:
+        candidates = [v for v in values if _fits(v, type_name)]
+        if len(candidates) != 1:
+            return None
+        answer[name] = _coerce(candidates[0], type_name)
+    return answer
@@ -0,0 +1,213 @@
+import math
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple, TypedDict
+
+from agent.rag.index import tokenize
+
+# Words that say nothing about which part of a doc matters
+_STOPWORDS = {
+    "the", "and", "for", "what", "was", "were", "which", "who", "how", "many", "much", "with", "from",
+    "during", "using", "per", "this", "that", "all", "any", "return", "returns", "float", "integer",
+    "rounded", "decimals", "list", "str", "int", "defined", "definition", "according", "docs", "total",
+}
+# A SQL snippet is what the SQL generator can use most directly
+_CODE_BONUS = {"sql": 0.5, "synth": 0.0}
+# Chunks pulled in from the section of a retrieved chunk count for less than retrieved ones
+_SECTION_WEIGHT = 0.6
+# Lines under a heading that matches the question count as (this share of) matching too:
+# "## Summer Beverages" makes its "Start Date: ..." line relevant
+_HEADING_SHARE = 0.8
+# Units below this (weight x share of question words) are noise: one common word in a side chunk
+_MIN_SCORE = 0.12
+_FENCE = re.compile(r"```.*?```", re.S)
+_HEADING = re.compile(r"^(#{1,6})\s")
+
+class PackedContext(TypedDict):
+    text: str  # "[Source: id] unit ..." lines, in document order
+    sources: List[str]  # chunk ids that contributed
+    tokens: int  # estimated
+    input_tokens: int  # estimated size of the retrieved chunks as they were
+    dropped: int  # units left out (duplicate, irrelevant or over budget)
+
+def estimate_tokens(text: str) -> int:
+    """~4 characters per token, close enough for budgeting an English / SQL prompt."""
+    return math.ceil(len(text) / 4)
+
+def _content_words(text: str) -> set:
+    return {t for t in tokenize(text) if len(t) > 2 and t not in _STOPWORDS}
+
+def split_units(content: str) -> List[Tuple[str, bool]]:
+    """
+    (unit, is_code) pieces of a chunk: fenced code blocks whole (with the
+    'Label:' line before them), otherwise one unit per line, where wrapped
+    continuation lines stay with their list item.
+    """
+    units: List[Tuple[str, bool]] = []
+    position = 0
+    for match in _FENCE.finditer(content):
+        units.extend(_line_units(content[position:match.start()]))
+        code = match.group(0)
+        if units and not units[-1][1] and units[-1][0].rstrip("*").endswith(":"):
+            code = units.pop()[0] + "\n" + code
+        units.append((code, True))
+        position = match.end()
+    units.extend(_line_units(content[position:]))
+    return units
+
+def _line_units(text: str) -> List[Tuple[str, bool]]:
+    units: List[str] = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped or set(stripped) <= {"-", "*", "_"}:
+            continue
+        starts_item = stripped[0] in "-*#>|" or stripped[0].isdigit() or stripped.startswith("**")
+        if units and not starts_item:
+            units[-1] += " " + stripped
+        else:
+            units.append(stripped)
+    return [(unit, False) for unit in units]
+
+def _section(chunks: Sequence[Dict[str, Any]], index: int) -> List[int]:
+    """Indexes of the chunks in the same markdown section as chunks[index] (same source)."""
+    source = chunks[index].get("source")
+
+    def level(i: int) -> int:
+        match = _HEADING.match(chunks[i]["content"])
+        return len(match.group(1)) if match else 0
+
+    start = index
+    while start > 0 and chunks[start - 1].get("source") == source and not level(start):
+        start -= 1
+    top = level(start) or 7
+    if top == 1:
+        return [index]  # a document title: its "section" is the whole file
+    end = index + 1
+    while end < len(chunks) and chunks[end].get("source") == source and not 0 < level(end) <= top:
+        end += 1
+    return list(range(start, end))
+
+def _heading(chunks: Sequence[Dict[str, Any]], index: int) -> str:
+    """The heading line of the section chunks[index] belongs to ("" for none or a document title)."""
+    section = _section(chunks, index)
+    first = chunks[section[0]]["content"].split("\n", 1)[0]
+    match = _HEADING.match(first)
+    return first if match and len(match.group(1)) > 1 else ""
+
+class ContextPacker:
+    """
+    Turns retrieved chunks into a prompt context that fits a token budget.
+
+    Chunks are split into units (lines, list items, fenced code blocks) and
+    the rest of a retrieved chunk's markdown section is added as candidates.
+    Duplicate units are dropped. Each unit is scored by its overlap with the
+    question's content words (or its section heading's, a little less),
+    weighted by the chunk's retrieval rank (SQL code blocks get a bonus for
+    the SQL generator). The best units are kept
+    until the budget is full and emitted in document order. Results are
+    cached per (purpose, question, chunks), so retries reuse them.
+    """
+
+    def __init__(self, chunks: Sequence[Dict[str, Any]] = (), budgets: Optional[Dict[str, int]] = None,
+                 max_entries: int = 512):
+        self.chunks = list(chunks)
+        self._position = {chunk["id"]: i for i, chunk in enumerate(self.chunks)}
+        self.budgets = {"sql": 200, "synth": 350, **(budgets or {})}
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[tuple, PackedContext]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def pack(self, question: str, docs: List[Dict[str, Any]], purpose: str = "synth",
+             budget: Optional[int] = None) -> PackedContext:
+        budget = budget if budget is not None else self.budgets[purpose]
+        key = (purpose, budget, question, tuple(d["id"] for d in docs))
+        with self._lock:
+            packed = self._cache.get(key)
+            if packed is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return packed
+            self.misses += 1
+
+        packed = self._pack(question, docs, purpose, budget)
+        with self._lock:
+            self._cache[key] = packed
+            if len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return packed
+
+    def _candidates(self, docs: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], float]]:
+        """(chunk, weight) for the retrieved chunks and the rest of their sections, best weight first."""
+        top = max((d.get("score") or 0.0 for d in docs), default=0.0) or 1.0
+        weights: Dict[str, float] = {}
+        by_id: Dict[str, Dict[str, Any]] = {}
+        for doc in docs:
+            weight = 0.5 + 0.5 * (doc.get("score") or 0.0) / top
+            if weight > weights.get(doc["id"], 0.0):
+                weights[doc["id"]], by_id[doc["id"]] = weight, doc
+            if doc["id"] in self._position:
+                for i in _section(self.chunks, self._position[doc["id"]]):
+                    sibling = self.chunks[i]
+                    if weight * _SECTION_WEIGHT > weights.get(sibling["id"], 0.0):
+                        weights[sibling["id"]], by_id[sibling["id"]] = weight * _SECTION_WEIGHT, sibling
+        return [(by_id[i], w) for i, w in sorted(weights.items(), key=lambda kv: -kv[1])]
+
+    def _pack(self, question: str, docs: List[Dict[str, Any]], purpose: str, budget: int) -> PackedContext:
+        question_words = _content_words(question)
+        seen = set()
+        units = []  # (score, order key, chunk id, text)
+        dropped = 0
+        retrieved = {d["id"] for d in docs}
+        for chunk, weight in self._candidates(docs):
+            position = self._position.get(chunk["id"])
+            heading = _heading(self.chunks, position) if position is not None else ""
+            heading_shared = len(question_words & _content_words(heading))
+            for offset, (text, is_code) in enumerate(split_units(chunk["content"])):
+                normalized = " ".join(text.lower().split())
+                if normalized in seen:
+                    dropped += 1
+                    continue
+                seen.add(normalized)
+                shared = len(question_words & _content_words(text))
+                if (chunk["id"] not in retrieved and max(shared, heading_shared) < 2
+                        and not (is_code and _CODE_BONUS.get(purpose))):
+                    dropped += 1  # a section sibling has to be about the question, not just share a word
+                    continue
+                overlap = max(shared, _HEADING_SHARE * heading_shared) / max(len(question_words), 1)
+                score = weight * (overlap + (_CODE_BONUS.get(purpose, 0.0) if is_code and overlap else 0.0))
+                if score < _MIN_SCORE:
+                    dropped += 1
+                    continue
+                order = (len(self._position) if position is None else position, offset)
+                units.append((score, order, chunk["id"], text))
+
+        kept, used = [], 0
+        for unit in sorted(units, key=lambda u: (-u[0], u[1])):
+            cost = estimate_tokens(f"[Source: {unit[2]}] {unit[3]}")  # pessimistic: a source tag each
+            if used + cost > budget:
+                dropped += 1
+                continue
+            kept.append(unit)
+            used += cost
+
+        lines, sources = [], []
+        for _, _, chunk_id, text in sorted(kept, key=lambda u: u[1]):
+            if not sources or sources[-1] != chunk_id:
+                sources.append(chunk_id)
+                lines.append(f"[Source: {chunk_id}] {text}")
+            else:
+                lines.append(text)
+        text = "\n".join(lines)
+        return {
+            "text": text,
+            "sources": list(dict.fromkeys(sources)),
+            "tokens": estimate_tokens(text),
+            "input_tokens": sum(estimate_tokens(f"[Source: {d['id']}] {d['content']}") for d in docs),
+            "dropped": dropped,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._cache)}
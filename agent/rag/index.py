@@ -0,0 +1,208 @@
+import hashlib
+import json
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+# Bump when chunking or tokenization changes: older index files are rebuilt
+INDEX_VERSION = 2
+
+# Words, numbers, dates and decimals ("1997-06-01", "3.5", "don't") as one token each
+_TOKEN_RE = re.compile(r"\w+(?:[-.']\w+)*")
+
+@lru_cache(maxsize=4096)
+def _tokenize_cached(text: str) -> Tuple[str, ...]:
+    return tuple(_TOKEN_RE.findall(text.lower()))
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased regex tokenizer; repeated texts (questions, retries) hit an LRU cache."""
+    return list(_tokenize_cached(text))
+
+def chunk_document(filename: str, content: str) -> List[Dict[str, Any]]:
+    """
+    Simple chunking strategy: split by double newlines (paragraphs),
+    chunk ids are "<file>::chunk<i>".
+    """
+    chunks = []
+    for i, text in enumerate(content.split("\n\n")):
+        if text.strip():  # Skip empty chunks
+            chunks.append({
+                "id": f"{filename}::chunk{i}",
+                "content": text.strip(),
+                "source": filename
+            })
+    return chunks
+
+class BM25Index:
+    """
+    Okapi BM25 over document chunks, persisted to a JSON file.
+
+    The file keeps, per source document, its content hash and its chunks with
+    their term frequencies and lengths. `sync()` re-chunks and re-tokenizes
+    only documents whose hash changed (or that are new); everything else is
+    taken from the file.
+
+    Scoring uses a CSR term x chunk matrix holding the precomputed BM25 weight
+    of every (term, chunk) pair, so a query is a sparse row-vector product and
+    a batch of queries is a single sparse matmul. Scores are identical to
+    rank_bm25.BM25Okapi with the same parameters and tokens.
+
+    With `path=None` nothing is read or written; `index_chunks()` fills the
+    index from memory (e.g. the SQL demo store).
+    """
+
+    def __init__(self, path: Optional[str], tokenize: Callable[[str], List[str]] = tokenize,
+                 k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        self.path = path
+        self.tokenize = tokenize
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+
+        # filename -> {"hash", "size", "mtime_ns", "chunks": [{id, content, source, tf, length}]}
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.chunks: List[Dict[str, Any]] = []
+        self.reindexed: List[str] = []
+
+        self.vocab: Dict[str, int] = {}
+        self.weights = sparse.csr_matrix((0, 0), dtype=np.float64)
+
+        self._load()
+
+    def _load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return  # unreadable index, rebuilt by sync()
+        if data.get("version") == INDEX_VERSION:
+            self.files = data.get("files", {})
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_VERSION, "files": self.files}, f)
+        os.replace(tmp, self.path)  # atomic: concurrent readers never see a partial file
+
+    def sync(self, filepaths: List[str]) -> List[str]:
+        """
+        Brings the index in line with `filepaths`: new or changed files are
+        re-chunked and re-tokenized, deleted ones dropped. Returns the names
+        of the files that were (re)indexed.
+        """
+        current = {}
+        changed = []
+        for filepath in sorted(filepaths):
+            filename = os.path.basename(filepath)
+            st = os.stat(filepath)
+            entry = self.files.get(filename)
+
+            # Same size and mtime: trust the stored hash without reading the file
+            if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+                current[filename] = entry
+                continue
+
+            with open(filepath, "rb") as f:
+                raw = f.read()
+            digest = hashlib.sha256(raw).hexdigest()
+            if entry is None or entry["hash"] != digest:
+                entry = {"hash": digest, "chunks": self._with_stats(chunk_document(filename, raw.decode("utf-8")))}
+                changed.append(filename)
+            current[filename] = {**entry, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+        dirty = current != self.files
+        self.files = current
+        self.reindexed = changed
+        self._rebuild()
+        if dirty and self.path is not None:
+            self._save()
+        return changed
+
+    def _with_stats(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        for chunk in chunks:
+            tokens = self.tokenize(chunk["content"])
+            chunk["tf"] = dict(Counter(tokens))
+            chunk["length"] = len(tokens)
+        return chunks
+
+    def index_chunks(self, name: str, chunks: List[Dict[str, Any]]):
+        """Indexes in-memory chunks ({id, content, source}) under `name`, replacing what it held before."""
+        self.files[name] = {"hash": "", "chunks": self._with_stats([dict(chunk) for chunk in chunks])}
+        self.reindexed = [name]
+        self._rebuild()
+
+    def _rebuild(self):
+        """Vocabulary and the BM25 weight matrix from the per-chunk statistics."""
+        self.chunks = []
+        self.vocab = {}
+        rows, cols, freqs, lengths = [], [], [], []
+        for filename in sorted(self.files):
+            for chunk in self.files[filename]["chunks"]:
+                idx = len(self.chunks)
+                self.chunks.append({k: chunk[k] for k in ("id", "content", "source")})
+                lengths.append(chunk["length"])
+                for term, freq in chunk["tf"].items():
+                    rows.append(self.vocab.setdefault(term, len(self.vocab)))
+                    cols.append(idx)
+                    freqs.append(freq)
+
+        n = len(self.chunks)
+        shape = (len(self.vocab), n)
+        if not n:
+            self.weights = sparse.csr_matrix(shape, dtype=np.float64)
+            return
+
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        freqs = np.asarray(freqs, dtype=np.float64)
+        lengths = np.asarray(lengths, dtype=np.float64)
+
+        # Same IDF as BM25Okapi: negative values are floored at epsilon * mean idf
+        df = np.bincount(rows, minlength=len(self.vocab)).astype(np.float64)
+        idf = np.log(n - df + 0.5) - np.log(df + 0.5)
+        idf[idf < 0] = self.epsilon * idf.mean()
+
+        norm = self.k1 * (1 - self.b + self.b * lengths / lengths.mean())
+        data = idf[rows] * (freqs * (self.k1 + 1) / (freqs + norm[cols]))
+        self.weights = sparse.csr_matrix((data, (rows, cols)), shape=shape)
+
+    def _query_matrix(self, queries: Sequence[str]) -> sparse.csr_matrix:
+        """Query x term counts; repeated query terms count twice, as in BM25Okapi."""
+        rows, cols = [], []
+        for i, query in enumerate(queries):
+            for term in self.tokenize(query):
+                col = self.vocab.get(term)
+                if col is not None:
+                    rows.append(i)
+                    cols.append(col)
+        data = np.ones(len(rows), dtype=np.float64)
+        return sparse.csr_matrix((data, (rows, cols)), shape=(len(queries), len(self.vocab)))
+
+    def get_scores_batch(self, queries: Sequence[str]) -> np.ndarray:
+        """(len(queries), n_chunks) score matrix from one sparse matmul."""
+        return (self._query_matrix(queries) @ self.weights).toarray()
+
+    def get_scores(self, query: str) -> np.ndarray:
+        return self.get_scores_batch([query])[0]
+
+    def top_k(self, scores: np.ndarray, k: int) -> np.ndarray:
+        """Indices of the k best scores, best first (ties by chunk order)."""
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        candidates = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        return candidates[np.lexsort((candidates, -scores[candidates]))]
+
+    def stats(self) -> Dict[str, int]:
+        return {"files": len(self.files), "chunks": len(self.chunks),
+                "terms": len(self.vocab), "reindexed": len(self.reindexed)}
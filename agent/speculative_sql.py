@@ -0,0 +1,65 @@
+from typing import Any, Dict, List, Optional, Tuple, TypedDict
+
+# How the winning candidate is picked: the first one that runs without error
+# (lowest latency), or the result most candidates agree on (self-consistency)
+SELECTIONS = ("first", "vote")
+# How the candidates are sampled: K separate LM calls in parallel, or one call asking for n completions
+SAMPLINGS = ("concurrent", "n")
+
+class Candidate(TypedDict):
+    index: int  # 0 is the greedy sample, the one the sequential loop would have generated
+    sql_query: str  # the validated statement when it passed validation
+    result: Any  # run_query's QueryResult, None on error
+    error: Optional[str]
+
+def sampling_config(index: int, temperature: float) -> Dict[str, Any]:
+    """
+    DSPy call config for candidate `index`: the first keeps the configured
+    (greedy) settings; the others sample at `temperature`, each with its own
+    rollout id so the LM cache keeps them apart.
+    """
+    if index == 0:
+        return {}
+    return {"temperature": temperature, "rollout_id": index}
+
+def run_candidate(sql_tool, index: int, sql_query: str, cancel=None) -> Candidate:
+    """
+    Validates and runs one candidate (blocking; call it from a worker thread).
+    `cancel` is a CancelToken that stops this candidate's query once a winner is picked.
+    """
+    error, statement = sql_tool.validate(sql_query)
+    if error:
+        return {"index": index, "sql_query": statement or sql_query, "result": None, "error": error}
+    result = sql_tool.run_query(statement, cancel)
+    if isinstance(result, str) and (result.startswith("Error") or result.startswith("SQL Error")):
+        return {"index": index, "sql_query": statement, "result": None, "error": result}
+    return {"index": index, "sql_query": statement, "result": result, "error": None}
+
+def _value(value: Any) -> Any:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return round(float(value), 4)  # 3 == 3.0, and float noise from different SUM orders
+    return value
+
+def result_key(result: Dict[str, Any]) -> Tuple:
+    """The values of a result, in row order; column names do not matter (aliases differ)."""
+    return tuple(tuple(_value(v) for v in row) for row in result["rows"])
+
+def vote(candidates: List[Candidate]) -> Optional[Candidate]:
+    """
+    The successful candidate whose result most others share. Ties go to
+    non-empty results, then to the lowest index (the greedy sample first).
+    """
+    groups: Dict[Tuple, List[Candidate]] = {}
+    for candidate in candidates:
+        if candidate["error"] is None:
+            groups.setdefault(result_key(candidate["result"]), []).append(candidate)
+    if not groups:
+        return None
+    best = max(groups.values(), key=lambda group: (
+        len(group), group[0]["result"]["row_count"] > 0, -min(c["index"] for c in group)))
+    return min(best, key=lambda c: c["index"])
+
+def votes(candidates: List[Candidate], winner: Candidate) -> int:
+    """How many candidates returned the winner's result."""
+    key = result_key(winner["result"])
+    return sum(1 for c in candidates if c["error"] is None and result_key(c["result"]) == key)
@@ -0,0 +1,397 @@
+import re
+import sqlite3
+import time
+from contextlib import closing
+from typing import Any, Dict, Iterable, List, Optional, Tuple, TypedDict
+
+from agent.tools.sql_utils import tokenize_sql, normalize_sql, WS, COMMENT, QUOTED, WORD, identifier
+from agent.tools.sqlite_tool import SCHEMA_TABLES
+
+# Widest index the advisor proposes (key + covering columns)
+MAX_INDEX_COLUMNS = 6
+
+_CLAUSE_WORDS = {"select": "select", "from": "from", "join": "from", "on": "on", "where": "where",
+                 "group": "group", "having": "having", "order": "order", "limit": "limit"}
+_EQ_OPS = {"=", "==", "in", "is"}
+_RANGE_OPS = {"<", ">", "<=", ">=", "between"}
+_NOT_FUNCTIONS = {"in", "and", "or", "not", "on", "where", "select", "exists", "from", "join", "by", "as", "when", "then"}
+_AUTOMATIC_RE = re.compile(r"(\w+)(=|>|<|>=|<=)\?")
+
+class WorkloadQuery(TypedDict):
+    sql: str
+    count: int
+    elapsed_ms: float
+
+class IndexCandidate(TypedDict):
+    table: str
+    columns: List[str]
+    reason: str
+    queries: List[int]  # positions in the workload
+
+def plan_issues(details: Iterable[str]) -> Dict[str, list]:
+    """
+    What in an EXPLAIN QUERY PLAN is worth an index: full table scans,
+    automatic (per-query transient) indexes and temp B-trees for sorting.
+    """
+    issues = {"scans": [], "automatic": [], "temp_btrees": []}
+    for detail in details:
+        if detail.startswith("USE TEMP B-TREE FOR "):
+            issues["temp_btrees"].append(detail[len("USE TEMP B-TREE FOR "):])
+        elif detail.startswith("SEARCH ") and " USING AUTOMATIC " in detail:
+            name = detail[len("SEARCH "):].split(" USING ")[0]
+            issues["automatic"].append((name, _AUTOMATIC_RE.findall(detail)))
+        elif detail.startswith("SCAN ") and " USING " not in detail and detail != "SCAN CONSTANT ROW":
+            issues["scans"].append(detail[len("SCAN "):])
+    return issues
+
+def index_name(table: str, columns: List[str]) -> str:
+    raw = "_".join([table] + columns).lower()
+    return "idx_" + re.sub(r"[^a-z0-9]+", "_", raw).strip("_")
+
+def index_ddl(candidate: IndexCandidate) -> str:
+    cols = ", ".join(f'"{c}"' for c in candidate["columns"])
+    return f'CREATE INDEX IF NOT EXISTS "{index_name(candidate["table"], candidate["columns"])}" ' \
+           f'ON "{candidate["table"]}" ({cols})'
+
+class IndexAdvisor:
+    """
+    Proposes covering indexes for a query workload (see QueryLog).
+
+    For every distinct executed query the plan is inspected for full scans,
+    automatic indexes and temp B-trees; the columns the query compares with
+    `=`/IN (index key), with ranges (one trailing key column), sorts on, and
+    reads (covering columns) give one candidate per offending table. Each
+    candidate is then tried on an in-memory copy of the database: it is only
+    kept if SQLite actually uses it and the workload gets faster.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        with closing(sqlite3.connect(db_path)) as conn:
+            self.tables = {
+                name.lower(): name for (name,) in
+                conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")
+            }
+            self.columns: Dict[str, List[Tuple[str, str, int]]] = {}
+            self.row_counts: Dict[str, int] = {}
+            self.indexes: Dict[str, List[List[str]]] = {}
+            for table in self.tables.values():
+                self.columns[table] = [(c[1], c[2] or "", c[5]) for c in conn.execute(f"PRAGMA table_info('{table}')")]
+                self.row_counts[table] = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+                self.indexes[table] = [
+                    [row[2] for row in conn.execute(f"PRAGMA index_info('{idx[1]}')")]
+                    for idx in conn.execute(f"PRAGMA index_list('{table}')")
+                ]
+
+    # --- Workload ---
+
+    def load_workload(self, entries: Iterable[Dict[str, Any]]) -> List[WorkloadQuery]:
+        """Distinct executed queries (normalized) with how often they ran."""
+        by_key: Dict[str, WorkloadQuery] = {}
+        for entry in entries:
+            sql = entry.get("executed") or entry.get("sql")
+            if not sql:
+                continue
+            key = normalize_sql(sql)
+            if key not in by_key:
+                by_key[key] = {"sql": sql, "count": 0, "elapsed_ms": 0.0}
+            by_key[key]["count"] += 1
+            by_key[key]["elapsed_ms"] += entry.get("elapsed_ms", 0.0)
+        return list(by_key.values())
+
+    def _base_table(self, name: str) -> Optional[str]:
+        name = SCHEMA_TABLES.get(name.lower(), name)
+        return self.tables.get(name.lower())
+
+    def _usage(self, sql: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Per base table: columns compared with =/IN ("eq"), with ranges
+        ("range"), used in GROUP/ORDER BY ("order") and referenced at all
+        ("cols"). References inside function calls are not sargable and only
+        count as read columns.
+        """
+        tokens = [(k, t) for k, t in tokenize_sql(sql) if k not in (WS, COMMENT)]
+
+        # Table references: name or alias -> base table
+        refs: Dict[str, str] = {}
+        clause = None
+        for i, (kind, text) in enumerate(tokens):
+            low = text.lower()
+            if kind == WORD and low in _CLAUSE_WORDS:
+                clause = _CLAUSE_WORDS[low]
+            elif clause == "from" and kind in (WORD, QUOTED) and i > 0 and \
+                    tokens[i - 1][1].lower() in ("from", "join", ","):
+                table = self._base_table(identifier(kind, text))
+                if table is None:
+                    continue
+                refs[identifier(kind, text)] = table
+                j = i + 1
+                if j < len(tokens) and tokens[j][1].lower() == "as":
+                    j += 1
+                if j < len(tokens) and tokens[j][0] in (WORD, QUOTED) and tokens[j][1].lower() not in _CLAUSE_WORDS \
+                        and tokens[j][1].lower() not in ("inner", "left", "cross", "natural", "using"):
+                    refs[identifier(*tokens[j])] = table
+
+        usage = {table: {"eq": set(), "range": set(), "order": [], "cols": set()} for table in set(refs.values())}
+        names = {table: {c[0].lower(): c[0] for c in self.columns[table]} for table in usage}
+
+        clause = None
+        stack: List[bool] = []  # per open '(': is it a function call?
+        i = 0
+        while i < len(tokens):
+            kind, text = tokens[i]
+            low = text.lower()
+            if text == "(":
+                prev = tokens[i - 1] if i > 0 else ("", "")
+                stack.append(prev[0] == WORD and prev[1].lower() not in _NOT_FUNCTIONS)
+                i += 1
+                continue
+            if text == ")":
+                if stack:
+                    stack.pop()
+                i += 1
+                continue
+            if kind == WORD and low in _CLAUSE_WORDS and (i + 1 >= len(tokens) or tokens[i + 1][1] != "."):
+                clause = _CLAUSE_WORDS[low]
+                i += 1
+                continue
+            if kind not in (WORD, QUOTED):
+                i += 1
+                continue
+
+            ref = None
+            last = i
+            if i + 2 < len(tokens) and tokens[i + 1][1] == ".":
+                table = refs.get(identifier(kind, text))
+                column = identifier(*tokens[i + 2])
+                if table and column in names[table]:
+                    ref = (table, names[table][column])
+                last = i + 2
+            elif (i == 0 or tokens[i - 1][1] not in (".",)) and (i + 1 >= len(tokens) or tokens[i + 1][1] != "(") \
+                    and clause not in ("from", None):
+                column = identifier(kind, text)
+                owners = [t for t in usage if column in names[t]]
+                if len(owners) == 1:
+                    ref = (owners[0], names[owners[0]][column])
+
+            if ref:
+                table, column = ref
+                info = usage[table]
+                info["cols"].add(column)
+                nxt = tokens[last + 1][1].lower() if last + 1 < len(tokens) else ""
+                prev = tokens[i - 1][1].lower() if i > 0 else ""
+                if stack and stack[-1]:
+                    pass  # e.g. strftime('%Y', OrderDate): not usable by an index
+                elif clause in ("group", "order"):
+                    if column not in info["order"]:
+                        info["order"].append(column)
+                elif clause in ("where", "on", "having"):
+                    if nxt in _EQ_OPS or prev in ("=", "=="):
+                        info["eq"].add(column)
+                    elif nxt in _RANGE_OPS or prev in _RANGE_OPS:
+                        info["range"].add(column)
+            i = last + 1
+        return usage
+
+    def _plan(self, conn: sqlite3.Connection, sql: str) -> List[str]:
+        return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+
+    def _plan_table(self, name: str, usage: Dict[str, Any], sql: str) -> Optional[str]:
+        """Base table behind a name in a plan line (alias, view or table)."""
+        tokens = [(k, t) for k, t in tokenize_sql(sql) if k not in (WS, COMMENT)]
+        for i, (kind, text) in enumerate(tokens):
+            if kind in (WORD, QUOTED) and identifier(kind, text) == name.lower() and i > 0:
+                table = self._base_table(identifier(*tokens[i - 1])) if tokens[i - 1][1].lower() != "as" \
+                    else self._base_table(identifier(*tokens[i - 2]))
+                if table in usage:
+                    return table
+        table = self._base_table(name)
+        return table if table in usage else None
+
+    def _already_indexed(self, table: str, columns: List[str]) -> bool:
+        wanted = [c.lower() for c in columns]
+        for existing in self.indexes.get(table, []):
+            if [c.lower() for c in existing[:len(wanted)]] == wanted:
+                return True
+        return False
+
+    def _rowid_column(self, table: str) -> Optional[str]:
+        pks = [c for c in self.columns[table] if c[2]]
+        if len(pks) == 1 and pks[0][1].upper() == "INTEGER":
+            return pks[0][0]
+        return None
+
+    # --- Candidates ---
+
+    def candidates(self, workload: List[WorkloadQuery]) -> List[IndexCandidate]:
+        found: Dict[Tuple[str, Tuple[str, ...]], IndexCandidate] = {}
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            for position, query in enumerate(workload):
+                try:
+                    issues = plan_issues(self._plan(conn, query["sql"]))
+                except sqlite3.Error:
+                    continue
+                usage = self._usage(query["sql"])
+
+                proposals = []
+                for name in issues["scans"]:
+                    table = self._plan_table(name, usage, query["sql"])
+                    if table and not table.startswith("rollup_"):
+                        proposals.append((table, "full scan"))
+                for name, keys in issues["automatic"]:
+                    table = self._plan_table(name, usage, query["sql"])
+                    if table and not table.startswith("rollup_"):
+                        for column, op in keys:
+                            (usage[table]["eq"] if op == "=" else usage[table]["range"]).add(column)
+                        proposals.append((table, "automatic index"))
+                if issues["temp_btrees"] and len(issues["scans"]) == 1 and proposals:
+                    proposals[0] = (proposals[0][0], proposals[0][1] + " + temp b-tree")
+
+                for table, reason in proposals:
+                    columns = self._index_columns(table, usage[table], bool(issues["temp_btrees"]))
+                    if not columns:
+                        continue
+                    key = (table, tuple(columns))
+                    if key not in found:
+                        found[key] = {"table": table, "columns": columns, "reason": reason, "queries": []}
+                    found[key]["queries"].append(position)
+        return list(found.values())
+
+    def _index_columns(self, table: str, info: Dict[str, Any], sorts: bool) -> List[str]:
+        rowid = self._rowid_column(table)
+        key = sorted(info["eq"])
+        ranges = sorted(info["range"] - info["eq"])
+        if ranges:
+            key.append(ranges[0])
+        elif sorts:
+            # Equality prefix then the sort columns: rows come out already ordered
+            key += [c for c in info["order"] if c not in key]
+        if not key or key[0] == rowid:
+            return []
+        # Every index already carries the rowid, so it never needs covering
+        extra = sorted(info["cols"] - set(key) - {rowid})
+        columns = key + extra if len(key) + len(extra) <= MAX_INDEX_COLUMNS else key
+        if self._already_indexed(table, columns):
+            return []
+        return columns
+
+    # --- What-if evaluation ---
+
+    def _copy(self) -> sqlite3.Connection:
+        mem = sqlite3.connect(":memory:")
+        with closing(sqlite3.connect(self.db_path)) as src:
+            src.backup(mem)
+        return mem
+
+    def _estimated_cost(self, details: List[str], usage: Dict[str, Any], sql: str) -> int:
+        """Rows read by full scans, plus one more pass per temp B-tree (plan-only estimate)."""
+        issues = plan_issues(details)
+        scanned = []
+        for name in issues["scans"]:
+            table = self._plan_table(name, usage, sql) or self._base_table(name)
+            scanned.append(self.row_counts.get(table, 0))
+        for detail in details:
+            if detail.startswith("SCAN ") and " USING COVERING INDEX " in detail:
+                table = self._plan_table(detail[5:].split(" USING ")[0], usage, sql)
+                scanned.append(self.row_counts.get(table, 0) // 2)  # narrower rows
+        cost = sum(scanned) + len(issues["temp_btrees"]) * max(scanned, default=0)
+        return max(cost, 1)
+
+    def _measure(self, conn: sqlite3.Connection, workload: List[WorkloadQuery],
+                 positions: Iterable[int], repeat: int) -> Dict[int, Dict[str, Any]]:
+        results = {}
+        for position in positions:
+            sql = workload[position]["sql"]
+            details = self._plan(conn, sql)
+            best = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                conn.execute(sql).fetchall()
+                best = min(best, time.perf_counter() - start)
+            results[position] = {
+                "plan": details,
+                "ms": best * 1000,
+                "estimated": self._estimated_cost(details, self._usage(sql), sql),
+            }
+        return results
+
+    def evaluate(self, workload: List[WorkloadQuery], candidates: List[IndexCandidate],
+                 repeat: int = 5, min_gain: float = 0.1) -> Dict[str, Any]:
+        """
+        Tries each candidate alone, then the useful ones together, on an
+        in-memory copy. Returns per-candidate and overall estimated / measured
+        speedups (weighted by how often each query ran).
+        """
+        runnable = []
+        with closing(self._copy()) as conn:
+            for position, query in enumerate(workload):
+                try:
+                    conn.execute(f"EXPLAIN {query['sql']}")
+                    runnable.append(position)
+                except sqlite3.Error:
+                    continue
+            baseline = self._measure(conn, workload, runnable, repeat)
+
+            def totals(results, positions):
+                ms = sum(results[p]["ms"] * workload[p]["count"] for p in positions)
+                est = sum(results[p]["estimated"] * workload[p]["count"] for p in positions)
+                return ms, est
+
+            report = []
+            for candidate in candidates:
+                positions = [p for p in candidate["queries"] if p in baseline]
+                if not positions:
+                    continue
+                name = index_name(candidate["table"], candidate["columns"])
+                conn.execute(index_ddl(candidate))
+                after = self._measure(conn, workload, positions, repeat)
+                conn.execute(f'DROP INDEX "{name}"')
+
+                used = any(name in " ".join(after[p]["plan"]) for p in positions)
+                before_ms, before_est = totals(baseline, positions)
+                after_ms, after_est = totals(after, positions)
+                report.append({
+                    "candidate": candidate,
+                    "ddl": index_ddl(candidate),
+                    "used": used,
+                    "estimated_speedup": round(before_est / after_est, 2),
+                    "measured_speedup": round(before_ms / after_ms, 2) if after_ms else None,
+                    "before_ms": round(before_ms, 3),
+                    "after_ms": round(after_ms, 3),
+                    "recommended": used and after_ms <= before_ms * (1 - min_gain),
+                })
+
+            # Best first; an index leading with the same column as a better one is redundant
+            recommended = []
+            for r in sorted(report, key=lambda r: r["measured_speedup"] or 0, reverse=True):
+                leading = (r["candidate"]["table"], r["candidate"]["columns"][0])
+                if r["recommended"] and leading in {(c["table"], c["columns"][0]) for c in recommended}:
+                    r["recommended"] = False
+                if r["recommended"]:
+                    recommended.append(r["candidate"])
+            for candidate in recommended:
+                conn.execute(index_ddl(candidate))
+            combined = self._measure(conn, workload, runnable, repeat)
+
+        before_ms, before_est = totals(baseline, runnable)
+        after_ms, after_est = totals(combined, runnable)
+        return {
+            "queries": len(runnable),
+            "candidates": report,
+            "recommended": recommended,
+            "workload": {
+                "before_ms": round(before_ms, 3),
+                "after_ms": round(after_ms, 3),
+                "estimated_speedup": round(before_est / after_est, 2) if after_est else None,
+                "measured_speedup": round(before_ms / after_ms, 2) if after_ms else None,
+            },
+        }
+
+    def apply(self, candidates: List[IndexCandidate]) -> List[str]:
+        """Creates the indexes on the real database (needs write access). Returns the DDL run."""
+        statements = [index_ddl(c) for c in candidates]
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            with conn:
+                for ddl in statements:
+                    conn.execute(ddl)
+        return statements
@@ -0,0 +1,46 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List
+
+class QueryLog:
+    """
+    Append-only JSONL log of the queries SQLiteTool executed, one entry per
+    execution with its EXPLAIN QUERY PLAN, timing and row count. Feeds the
+    index advisor (scripts/index_advisor.py).
+    """
+
+    def __init__(self, path: str = ".cache/query_log.jsonl"):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def append(self, query: str, executed: str, plan: List[tuple], elapsed_ms: float, row_count: int):
+        """`executed` differs from `query` when the tool rewrote it (e.g. onto a rollup)."""
+        entry = {
+            "ts": round(time.time(), 3),
+            "sql": query,
+            "executed": executed,
+            "plan": [[row[0], row[1], row[3]] for row in plan],  # (id, parent, detail)
+            "elapsed_ms": round(elapsed_ms, 3),
+            "rows": row_count,
+        }
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+def read_query_log(path: str) -> Iterator[Dict[str, Any]]:
+    """Entries of a query log, skipping lines that are not valid JSON."""
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
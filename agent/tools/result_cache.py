@@ -0,0 +1,104 @@
+import hashlib
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+from agent import metrics
+from agent.cache import DiskLRUCache
+from agent.tools.sql_utils import normalize_sql
+
+class SQLResultCache:
+    """
+    Disk-backed cache of SQL results in front of SQLiteTool.
+
+    Keys are the normalized SQL (whitespace, case and table aliases folded,
+    see normalize_sql) plus a DB fingerprint, so equivalent queries the LLM
+    phrases differently share one entry and a changed DB never serves stale
+    rows. Concurrent identical queries are collapsed into a single execution
+    (single-flight); the followers wait for the leader's result.
+    """
+
+    def __init__(self, path: str = ".cache/sql_results.sqlite",
+                 max_bytes: int = 64 * 1024 * 1024, ttl: Optional[float] = None):
+        self.store = DiskLRUCache(path, max_bytes=max_bytes)
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.deduplicated = 0
+
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+
+    def key(self, query: str, fingerprint: Any) -> str:
+        raw = f"{normalize_sql(query)}\x00{fingerprint!r}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get_or_run(self, query: str, fingerprint: Any, run: Callable[[], Any],
+                   relabel: Optional[Callable[[str], Any]] = None) -> Any:
+        """
+        Returns the cached result for `query` or computes it with `run()`.
+        Only dict results are stored (error strings are never cached).
+
+        An entry may have been produced by a textually different query whose
+        unaliased expression columns are labelled differently (`COUNT(*)` vs
+        `count(*)`); `relabel(query)` returns the current query's column names
+        and is applied whenever the stored SQL text differs.
+        """
+        key = self.key(query, fingerprint)
+
+        entry = self.store.get(key)
+        if entry is not None:
+            with self._lock:
+                self.hits += 1
+            metrics.count("sql_cache_hits")
+            return self._adapt(entry, query, relabel)
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+                self.misses += 1
+            else:
+                self.deduplicated += 1
+
+        if not leader:
+            metrics.count("sql_cache_deduplicated")
+            return self._adapt(future.result(), query, relabel)
+
+        try:
+            result = run()
+            entry = {"sql": query, "result": result}
+            if isinstance(result, dict):
+                self.store.set(key, entry, ttl=self.ttl)
+            future.set_result(entry)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def _adapt(self, entry: Dict[str, Any], query: str, relabel) -> Any:
+        result = entry["result"]
+        if entry["sql"] == query or relabel is None or not isinstance(result, dict):
+            return result
+
+        columns = relabel(query)
+        if columns and len(columns) == len(result["columns"]):
+            result = {**result, "columns": columns}
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for this process plus the on-disk store size."""
+        lookups = self.hits + self.misses + self.deduplicated
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "deduplicated": self.deduplicated,
+            "hit_rate": round((self.hits + self.deduplicated) / lookups, 3) if lookups else 0.0,
+            **self.store.stats(),
+        }
@@ -0,0 +1,194 @@
+import re
+from collections import deque
+from typing import Any, Dict, List, Optional, Set, Tuple, TypedDict
+
+# Business words -> the view columns they are computed from
+SYNONYMS = {
+    "revenue": ("order_items.UnitPrice", "order_items.Quantity", "order_items.Discount"),
+    "sales": ("order_items.UnitPrice", "order_items.Quantity", "order_items.Discount"),
+    "margin": ("order_items.UnitPrice", "order_items.Quantity", "order_items.Discount"),
+    "aov": ("order_items.UnitPrice", "order_items.Quantity", "order_items.Discount", "orders.OrderID"),
+    "average order value": ("order_items.UnitPrice", "order_items.Quantity", "order_items.Discount", "orders.OrderID"),
+    "sold": ("order_items.Quantity",),
+    "quantity": ("order_items.Quantity",),
+    "units": ("order_items.Quantity",),
+    "price": ("order_items.UnitPrice",),
+    "discount": ("order_items.Discount",),
+    "category": ("categories.CategoryName",),
+    "product": ("products.ProductName",),
+    "customer": ("customers.CompanyName",),
+    "client": ("customers.CompanyName",),
+    "company": ("customers.CompanyName",),
+    "order": ("orders.OrderID",),
+    "freight": ("orders.Freight",),
+    "shipping": ("orders.Freight", "orders.ShipCountry"),
+    "country": ("customers.Country",),
+    "located": ("customers.Country",),
+    "city": ("customers.City",),
+    "employee": ("orders.EmployeeID",),
+    "supplier": ("products.SupplierID",),
+    "discontinued": ("products.Discontinued",),
+    "date": ("orders.OrderDate",),
+    "year": ("orders.OrderDate",),
+    "month": ("orders.OrderDate",),
+    "quarter": ("orders.OrderDate",),
+    "during": ("orders.OrderDate",),
+    "campaign": ("orders.OrderDate",),
+}
+
+# Column-name parts too common to link on their own
+_GENERIC = {"id", "name", "unit"}
+# Retrieved docs count for less than the question itself
+_CONTEXT_WEIGHT = 0.5
+_YEAR = re.compile(r"\b(?:19|20)\d\d\b")
+
+class SchemaLink(TypedDict):
+    tables: Dict[str, List[str]]  # table -> kept columns, in schema order
+    scores: Dict[str, float]  # "table.column" -> relevance (join / key columns are 0)
+
+def _words(text: str) -> Set[str]:
+    """Lower-case words plus their singular form ('categories' -> 'category')."""
+    words = set()
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        words.add(word)
+        if word.endswith("ies") and len(word) > 4:
+            words.add(word[:-3] + "y")
+        elif word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+            words.add(word[:-1])
+    return words
+
+def _column_parts(column: str) -> List[str]:
+    """'CompanyName' -> ['company', 'name'], 'OrderID' -> ['order', 'id']."""
+    return [part.lower() for part in re.findall(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+", column)]
+
+def _score_text(tables: Dict[str, Dict[str, Any]], text: str, values: Dict[str, Dict[str, List[str]]],
+                weight: float, scores: Dict[str, float], table_hits: Dict[str, float]):
+    if not text:
+        return
+    words = _words(text)
+    lowered = text.lower()
+
+    def add(key: str, score: float):
+        scores[key] = max(scores.get(key, 0.0), score * weight)
+
+    for phrase, columns in SYNONYMS.items():
+        if (phrase in lowered) if " " in phrase else (phrase in words):
+            for key in columns:
+                add(key, 2.0)
+    if _YEAR.search(text):
+        add("orders.OrderDate", 2.0)
+
+    # A key spelled out ("OrderID") belongs to the table it identifies, not to every table joining on it
+    key_owner = {
+        info["columns"][0][0]: table for table, info in tables.items()
+        if info["columns"] and info["columns"][0][0] not in {fk[0] for fk in info["foreign_keys"]}
+    }
+
+    for table, info in tables.items():
+        singular = table[:-1] if table.endswith("s") else table
+        if table in words or singular in words or table.replace("_", " ") in lowered:
+            table_hits[table] = max(table_hits.get(table, 0.0), weight)
+        for column, _ in info["columns"]:
+            key = f"{table}.{column}"
+            if column.lower() in words:
+                if key_owner.get(column, table) == table:
+                    add(key, 3.0)  # spelled out, e.g. "Freight", "OrderDate"
+                continue
+            # Parts that are synonyms already link where they mean ("price" -> order_items.UnitPrice)
+            parts = [p for p in _column_parts(column) if p not in _GENERIC and p not in SYNONYMS]
+            if parts and all(p in words for p in parts):
+                add(key, 1.0)
+            for value in values.get(table, {}).get(column, []):
+                if len(value) > 2 and re.search(rf"\b{re.escape(value.lower())}\b", lowered):
+                    add(key, 2.0)  # a known value, e.g. 'Beverages', 'USA'
+                    break
+
+def _join_graph(tables: Dict[str, Dict[str, Any]]) -> Dict[str, List[Tuple[str, str, str]]]:
+    """table -> [(neighbour, own column, neighbour column)] from the foreign keys, both directions."""
+    graph: Dict[str, List[Tuple[str, str, str]]] = {table: [] for table in tables}
+    for table, info in tables.items():
+        for column, target, target_column in info["foreign_keys"]:
+            if target in graph:
+                graph[table].append((target, column, target_column))
+                graph[target].append((table, target_column, column))
+    return graph
+
+def _connect(selected: Set[str], graph) -> List[Tuple[str, str, str, str]]:
+    """
+    Join edges (table, column, table, column) that connect the selected
+    tables, adding bridge tables on the way (categories -> products ->
+    order_items). Greedy: shortest path from the tree to each next table.
+    """
+    ordered = sorted(selected)
+    tree = {ordered[0]}
+    edges = []
+    for target in ordered[1:]:
+        if target in tree:
+            continue
+        previous = {t: None for t in tree}
+        queue = deque(tree)
+        while queue and target not in previous:
+            node = queue.popleft()
+            for neighbour, column, neighbour_column in graph[node]:
+                if neighbour not in previous:
+                    previous[neighbour] = (node, column, neighbour_column)
+                    queue.append(neighbour)
+        if target not in previous:
+            continue  # not joinable: still listed, without a join path
+        node = target
+        while previous[node] is not None:
+            parent, column, node_column = previous[node]
+            edges.append((parent, column, node, node_column))
+            tree.add(node)
+            node = parent
+        tree.add(target)
+    return edges
+
+def link_schema(tables: Dict[str, Dict[str, Any]], question: str, context: str = "",
+                values: Optional[Dict[str, Dict[str, List[str]]]] = None,
+                min_score: float = 1.0) -> Optional[SchemaLink]:
+    """
+    Picks the tables and columns a question needs from an introspected schema
+    (table -> {"columns": [(name, type)], "foreign_keys": [(col, table, col)]}).
+
+    Columns score on exact names (3), synonyms / known values / years (2) and
+    all non-generic name parts (1) in the question; matches in `context`
+    (retrieved docs) count half. Tables named in the question are kept with
+    their key and name columns. The selection is closed over the foreign keys
+    so every join path is present, with its join columns. None when nothing
+    links (use the full schema).
+    """
+    values = values or {}
+    scores: Dict[str, float] = {}
+    table_hits: Dict[str, float] = {}
+    _score_text(tables, question, values, 1.0, scores, table_hits)
+    _score_text(tables, context, values, _CONTEXT_WEIGHT, scores, table_hits)
+
+    keep: Dict[str, Set[str]] = {}
+    for key, score in scores.items():
+        table, column = key.split(".", 1)
+        if score >= min_score and table in tables:
+            keep.setdefault(table, set()).add(column)
+    for table, score in table_hits.items():
+        if score >= 1.0:
+            names = [c for c, _ in tables[table]["columns"] if c.endswith("Name")]
+            keep.setdefault(table, set()).update(names[:1])
+    if not keep:
+        return None
+
+    for parent, column, child, child_column in _connect(set(keep), _join_graph(tables)):
+        keep.setdefault(parent, set()).add(column)
+        keep.setdefault(child, set()).add(child_column)
+
+    for table in keep:
+        first = tables[table]["columns"][0][0]
+        if first.endswith("ID"):
+            keep[table].add(first)  # the key, for COUNT(DISTINCT ...) and joins the model writes itself
+
+    return {
+        "tables": {
+            table: [c for c, _ in info["columns"] if c in keep[table]]
+            for table, info in tables.items() if table in keep
+        },
+        "scores": {key: round(score, 2) for key, score in sorted(scores.items()) if score >= min_score},
+    }
@@ -0,0 +1,215 @@
+import datetime
+import re
+from typing import Iterable, List, Optional, Set, Tuple
+
+from agent.tools.sql_utils import STRING, QUOTED, WORD, UnsupportedSQL, closing_paren, identifier, sql_tokens
+
+# Bump when the dim_date definition changes: SQLiteTool rebuilds older tables
+DATE_DIMENSION_VERSION = 1
+
+# --- Date dimension ---
+
+_CAMPAIGN_RE = re.compile(r"^## (.+?)\s*$|Start Date:\s*y{4}-(\d\d-\d\d)|End Date:\s*y{4}-(\d\d-\d\d)",
+                          re.MULTILINE)
+
+def parse_campaigns(calendar: str) -> List[Tuple[str, str, str]]:
+    """(name, 'MM-DD' start, 'MM-DD' end) for every yearly campaign in the marketing calendar."""
+    campaigns = []
+    name = start = None
+    for m in _CAMPAIGN_RE.finditer(calendar):
+        if m.group(1):
+            name, start = m.group(1), None
+        elif m.group(2):
+            start = m.group(2)
+        elif m.group(3) and name and start:
+            campaigns.append((name, start, m.group(3)))
+            name = start = None
+    return campaigns
+
+def date_dimension_statements(first_year: int, last_year: int,
+                              campaigns: Iterable[Tuple[str, str, str]] = ()) -> List[str]:
+    """
+    DDL (re)building dim_date: one row per calendar day of [first_year,
+    last_year] with its calendar attributes and marketing campaign, keyed on
+    the same 'YYYY-MM-DD' text OrderDate starts with. `next_date` makes
+    half-open joins (OrderDate >= date AND OrderDate < next_date) sargable.
+    Also indexes Orders(OrderDate) so rewritten range predicates can use it.
+    """
+    campaigns = sorted(campaigns)
+    tags = " ".join(
+        f"WHEN substr(d, 6) BETWEEN '{start}' AND '{end}' THEN '{name.replace(chr(39), chr(39) * 2)}'"
+        for name, start, end in campaigns
+    )
+    campaign = f"CASE {tags} END" if tags else "NULL"
+    return [
+        "DROP TABLE IF EXISTS dim_date",
+        "CREATE TABLE dim_date (date TEXT PRIMARY KEY, next_date TEXT NOT NULL, year INTEGER NOT NULL, "
+        "quarter INTEGER NOT NULL, month INTEGER NOT NULL, year_month TEXT NOT NULL, day INTEGER NOT NULL, "
+        "day_of_week INTEGER NOT NULL, is_weekend INTEGER NOT NULL, campaign TEXT) WITHOUT ROWID",
+        f"INSERT INTO dim_date WITH RECURSIVE days(d) AS ("
+        f"SELECT '{first_year:04d}-01-01' UNION ALL SELECT date(d, '+1 day') FROM days WHERE d < '{last_year:04d}-12-31') "
+        f"SELECT d, date(d, '+1 day'), CAST(substr(d, 1, 4) AS INTEGER), (CAST(substr(d, 6, 2) AS INTEGER) + 2) / 3, "
+        f"CAST(substr(d, 6, 2) AS INTEGER), substr(d, 1, 7), CAST(substr(d, 9, 2) AS INTEGER), "
+        f"CAST(strftime('%w', d) AS INTEGER), strftime('%w', d) IN ('0', '6'), {campaign} FROM days",
+        "CREATE INDEX dim_date_year_month ON dim_date(year, month)",
+        "CREATE INDEX dim_date_campaign ON dim_date(campaign, year)",
+        "CREATE TABLE IF NOT EXISTS dim_date_meta (version INTEGER NOT NULL, first_year INTEGER NOT NULL, "
+        "last_year INTEGER NOT NULL, campaigns TEXT NOT NULL)",
+        "DELETE FROM dim_date_meta",
+        f"INSERT INTO dim_date_meta VALUES ({DATE_DIMENSION_VERSION}, {first_year}, {last_year}, "
+        f"'{repr(campaigns).replace(chr(39), chr(39) * 2)}')",
+        "CREATE INDEX IF NOT EXISTS idx_orders_orderdate ON Orders(OrderDate)",
+    ]
+
+def canonical_date_check(column: str) -> str:
+    """
+    Rows of `column` that strftime and text comparison could disagree on:
+    anything but canonical 'YYYY-MM-DD[ HH:MM:SS[.SSS]]' text (numbers,
+    timezones, out-of-range days SQLite would normalize).
+    """
+    col = f'"{column}"'
+    return (f"{col} IS NOT NULL AND NOT (typeof({col}) = 'text' AND {col} IN "
+            f"(date({col}), datetime({col}), strftime('%Y-%m-%d %H:%M:%f', {col})))")
+
+# --- Predicate rewriting ---
+
+# strftime format -> (literal pattern, parser to the first day, step to the next period)
+_FORMATS = {
+    "%Y": (re.compile(r"^\d{4}$"), lambda v: datetime.date(int(v), 1, 1),
+           lambda d: datetime.date(d.year + 1, 1, 1)),
+    "%Y-%m": (re.compile(r"^\d{4}-\d\d$"), lambda v: datetime.date(int(v[:4]), int(v[5:]), 1),
+              lambda d: datetime.date(d.year + d.month // 12, d.month % 12 + 1, 1)),
+    "%Y-%m-%d": (re.compile(r"^\d{4}-\d\d-\d\d$"), datetime.date.fromisoformat,
+                 lambda d: d + datetime.timedelta(days=1)),
+}
+
+# Tokens that may surround a rewritten predicate without binding tighter than it
+_BEFORE = {"where", "and", "or", "not", "on", "having", "when", "(", ","}
+_AFTER = {"and", "or", ")", ";", ",", "group", "order", "limit", "having", "then", "else", "end",
+          "union", "except", "intersect", "window"}
+
+def _period(fmt: str, literal: str) -> Optional[Tuple[str, str]]:
+    """[start, end) dates covered by strftime(fmt, x) = literal, None if it can never match."""
+    pattern, first, step = _FORMATS[fmt]
+    if not pattern.match(literal):
+        return None
+    try:
+        start = first(literal)
+        return start.isoformat(), step(start).isoformat()
+    except (ValueError, OverflowError):
+        return None
+
+def _string(text: str) -> str:
+    return text[1:-1].replace("''", "'")
+
+def _in_between(tokens, i: int) -> bool:
+    """True if the 'and' at i is the AND of a BETWEEN."""
+    depth = 0
+    for j in range(i - 1, -1, -1):
+        text = tokens[j][1].lower()
+        if text == ")":
+            depth += 1
+        elif text == "(":
+            if depth == 0:
+                return False
+            depth -= 1
+        elif depth == 0 and text == "between":
+            return True
+        elif depth == 0 and text in ("and", "or", "where", "on", "having", "when", "select"):
+            return False
+    return False
+
+def rewrite_date_predicates(sql: str, date_columns: Set[str]) -> Optional[str]:
+    """
+    Turns `strftime(fmt, col) = / IN (...) / BETWEEN` string predicates into
+    half-open ranges on `col`, e.g.
+
+        strftime('%Y-%m', o.OrderDate) = '2017-06'
+        -> (o.OrderDate >= '2017-06-01' AND o.OrderDate < '2017-07-01')
+
+    so an index on the column can be used. Only for `date_columns` (lower
+    case names) known to hold canonical ISO text, where both forms select
+    the same rows; fmt must be '%Y', '%Y-%m' or '%Y-%m-%d'. Returns None when
+    nothing was rewritten.
+    """
+    if "strftime" not in sql.lower():
+        return None
+    tokens = sql_tokens(sql)
+    edits: List[Tuple[int, int, str]] = []  # (start char, end char, replacement)
+
+    i = 0
+    while i < len(tokens):
+        replacement = None
+        try:
+            replacement = _rewrite_at(sql, tokens, i, date_columns)
+        except UnsupportedSQL:
+            pass
+        if replacement:
+            start, end, text, i = replacement
+            edits.append((start, end, text))
+        else:
+            i += 1
+
+    if not edits:
+        return None
+    for start, end, text in reversed(edits):
+        sql = sql[:start] + text + sql[end:]
+    return sql
+
+def _rewrite_at(sql: str, tokens, i: int, date_columns: Set[str]):
+    """(start char, end char, replacement, next token index) for a predicate starting at i."""
+    if tokens[i][0] != WORD or tokens[i][1].lower() != "strftime" or \
+            i + 1 >= len(tokens) or tokens[i + 1][1] != "(":
+        return None
+    prev = tokens[i - 1][1].lower() if i > 0 else ""
+    if prev not in _BEFORE or (prev == "and" and _in_between(tokens, i - 1)) or \
+            (prev == "not" and i > 1 and tokens[i - 2][1].lower() == "is"):
+        return None
+
+    close = closing_paren(tokens, i + 1)
+    args = tokens[i + 2:close]
+    if len(args) not in (3, 5) or args[0][0] != STRING or args[1][1] != "," or \
+            any(k not in (WORD, QUOTED) for k, _, _ in args[2::2]) or (len(args) == 5 and args[3][1] != "."):
+        return None
+    fmt = _string(args[0][1])
+    if fmt not in _FORMATS or identifier(args[-1][0], args[-1][1]) not in date_columns:
+        return None
+    column = sql[args[2][2]:args[-1][2] + len(args[-1][1])]
+
+    j = close + 1
+    op = tokens[j][1].lower() if j < len(tokens) else ""
+    periods = []
+    if op in ("=", "==") and j + 1 < len(tokens) and tokens[j + 1][0] == STRING:
+        periods.append(_period(fmt, _string(tokens[j + 1][1])))
+        end = j + 2
+    elif op == "in" and j + 1 < len(tokens) and tokens[j + 1][1] == "(":
+        end = closing_paren(tokens, j + 1) + 1
+        items = tokens[j + 2:end - 1]
+        if not items or any(k != STRING for k, _, _ in items[::2]) or any(t != "," for _, t, _ in items[1::2]):
+            return None
+        periods = [_period(fmt, _string(t)) for _, t, _ in items[::2]]
+    elif op == "between" and j + 3 < len(tokens) and tokens[j + 1][0] == STRING and \
+            tokens[j + 2][1].lower() == "and" and tokens[j + 3][0] == STRING:
+        low, high = _period(fmt, _string(tokens[j + 1][1])), _period(fmt, _string(tokens[j + 3][1]))
+        periods.append((low[0], high[1]) if low and high and low[0] <= high[0] else None)
+        end = j + 4
+    else:
+        return None
+
+    if end < len(tokens) and tokens[end][1].lower() not in _AFTER:
+        return None
+    # A literal that can never equal strftime's output keeps the original predicate
+    if not periods or any(p is None for p in periods):
+        return None
+
+    merged: List[List[str]] = []
+    for start, stop in sorted(set(periods)):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], stop)
+        else:
+            merged.append([start, stop])
+    ranges = [f"{column} >= '{start}' AND {column} < '{stop}'" for start, stop in merged]
+    text = ranges[0] if len(ranges) == 1 else " OR ".join(f"({r})" for r in ranges)
+
+    last = tokens[end - 1]
+    return tokens[i][2], last[2] + len(last[1]), f"({text})", end
@@ -0,0 +1,77 @@
+from typing import Callable, Dict, List, Optional, Tuple, TypedDict
+
+# Structured guard errors: "SQL Error [<kind>]: <message>" (still an "SQL Error" for the repair loop)
+GUARD_TIMEOUT = "timeout"
+GUARD_STEPS = "step_limit"
+GUARD_COST = "cost_limit"
+GUARD_CANCELLED = "cancelled"
+
+# Assumed rows per probe for an index lookup on equality (SQLite's own default guess)
+_EQ_FANOUT = 10
+# Rows assumed for a subquery / CTE scanned by name
+_UNKNOWN_ROWS = 1000
+
+def guard_error(kind: str, message: str) -> str:
+    return f"SQL Error [{kind}]: {message}"
+
+def guard_kind(error: Optional[str]) -> Optional[str]:
+    """The guard kind of an error string from guard_error, None for other errors."""
+    if isinstance(error, str) and error.startswith("SQL Error ["):
+        return error[len("SQL Error ["):].split("]", 1)[0]
+    return None
+
+class PlanCost(TypedDict):
+    cost: int  # estimated rows visited
+    nested_scans: List[Tuple[str, str]]  # (outer, inner) plan names of full scans inside a join loop
+
+def _loop_target(detail: str) -> Optional[str]:
+    for prefix in ("SCAN ", "SEARCH "):
+        if detail.startswith(prefix):
+            return detail[len(prefix):].split(" USING ")[0]
+    return None
+
+def _fanout(detail: str, rows: int) -> Tuple[int, int]:
+    """(rows produced per outer row, one-off build cost) of one loop of the plan."""
+    if detail.startswith("SCAN "):
+        return rows, 0
+    key = detail[detail.rfind("(") + 1:] if "(" in detail else ""
+    if "INTEGER PRIMARY KEY" in detail and "=" in key:
+        return 1, 0
+    build = rows if " USING AUTOMATIC " in detail else 0
+    if "=" in key.replace("<=", "").replace(">=", ""):
+        return min(rows, _EQ_FANOUT), build
+    return max(1, rows // 4), build  # range: SQLite assumes it keeps about a quarter
+
+def estimate_plan_cost(plan: List[tuple], table_rows: Callable[[str], Optional[int]]) -> PlanCost:
+    """
+    Rough work estimate for an EXPLAIN QUERY PLAN (rows of (id, parent, _, detail)).
+
+    Loops that share a parent are nested loops in plan order, so each level
+    costs the product of the fanouts above it: a full SCAN inside another loop
+    (e.g. a join without an ON condition) multiplies by the table size.
+    Subqueries and CTEs are costed as separate groups and added up.
+    `table_rows` maps a plan name (alias / table) to its row count.
+    """
+    groups: Dict[int, List[str]] = {}
+    for row in plan:
+        if _loop_target(row[3]) is not None:
+            groups.setdefault(row[1], []).append(row[3])
+
+    cost = 0
+    nested = []
+    for details in groups.values():
+        product = 1
+        previous = None
+        for detail in details:
+            name = _loop_target(detail)
+            if name == "CONSTANT ROW":
+                continue
+            rows = table_rows(name)
+            rows = _UNKNOWN_ROWS if rows is None else max(rows, 1)
+            fanout, build = _fanout(detail, rows)
+            product *= fanout
+            cost += product + build
+            if previous is not None and detail.startswith("SCAN ") and rows > 1:
+                nested.append((previous, name))
+            previous = name
+    return {"cost": cost, "nested_scans": nested}
@@ -0,0 +1,458 @@
+from typing import Dict, List, Optional, Set, Tuple
+
+from agent.tools.sql_utils import QUOTED, NUMBER, WORD, UnsupportedSQL, closing_paren, identifier, sql_tokens
+
+# Bump when the rollup definitions change: SQLiteTool rebuilds older rollups
+ROLLUP_VERSION = 1
+
+# Line-level measures, written the way TextToSQL is told to write them
+_REVENUE = "od.UnitPrice * od.Quantity * (1 - od.Discount)"
+_MARGIN = "(od.UnitPrice * 0.3) * od.Quantity * (1 - od.Discount)"
+
+# Rollup table -> (grain column, source expression) on top of (OrderDate, has_order).
+# The grain is the raw OrderDate value, so any expression on o.OrderDate
+# (strftime, ranges, equality) evaluates the same on the rollup.
+ROLLUPS = {
+    "rollup_daily": None,
+    "rollup_customer_daily": ("CustomerID", "o.CustomerID"),
+    "rollup_product_daily": ("ProductID", "od.ProductID"),
+}
+
+_ROLLUP_ALIAS = "ru"
+
+def rollup_statements() -> List[str]:
+    """
+    DDL (re)building every rollup from "Order Details" LEFT JOIN Orders, plus
+    rollup_meta and triggers that mark the rollups dirty on any base change.
+    Lines without an order are kept with has_order = 0 so queries that do not
+    join orders see them too.
+    """
+    statements = []
+    for table, grain in ROLLUPS.items():
+        keys = "o.OrderDate AS OrderDate, o.OrderID IS NOT NULL AS has_order"
+        group = "1, 2"
+        if grain:
+            keys += f", {grain[1]} AS {grain[0]}"
+            group += ", 3"
+        statements += [
+            f"DROP TABLE IF EXISTS {table}",
+            f"CREATE TABLE {table} AS SELECT {keys}, "
+            f"SUM({_REVENUE}) AS revenue, SUM(od.Quantity) AS quantity, SUM({_MARGIN}) AS margin, "
+            f"COUNT(DISTINCT od.OrderID) AS order_count, COUNT(*) AS line_count "
+            f"FROM \"Order Details\" od LEFT JOIN Orders o ON o.OrderID = od.OrderID GROUP BY {group}",
+            f"CREATE INDEX {table}_date ON {table}(OrderDate)",
+        ]
+        if grain:
+            statements.append(f"CREATE INDEX {table}_{grain[0].lower()} ON {table}({grain[0]}, OrderDate)")
+
+    statements += [
+        "CREATE TABLE IF NOT EXISTS rollup_meta (version INTEGER NOT NULL, dirty INTEGER NOT NULL)",
+        "DELETE FROM rollup_meta",
+        f"INSERT INTO rollup_meta (version, dirty) VALUES ({ROLLUP_VERSION}, 0)",
+    ]
+    for base, name in (("Orders", "orders"), ('"Order Details"', "order_details")):
+        for op in ("INSERT", "UPDATE", "DELETE"):
+            statements.append(
+                f"CREATE TRIGGER IF NOT EXISTS rollup_dirty_{name}_{op.lower()} AFTER {op} ON {base} "
+                f"BEGIN UPDATE rollup_meta SET dirty = 1; END"
+            )
+    return statements
+
+# --- Rewriter ---
+
+# Role of each table the rewriter understands (views and base names)
+TABLE_ROLES = {
+    "orders": "o", "order_items": "oi", "order details": "oi",
+    "products": "p", "categories": "cat", "customers": "c",
+}
+
+# Join conditions the rollups preserve, as {(role, column), (role, column)}
+_JOIN_KEYS = [
+    {("o", "orderid"), ("oi", "orderid")},
+    {("oi", "productid"), ("p", "productid")},
+    {("p", "categoryid"), ("cat", "categoryid")},
+    {("o", "customerid"), ("c", "customerid")},
+]
+
+# Fact columns that survive aggregation: role, column -> rollup column
+_GRAIN_COLUMNS = {("o", "orderdate"): "OrderDate", ("o", "customerid"): "CustomerID", ("oi", "productid"): "ProductID"}
+
+# SUM() arguments as multisets of multiplied factors (see _factors)
+_MEASURES = {
+    "revenue": sorted(["oi.unitprice", "oi.quantity", "1.0 - oi.discount"]),
+    "margin": sorted(["oi.unitprice", "0.3", "oi.quantity", "1.0 - oi.discount"]),
+    "quantity": ["oi.quantity"],
+}
+
+_AGGREGATES = {"sum", "count", "avg", "min", "max", "total", "group_concat"}
+
+_CLAUSES = ("select", "from", "where", "group", "having", "order", "limit")
+
+# Anything that changes join or set semantics is left to the raw tables
+_UNSUPPORTED = {"union", "except", "intersect", "with", "over", "window", "natural", "using",
+                "left", "right", "full", "outer", "cross", "recursive", "values", "filter"}
+
+def _clauses(tokens) -> Dict[str, Tuple[int, int]]:
+    """Top-level clause -> [start, end) token range of its body."""
+    starts = []
+    depth = 0
+    for i, (kind, text, _) in enumerate(tokens):
+        low = text.lower()
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1
+        elif depth == 0 and kind == WORD and low in _CLAUSES:
+            skip = 1
+            if low in ("group", "order"):
+                if i + 1 >= len(tokens) or tokens[i + 1][1].lower() != "by":
+                    raise UnsupportedSQL(f"{low} without by")
+                skip = 2
+            starts.append((low, i, i + skip))
+
+    names = [name for name, _, _ in starts]
+    if not names or names[0] != "select" or len(set(names)) != len(names) or \
+            names != sorted(names, key=_CLAUSES.index):
+        raise UnsupportedSQL("not a single SELECT")
+    clauses = {}
+    for k, (name, _, body) in enumerate(starts):
+        end = starts[k + 1][1] if k + 1 < len(starts) else len(tokens)
+        clauses[name] = (body, end)
+    return clauses
+
+class _Query:
+    """Token-level view of one eligible SELECT over the orders star schema."""
+
+    def __init__(self, sql: str, columns: Dict[str, Set[str]]):
+        self.sql = sql
+        self.columns = columns
+        self.tokens = sql_tokens(sql)
+        while self.tokens and self.tokens[-1][1] == ";":
+            self.tokens.pop()
+
+        words = [t[1].lower() for t in self.tokens if t[0] == WORD]
+        if words.count("select") != 1 or _UNSUPPORTED & set(words):
+            raise UnsupportedSQL("subquery or unsupported construct")
+        self.clauses = _clauses(self.tokens)
+        if "from" not in self.clauses:
+            raise UnsupportedSQL("no FROM")
+
+        self.aliases: Dict[str, str] = {}   # alias -> role
+        self.joins: List[dict] = []
+        self._parse_from()
+        self.refs = self._column_refs()    # token index -> (role, column, last token index)
+
+    def _text(self, a: int, b: int) -> str:
+        """Original SQL text of tokens [a, b]."""
+        end = self.tokens[b][2] + len(self.tokens[b][1])
+        return self.sql[self.tokens[a][2]:end]
+
+    def _qualified(self, i: int) -> Tuple[str, str]:
+        t = self.tokens
+        if i + 2 >= len(t) or t[i][0] not in (WORD, QUOTED) or t[i + 1][1] != "." \
+                or t[i + 2][0] not in (WORD, QUOTED):
+            raise UnsupportedSQL("expected alias.column in ON")
+        alias = identifier(t[i][0], t[i][1])
+        if alias not in self.aliases:
+            raise UnsupportedSQL(f"unknown alias {alias}")
+        return self.aliases[alias], identifier(t[i + 2][0], t[i + 2][1])
+
+    def _parse_from(self):
+        t = self.tokens
+        i, end = self.clauses["from"]
+        first = True
+        while i < end:
+            if not first:
+                if t[i][1].lower() == "inner":
+                    i += 1
+                if i >= end or t[i][1].lower() != "join":
+                    raise UnsupportedSQL("only [INNER] JOIN ... ON is supported")
+                i += 1
+
+            if i >= end or t[i][0] not in (WORD, QUOTED):
+                raise UnsupportedSQL("expected a table")
+            table = identifier(t[i][0], t[i][1])
+            role = TABLE_ROLES.get(table)
+            if role is None or role in self.aliases.values():
+                raise UnsupportedSQL(f"table {table}")
+            table_at = i
+            i += 1
+            alias, alias_at = table, None
+            if i < end and t[i][1].lower() == "as":
+                i += 1
+            if i < end and t[i][0] in (WORD, QUOTED) and t[i][1].lower() not in ("join", "inner", "on"):
+                alias, alias_at = identifier(t[i][0], t[i][1]), i
+                i += 1
+            self.aliases[alias] = role
+
+            join = {"role": role, "table": table_at, "alias": alias_at, "on": None}
+            if not first:
+                if i >= end or t[i][1].lower() != "on":
+                    raise UnsupportedSQL("JOIN without ON")
+                left = self._qualified(i + 1)
+                if i + 4 >= end or t[i + 4][1] != "=":
+                    raise UnsupportedSQL("ON must be a single equality")
+                right = self._qualified(i + 5)
+                pair = {left, right}
+                if pair not in _JOIN_KEYS or role not in (left[0], right[0]) or left[0] == right[0]:
+                    raise UnsupportedSQL("join is not a star-schema key join")
+                join["on"] = (i + 1, i + 7)
+                i += 8
+            self.joins.append(join)
+            first = False
+
+        if "oi" not in self.aliases.values():
+            raise UnsupportedSQL("no order lines")
+
+    def _column_refs(self) -> Dict[int, Tuple[str, str, int]]:
+        t = self.tokens
+        roles = set(self.aliases.values())
+        refs = {}
+        for name, (start, end) in self.clauses.items():
+            i = start
+            while i < end:
+                kind, text, _ = t[i]
+                prev = t[i - 1][1].lower() if i > 0 else ""
+                nxt = t[i + 1][1] if i + 1 < len(t) else ""
+                if kind in (WORD, QUOTED) and nxt == "." and prev != ".":
+                    alias = identifier(kind, text)
+                    if alias not in self.aliases or i + 2 >= end:
+                        raise UnsupportedSQL(f"unknown qualifier {alias}")
+                    refs[i] = (self.aliases[alias], identifier(t[i + 2][0], t[i + 2][1]), i + 2)
+                    i += 3
+                    continue
+                if kind in (WORD, QUOTED) and prev not in (".", "as") and nxt != "(" and name != "from":
+                    column = identifier(kind, text)
+                    owners = [r for r in roles if column in self.columns.get(r, set())]
+                    if len(owners) > 1:
+                        raise UnsupportedSQL(f"ambiguous column {column}")
+                    if owners:
+                        refs[i] = (owners[0], column, i)
+                i += 1
+        return refs
+
+    def canonical(self, a: int, b: int) -> List[str]:
+        """Tokens [a, b) with column refs as role.column and numbers as floats."""
+        out = []
+        i = a
+        while i < b:
+            if i in self.refs:
+                role, column, last = self.refs[i]
+                out.append(f"{role}.{column}")
+                i = last + 1
+                continue
+            kind, text, _ = self.tokens[i]
+            out.append(repr(float(text)) if kind == NUMBER else text.lower())
+            i += 1
+        return out
+
+def _strip_parens(toks: List[str]) -> List[str]:
+    while len(toks) >= 2 and toks[0] == "(":
+        depth = 0
+        for i, tok in enumerate(toks):
+            depth += tok == "("
+            depth -= tok == ")"
+            if depth == 0:
+                break
+        if i != len(toks) - 1:
+            break
+        toks = toks[1:-1]
+    return toks
+
+def _factors(toks: List[str]) -> List[str]:
+    """Flattens a pure product `a * (b * c)` into its factors; anything else is one factor."""
+    toks = _strip_parens(toks)
+    depth = 0
+    ops = set()
+    cuts = []
+    for i, tok in enumerate(toks):
+        if tok == "(":
+            depth += 1
+        elif tok == ")":
+            depth -= 1
+        elif depth == 0 and tok in ("*", "/", "+", "-", "%", "||"):
+            ops.add(tok)
+            if tok == "*":
+                cuts.append(i)
+    if ops != {"*"}:
+        return [" ".join(toks)]
+    factors = []
+    for a, b in zip([-1] + cuts, cuts + [len(toks)]):
+        factors += _factors(toks[a + 1:b])
+    return factors
+
+def _select_items(q: _Query) -> List[Tuple[int, int]]:
+    """Token ranges [a, b) of the SELECT list items."""
+    start, end = q.clauses["select"]
+    if start < end and q.tokens[start][1].lower() in ("distinct", "all"):
+        start += 1
+    items = []
+    depth = 0
+    a = start
+    for i in range(start, end):
+        text = q.tokens[i][1]
+        depth += text == "("
+        depth -= text == ")"
+        if depth == 0 and text == ",":
+            items.append((a, i))
+            a = i + 1
+    items.append((a, end))
+    return items
+
+def _has_alias(q: _Query, a: int, b: int) -> bool:
+    t = q.tokens
+    if b - a < 2 or t[b - 1][0] not in (WORD, QUOTED):
+        return False
+    before = t[b - 2]
+    return before[1].lower() == "as" or before[1] == ")" or (before[0] in (WORD, QUOTED) and before[1] != ".")
+
+def _fixes_single(q: _Query, identifying: Set[Tuple[str, str]]) -> bool:
+    """True if GROUP BY, or an `=` conjunct of WHERE, pins one of `identifying`."""
+    if "group" in q.clauses:
+        start, end = q.clauses["group"]
+        if any(q.refs[i][:2] in identifying for i in q.refs if start <= i < end):
+            return True
+    if "where" in q.clauses:
+        start, end = q.clauses["where"]
+        words = {q.tokens[i][1].lower() for i in range(start, end) if q.tokens[i][0] == WORD}
+        if "or" in words:
+            return False
+        for i in q.refs:
+            if start <= i < end and q.refs[i][:2] in identifying:
+                last = q.refs[i][2]
+                if last + 1 < end and q.tokens[last + 1][1] in ("=", "=="):
+                    return True
+    return False
+
+def rewrite_for_rollups(sql: str, columns: Dict[str, Set[str]],
+                        unique_columns: Optional[Dict[str, Set[str]]] = None) -> Optional[Tuple[str, str]]:
+    """
+    Rewrites an aggregate query over orders / order_items (joined to products,
+    categories or customers on their keys) onto the matching rollup table.
+    Returns (rewritten SQL, rollup table), or None when the query is not
+    provably equivalent on the rollup and must run on the raw tables.
+
+    Supported measures: SUM of revenue, margin (70% cost) and quantity as
+    TextToSQL writes them, and COUNT(DISTINCT OrderID). `columns` maps each
+    role ("o", "oi", "p", "cat", "c") to its lowercase column names;
+    `unique_columns` lists product columns that identify a product.
+    """
+    try:
+        return _rewrite(_Query(sql, columns), unique_columns or {})
+    except UnsupportedSQL:
+        return None
+
+def _rewrite(q: _Query, unique_columns: Dict[str, Set[str]]) -> Tuple[str, str]:
+    t = q.tokens
+    roles = set(q.aliases.values())
+
+    spans: List[Tuple[int, int, str]] = []  # (first token, last token, replacement)
+    covered: Set[int] = set()
+    order_counts = False
+
+    for i, (kind, text, _) in enumerate(t):
+        if kind != WORD or text.lower() not in _AGGREGATES or i + 1 >= len(t) or t[i + 1][1] != "(":
+            continue
+        close = closing_paren(t, i + 1)
+        name = text.lower()
+        arg = q.canonical(i + 2, close)
+        if name == "sum" and arg and arg[0] != "distinct":
+            factors = sorted(_factors(arg))
+            measure = next((m for m, f in _MEASURES.items() if f == factors), None)
+            if measure is None:
+                raise UnsupportedSQL("SUM of something other than a rollup measure")
+            replacement = f"SUM({_ROLLUP_ALIAS}.{measure})"
+        elif name == "count" and arg in (["distinct", "o.orderid"], ["distinct", "oi.orderid"]):
+            replacement = f"COALESCE(SUM({_ROLLUP_ALIAS}.order_count), 0)"
+            order_counts = True
+        else:
+            raise UnsupportedSQL(f"aggregate {name}")
+        spans.append((i, close, replacement))
+        covered.update(range(i, close + 1))
+
+    # Fact columns outside aggregates must be part of the rollup grain
+    grain_refs = {}
+    for i, (role, column, last) in q.refs.items():
+        if i in covered or role not in ("o", "oi"):
+            continue
+        if (role, column) in _GRAIN_COLUMNS:
+            grain_refs[i] = (last, _GRAIN_COLUMNS[(role, column)])
+        elif not (column == "orderid" and any(j["on"] and j["on"][0] <= i <= j["on"][1] for j in q.joins)):
+            raise UnsupportedSQL(f"fact column {role}.{column}")
+
+    grains = {column for _, column in grain_refs.values()}
+    by_product = "p" in roles or "ProductID" in grains
+    by_customer = "c" in roles or "CustomerID" in grains
+    if by_product and by_customer:
+        raise UnsupportedSQL("no rollup by product and customer")
+    table = "rollup_product_daily" if by_product else "rollup_customer_daily" if by_customer else "rollup_daily"
+
+    if order_counts and by_product:
+        # An order spans several products: per-product counts only add up
+        # when every output row is about a single product
+        identifying = {("oi", "productid"), ("p", "productid")}
+        identifying |= {("p", c) for c in unique_columns.get("p", set())}
+        if not _fixes_single(q, identifying):
+            raise UnsupportedSQL("order count across products")
+    if _ROLLUP_ALIAS in q.aliases:
+        raise UnsupportedSQL("alias clash")
+
+    # FROM: the rollup plus the dimension joins, rebuilt on their keys (the
+    # original ON conditions were checked to be exactly these joins)
+    dims = {}
+    for join in q.joins:
+        table_text = t[join["table"]][1]
+        alias = t[join["alias"]][1] if join["alias"] is not None else None
+        dims[join["role"]] = (table_text, alias, alias or table_text)
+    from_sql = f"{table} {_ROLLUP_ALIAS}"
+    for role, key, parent in (("p", "ProductID", _ROLLUP_ALIAS), ("cat", "CategoryID", "p"), ("c", "CustomerID", _ROLLUP_ALIAS)):
+        if role in dims:
+            table_text, alias, name = dims[role]
+            parent_name = dims[parent][2] if parent in dims else parent
+            from_sql += f" JOIN {table_text}{' ' + alias if alias else ''} ON {name}.{key} = {parent_name}.{key}"
+
+    # Lines whose order is missing only count when the query does not join orders
+    where_filter = f"{_ROLLUP_ALIAS}.has_order = 1" if "o" in roles else None
+    if where_filter and "where" not in q.clauses:
+        from_sql += f" WHERE {where_filter}"
+    from_start, from_end = q.clauses["from"]
+    spans.append((from_start, from_end - 1, from_sql))
+    covered.update(range(from_start, from_end))
+
+    for i, (last, column) in grain_refs.items():
+        if i not in covered:
+            spans.append((i, last, f"{_ROLLUP_ALIAS}.{column}"))
+
+    # Character-level edits: (start, end, text); start == end is an insertion
+    edits = [(t[a][2], t[b][2] + len(t[b][1]), text) for a, b, text in spans]
+
+    # Unaliased expressions keep the column label SQLite derives from their text
+    for a, b in _select_items(q):
+        if a >= b or _has_alias(q, a, b):
+            continue
+        if t[a][1] == "*":
+            raise UnsupportedSQL("SELECT *")
+        bare = a in q.refs and q.refs[a][2] == b - 1
+        if not bare and any(a <= first <= b - 1 for first, _, _ in spans):
+            label = q._text(a, b - 1).replace('"', '""')
+            end = t[b - 1][2] + len(t[b - 1][1])
+            edits.append((end, end, f' AS "{label}"'))
+
+    if where_filter and "where" in q.clauses:
+        w_start, w_end = q.clauses["where"]
+        edits.append((t[w_start][2], t[w_start][2], f"{where_filter} AND ("))
+        end = t[w_end - 1][2] + len(t[w_end - 1][1])
+        edits.append((end, end, ")"))
+
+    # Insertions sort before a replacement starting at the same offset
+    edits.sort(key=lambda e: (e[0], e[1]))
+    out = []
+    pos = 0
+    for start, end, text in edits:
+        if start < pos:
+            raise UnsupportedSQL("overlapping edits")
+        out.append(q.sql[pos:start] + text)
+        pos = end
+    last = t[-1][2] + len(t[-1][1])
+    out.append(q.sql[pos:max(pos, last)])
+    return "".join(out), table
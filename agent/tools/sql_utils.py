@@ -0,0 +1,124 @@
+import re
+from typing import List, Tuple
+
+# Token kinds produced by tokenize_sql
+WS, COMMENT, STRING, QUOTED, NUMBER, WORD, PUNCT = (
+    "ws", "comment", "string", "quoted", "number", "word", "punct"
+)
+
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?(?:\*/|$))
+  | (?P<string>'(?:[^']|'')*'?)
+  | (?P<quoted>"(?:[^"]|"")*"?|\[[^\]]*\]?|`(?:[^`]|``)*`?)
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<punct><>|<=|>=|!=|==|\|\||.)
+""", re.VERBOSE | re.DOTALL)
+
+# Words that can follow a table reference but are never its alias
+_NOT_ALIAS = {
+    "on", "using", "where", "group", "order", "limit", "having", "window", "union",
+    "except", "intersect", "join", "inner", "left", "right", "full", "outer", "cross",
+    "natural", "indexed", "not", "as", "offset", "returning",
+}
+
+# Clauses that end a FROM list
+_FROM_END = {"where", "group", "order", "limit", "having", "window", "union", "except", "intersect", "on", "using"}
+
+def tokenize_sql(sql: str) -> List[Tuple[str, str]]:
+    """Splits SQL into (kind, text) tokens; string literals and comments stay intact."""
+    return [(m.lastgroup, m.group()) for m in _TOKEN_RE.finditer(sql)]
+
+def identifier(kind: str, text: str) -> str:
+    """Case-folded identifier name for WORD / QUOTED tokens."""
+    if kind == QUOTED:
+        text = text[1:-1]
+    return text.lower()
+
+class UnsupportedSQL(Exception):
+    """A construct the SQL rewriters do not handle; they leave the query as written."""
+
+def sql_tokens(sql: str) -> List[Tuple[str, str, int]]:
+    """Non-whitespace tokens with their character offsets."""
+    out = []
+    pos = 0
+    for kind, text in tokenize_sql(sql):
+        if kind not in (WS, COMMENT):
+            out.append((kind, text, pos))
+        pos += len(text)
+    return out
+
+def closing_paren(tokens: List[Tuple[str, str, int]], i: int) -> int:
+    """Index of the ')' closing the '(' at i."""
+    depth = 0
+    for j in range(i, len(tokens)):
+        if tokens[j][1] == "(":
+            depth += 1
+        elif tokens[j][1] == ")":
+            depth -= 1
+            if depth == 0:
+                return j
+    raise UnsupportedSQL("unbalanced parentheses")
+
+def _table_aliases(tokens: List[Tuple[str, str]]) -> List[str]:
+    """Aliases declared after FROM / JOIN / ',' in a FROM list, in order of appearance."""
+    aliases = []
+    in_from = False
+    i = 0
+    while i < len(tokens):
+        kind, text = tokens[i]
+        low = text.lower()
+        if kind == WORD and low in ("from", "join"):
+            in_from = True
+        elif kind == WORD and low in _FROM_END:
+            in_from = False
+        elif kind == PUNCT and text in ("(", ")"):
+            in_from = in_from and text == ")"
+        elif in_from and kind in (WORD, QUOTED) and i > 0 and (
+            tokens[i - 1][1].lower() in ("from", "join") or tokens[i - 1][1] == ","
+        ):
+            # Table name, optionally schema-qualified, then [AS] alias
+            j = i + 1
+            while j + 1 < len(tokens) and tokens[j][1] == "." and tokens[j + 1][0] in (WORD, QUOTED):
+                j += 2
+            if j < len(tokens) and tokens[j][0] == WORD and tokens[j][1].lower() == "as":
+                j += 1
+            if j < len(tokens) and tokens[j][0] in (WORD, QUOTED):
+                alias = identifier(*tokens[j])
+                if alias not in _NOT_ALIAS and alias not in aliases:
+                    aliases.append(alias)
+            i = j
+        i += 1
+    return aliases
+
+def normalize_sql(sql: str) -> str:
+    """
+    Canonical form of a query for cache keys: comments and redundant whitespace
+    dropped, keywords and identifiers case-folded, table aliases renamed to
+    positional names (`orders o` and `orders AS ord` both become `orders _a1`),
+    trailing semicolons removed. String literals are kept byte-for-byte.
+    """
+    tokens = [t for t in tokenize_sql(sql) if t[0] not in (WS, COMMENT)]
+    while tokens and tokens[-1][1] == ";":
+        tokens.pop()
+
+    renames = {alias: f"_a{i + 1}" for i, alias in enumerate(_table_aliases(tokens))}
+
+    out = []
+    for i, (kind, text) in enumerate(tokens):
+        if kind in (WORD, QUOTED):
+            name = identifier(kind, text)
+            prev = tokens[i - 1][1].lower() if i > 0 else ""
+            nxt = tokens[i + 1][1] if i + 1 < len(tokens) else ""
+            is_qualifier = nxt == "." and prev != "."
+            is_declaration = prev == "as" or (i > 0 and tokens[i - 1][0] in (WORD, QUOTED) and prev not in _NOT_ALIAS)
+            if name in renames and (is_qualifier or is_declaration):
+                if prev == "as" and out and out[-1] == "as":
+                    out.pop()  # `orders AS o` and `orders o` are the same
+                out.append(renames[name])
+                continue
+            out.append(f'"{name}"' if kind == QUOTED else name)
+        else:
+            out.append(text)
+    return " ".join(out)
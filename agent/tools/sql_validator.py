@@ -0,0 +1,223 @@
+import difflib
+from typing import Dict, List, Optional, Tuple
+
+from agent.tools.sql_utils import tokenize_sql, WS, COMMENT, QUOTED, WORD, identifier
+
+# Statements the agent may run: a single query
+_QUERY_STARTS = {"select", "with", "values"}
+
+# Keywords that only appear in statements that write or change the database
+_WRITE_KEYWORDS = {"insert", "update", "delete", "drop", "alter", "create", "attach", "detach",
+                   "pragma", "vacuum", "reindex", "analyze", "savepoint", "release", "rollback", "commit", "begin"}
+
+# Not table aliases when they follow a table name
+_NOT_ALIAS = {"on", "using", "where", "group", "order", "limit", "having", "window", "union", "except",
+              "intersect", "join", "inner", "left", "right", "full", "outer", "cross", "natural", "indexed",
+              "not", "as", "offset"}
+
+_ROWID = {"rowid", "oid", "_rowid_"}
+
+UNSAFE_QUERY = "Error: Unsafe query detected. Only SELECT is allowed."
+
+def check_statement(sql: str) -> Tuple[Optional[str], str]:
+    """
+    (error, statement): the query must be exactly one SELECT / WITH / VALUES
+    statement without any write keyword. Works on tokens, so keywords inside
+    string literals or quoted names ("LastUpdate") do not trip it. The
+    statement comes back without surrounding whitespace / trailing ';'.
+    """
+    tokens = tokenize_sql(sql)
+    significant = [i for i, (kind, _) in enumerate(tokens) if kind not in (WS, COMMENT)]
+    while significant and tokens[significant[-1]][1] == ";":
+        significant.pop()
+    if not significant:
+        return "Error: Empty query.", ""
+
+    statement = "".join(text for _, text in tokens[:significant[-1] + 1]).strip()
+    words = [tokens[i][1].lower() for i in significant if tokens[i][0] == WORD]
+    if any(tokens[i][1] == ";" for i in significant):
+        return "Error: Multiple statements detected. Send a single SELECT query.", statement
+    if tokens[significant[0]][1].lower() not in _QUERY_STARTS or _WRITE_KEYWORDS.intersection(words) or \
+            any(a == "replace" and b == "into" for a, b in zip(words, words[1:])):
+        return UNSAFE_QUERY, statement
+    return None, statement
+
+def _suggest(name: str, options: List[str]) -> str:
+    match = difflib.get_close_matches(name.lower(), [o.lower() for o in options], n=1, cutoff=0.6)
+    if not match:
+        return ""
+    original = next(o for o in options if o.lower() == match[0])
+    return f" Did you mean '{original}'?"
+
+class _References:
+    """Tables, aliases, CTEs and column references of a query (all scopes flattened)."""
+
+    def __init__(self, sql: str):
+        self.tokens = [(k, t) for k, t in tokenize_sql(sql) if k not in (WS, COMMENT)]
+        self.tables: List[Tuple[str, Optional[str]]] = []  # (table, alias)
+        self.derived: set = set()  # aliases of subqueries / CTE names
+        self.select_aliases: set = set()
+        self.has_subquery = False
+        self.uses_using = False
+        self._parse()
+
+    def _parse(self):
+        tokens = self.tokens
+        clause = [None]  # per parenthesis depth
+        for i, (kind, text) in enumerate(tokens):
+            low = text.lower()
+            prev = tokens[i - 1][1].lower() if i > 0 else ""
+            nxt = tokens[i + 1][1].lower() if i + 1 < len(tokens) else ""
+            if text == "(":
+                clause.append(None)
+                if nxt in ("select", "with", "values"):
+                    self.has_subquery = True
+                continue
+            if text == ")":
+                if len(clause) > 1:
+                    clause.pop()
+                # `(subquery) [AS] alias` in a FROM list
+                j = i + 1
+                if nxt == "as":
+                    j += 1
+                if clause[-1] == "from" and j < len(tokens) and tokens[j][0] in (WORD, QUOTED) and \
+                        tokens[j][1].lower() not in _NOT_ALIAS:
+                    self.derived.add(identifier(*tokens[j]))
+                continue
+            if kind != WORD and kind != QUOTED:
+                continue
+            if kind == WORD and low in ("select", "where", "group", "order", "having", "limit", "on"):
+                clause[-1] = low
+            elif kind == WORD and low in ("from", "join"):
+                clause[-1] = "from"
+            elif kind == WORD and low in ("using", "natural"):
+                self.uses_using = True
+            # CTE name: `name [(cols)] AS (`
+            if nxt in ("as", "(") and prev in ("with", "recursive", ",") and clause[-1] is None:
+                self.derived.add(identifier(kind, text))
+            # Output alias: `expr AS name` in a select list
+            if prev == "as" and clause[-1] == "select":
+                self.select_aliases.add(identifier(kind, text))
+            # Table reference after FROM / JOIN / ','
+            if clause[-1] == "from" and prev in ("from", "join", ",") and nxt != "(" and \
+                    not (kind == WORD and low in ("select", "lateral")):
+                j = i + 1
+                if j + 1 < len(tokens) and tokens[j][1] == ".":  # schema.table
+                    continue
+                if j < len(tokens) and tokens[j][1].lower() == "as":
+                    j += 1
+                alias = None
+                if j < len(tokens) and tokens[j][0] in (WORD, QUOTED) and tokens[j][1].lower() not in _NOT_ALIAS:
+                    alias = identifier(*tokens[j])
+                self.tables.append((identifier(kind, text), alias))
+
+    def qualified_columns(self) -> List[Tuple[str, str, str]]:
+        """(qualifier, column, text) for every `a.b` reference."""
+        out = []
+        tokens = self.tokens
+        for i in range(len(tokens) - 2):
+            if tokens[i][0] in (WORD, QUOTED) and tokens[i + 1][1] == "." and tokens[i + 2][0] in (WORD, QUOTED) \
+                    and (i == 0 or tokens[i - 1][1] != "."):
+                if i + 3 < len(tokens) and tokens[i + 3][1] == ".":
+                    continue  # schema.table.column
+                out.append((identifier(*tokens[i]), identifier(*tokens[i + 2]),
+                            f"{tokens[i][1]}.{tokens[i + 2][1]}"))
+        return out
+
+    def unqualified_words(self) -> List[str]:
+        """Bare identifiers that could be column references."""
+        out = []
+        tokens = self.tokens
+        for i, (kind, text) in enumerate(tokens):
+            if kind not in (WORD, QUOTED):
+                continue
+            prev = tokens[i - 1][1] if i > 0 else ""
+            nxt = tokens[i + 1][1] if i + 1 < len(tokens) else ""
+            if prev == "." or nxt in (".", "("):
+                continue
+            out.append(identifier(kind, text))
+        return out
+
+def referenced_tables(sql: str) -> List[Tuple[str, Optional[str]]]:
+    """(table, alias) for every table a query reads, lower-case, alias None when there is none."""
+    return _References(sql).tables
+
+def check_references(sql: str, catalog: Dict[str, List[str]]) -> List[str]:
+    """
+    Diagnostics for names the schema does not have: unknown tables, unknown
+    `alias.column` references and bare column names that exist in more than
+    one joined table. `catalog` maps lower-case table/view names to their
+    column names. Only reports what is certain; anything else is left to
+    SQLite's own compile step (EXPLAIN).
+    """
+    refs = _References(sql)
+    problems = []
+    bound: Dict[str, str] = {}  # name used in the query (alias or table) -> table
+
+    for table, alias in refs.tables:
+        if table in refs.derived:
+            if alias:
+                refs.derived.add(alias)
+            continue
+        if table not in catalog:
+            problems.append(f"Unknown table '{table}'.{_suggest(table, list(catalog))}")
+            continue
+        bound[alias or table] = table
+
+    for qualifier, column, text in refs.qualified_columns():
+        if qualifier in refs.derived:
+            continue
+        if qualifier not in bound:
+            if any(qualifier == t for t, _ in refs.tables):
+                if qualifier in catalog:
+                    problems.append(f"'{qualifier}' is aliased in this query, use its alias in {text}.")
+                continue  # unknown table, already reported
+            problems.append(f"Unknown table or alias '{qualifier}' in {text}." +
+                            (f" Available: {', '.join(sorted(bound))}." if bound else ""))
+            continue
+        columns = catalog[bound[qualifier]]
+        if column == "*" or column in _ROWID or column in (c.lower() for c in columns):
+            continue
+        hint = _suggest(column, columns)
+        if hint:
+            hint = hint.replace("'", f"'{text.split('.')[0]}.", 1)
+        else:
+            hint = f" {bound[qualifier]} has: {', '.join(columns)}."
+        problems.append(f"Unknown column {text}.{hint}")
+
+    # Bare names present in several joined tables (SQLite would refuse them)
+    if not refs.has_subquery and not refs.uses_using and not refs.derived:
+        seen = set()
+        for word in refs.unqualified_words():
+            if word in seen or word in refs.select_aliases or word in bound:
+                continue
+            owners = {name: next(c for c in catalog[table] if c.lower() == word)
+                      for name, table in bound.items() if word in (c.lower() for c in catalog[table])}
+            if len(owners) > 1:
+                seen.add(word)
+                names = sorted(owners)
+                problems.append(f"Ambiguous column '{owners[names[0]]}' (in {', '.join(names)}): qualify it, "
+                                f"e.g. {names[0]}.{owners[names[0]]}.")
+    return problems
+
+def explain_diagnostic(error: str, sql: str, catalog: Dict[str, List[str]]) -> str:
+    """An SQLite compile error with a 'Did you mean' hint from the schema where possible."""
+    refs = _References(sql)
+    if error.startswith("no such table: "):
+        name = error[len("no such table: "):]
+        return error + "." + _suggest(name.split(".")[-1], list(catalog))
+    if error.startswith("no such column: "):
+        name = error[len("no such column: "):]
+        tables = [t for t, _ in refs.tables if t in catalog] or list(catalog)
+        columns = sorted({c for t in tables for c in catalog[t]})
+        hint = _suggest(name.split(".")[-1], columns)
+        if not hint and len(columns) <= 40:
+            hint = f" Available columns: {', '.join(columns)}."
+        return error + "." + hint
+    if error.startswith("ambiguous column name: "):
+        name = error[len("ambiguous column name: "):].lower()
+        owners = [alias or table for table, alias in refs.tables
+                  if table in catalog and name in (c.lower() for c in catalog[table])]
+        if owners:
+            return f"{error}. Qualify it with one of: {', '.join(f'{o}.{name}' for o in owners)}."
+    return error
@@ -1,12 +1,249 @@
+import os
 import sqlite3
-import pandas as pd
-from typing import List, Dict, Any, Union
+import threading
+import time
+from contextlib import closing, contextmanager
+from urllib.parse import quote
+from typing import List, Dict, Any, Optional, Tuple, Union, TypedDict
+
+from agent.tools.query_log import QueryLog
+from agent.tools.result_cache import SQLResultCache
+from agent.tools.sql_rewrite import ROLLUP_VERSION, ROLLUPS, TABLE_ROLES, rollup_statements, rewrite_for_rollups
+from agent.tools.schema_linker import SchemaLink, link_schema
+from agent.tools.sql_validator import check_statement, check_references, explain_diagnostic, referenced_tables
+from agent.tools.sql_guard import (
+    GUARD_CANCELLED, GUARD_COST, GUARD_STEPS, GUARD_TIMEOUT, estimate_plan_cost, guard_error, guard_kind
+)
+from agent.tools.sql_dates import (
+    DATE_DIMENSION_VERSION, canonical_date_check, date_dimension_statements, parse_campaigns, rewrite_date_predicates
+)
+
+class QueryResult(TypedDict):
+    """Compact result of a query: column names once, then plain row lists."""
+    columns: List[str]
+    rows: List[list]
+    row_count: int
+    truncated: bool
+
+def to_records(result: QueryResult) -> List[Dict[str, Any]]:
+    """Expands a QueryResult into the list-of-dicts shape used by the parser."""
+    columns = result["columns"]
+    return [dict(zip(columns, row)) for row in result["rows"]]
+
+# Tables exposed to the LLM, mapped to the Northwind tables behind the views
+SCHEMA_TABLES = {
+    'orders': 'Orders',
+    'order_items': 'Order Details',
+    'products': 'Products',
+    'customers': 'Customers',
+    'categories': 'Categories',
+}
+
+SCHEMA_LEVELS = ("names", "types", "full")
+
+# Text columns with at most this many distinct values are indexed for the schema linker
+_LINK_VALUES_MAX = 30
+
+# SQLite VM instructions between two progress-handler calls
+_PROGRESS_INTERVAL = 10_000
+
+# A rollup is only queried when it has at most this many rows per "Order Details" line;
+# above that it compresses too little to beat the indexed join of the base tables
+_ROLLUP_MAX_RATIO = 0.5
+
+def _row_size(row) -> int:
+    # Rough in-memory footprint, only used to enforce max_bytes
+    return sum(len(v) if isinstance(v, (str, bytes)) else 8 for v in row)
+
+class CancelToken:
+    """
+    Cancels one run_query call from another thread: pass it to run_query and
+    call cancel(). Only the connection running that call is interrupted; other
+    queries on the same tool keep running.
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self._lock = threading.Lock()
+        self._running = None  # (tool, connection) while the query executes
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            if self._running is not None:
+                tool, conn = self._running
+                tool.interrupt(conn)
+
+    def _bind(self, running):
+        with self._lock:
+            self._running = running
+
+class ConnectionPool:
+    """
+    A bounded pool of read-only SQLite connections that can be shared by
+    concurrent agent workers (threads or asyncio.to_thread calls).
+
+    Connections are opened lazily in URI mode (`mode=ro`, optionally
+    `immutable=1`), memory-map the database file and keep a per-connection
+    prepared-statement cache, so repeated queries skip both the connect and
+    the schema parse.
+    """
+
+    def __init__(self, db_path: str, size: int = 4, immutable: bool = True,
+                 mmap_size: int = 256 * 1024 * 1024, cached_statements: int = 256,
+                 timeout: float = 30.0):
+        self.db_path = db_path
+        self.size = size
+        self.immutable = immutable
+        self.mmap_size = mmap_size
+        self.cached_statements = cached_statements
+        self.timeout = timeout
+
+        self._idle: List[sqlite3.Connection] = []  # LIFO: the most recently used connection first
+        self._opened = 0
+        self._lock = threading.Lock()
+        # Signalled whenever a connection is handed back or a slot frees up
+        self._available = threading.Condition(self._lock)
+        # Bumped by close(): connections of an older generation are closed when handed back
+        self._generation = 0
+        self._generations: Dict[sqlite3.Connection, int] = {}
+
+    def _uri(self) -> str:
+        path = quote(os.path.abspath(self.db_path))
+        uri = f"file:{path}?mode=ro"
+        if self.immutable:
+            # The DB is never written while the pool is open (views are created
+            # beforehand), so SQLite can skip locking and change detection.
+            uri += "&immutable=1"
+        return uri
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self._uri(),
+            uri=True,
+            check_same_thread=False,  # a connection is only used by one thread at a time
+            cached_statements=self.cached_statements,
+        )
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        deadline = time.monotonic() + self.timeout
+        with self._available:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if self._opened < self.size:
+                    self._opened += 1
+                    try:
+                        conn = self._connect()
+                    except Exception:
+                        self._opened -= 1
+                        self._available.notify()
+                        raise
+                    self._generations[conn] = self._generation
+                    return conn
+                # Pool exhausted: wait for another worker to hand a connection back
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RuntimeError(
+                        f"Connection pool exhausted: all {self.size} connections busy for {self.timeout:g}s"
+                    )
+                self._available.wait(remaining)
+
+    def _release(self, conn: sqlite3.Connection):
+        with self._available:
+            stale = self._generations.get(conn) != self._generation
+            if stale:
+                # Frees a slot: a waiter opens a fresh connection instead
+                self._generations.pop(conn, None)
+                self._opened -= 1
+            else:
+                self._idle.append(conn)
+            self._available.notify()
+        if stale:
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        """Borrows a connection for the duration of the `with` block."""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    def close(self):
+        """
+        Closes idle connections, and busy ones once they are handed back; the
+        pool reopens lazily on next use.
+        """
+        with self._available:
+            self._generation += 1
+            idle, self._idle = self._idle, []
+            for conn in idle:
+                self._generations.pop(conn, None)
+                conn.close()
+                self._opened -= 1
+            self._available.notify_all()
 
 class SQLiteTool:
-    def __init__(self, db_path: str = "data/northwind.sqlite"):
+    def __init__(self, db_path: str = "data/northwind.sqlite", pool_size: int = 4,
+                 max_rows: int = 1000, max_bytes: int = 1_000_000, fetch_size: int = 256,
+                 result_cache: Optional[SQLResultCache] = None, rollups: bool = False,
+                 query_log: Optional[QueryLog] = None, date_dimension: bool = False,
+                 sargable_dates: bool = True, calendar_path: Optional[str] = "docs/marketing_calendar.md",
+                 timeout_s: Optional[float] = 10.0, max_vm_steps: Optional[int] = 500_000_000,
+                 max_plan_cost: Optional[int] = 20_000_000):
         self.db_path = db_path
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.fetch_size = fetch_size
+        # Execution guard: wall clock / VM steps per query, estimated plan cost before running
+        self.timeout_s = timeout_s
+        self.max_vm_steps = max_vm_steps
+        self.max_plan_cost = max_plan_cost
+        self._running: set = set()
+        self._running_lock = threading.Lock()
+        self._row_counts: Dict[str, int] = {}
+        self._row_counts_identity = None
+        self.result_cache = result_cache
+        self.query_log = query_log
         self._init_views() # Auto-create simpler views
 
+        # KPI rollups (see agent.tools.sql_rewrite), built before the read-only pool opens
+        self._rollup_lock = threading.Lock()
+        self._rollup_identity = None
+        self._rollup_ready = False
+        self._rollup_columns: Dict[str, set] = {}
+        self._rollup_unique: Dict[str, set] = {}
+        self._rollup_compact: set = set()
+        self.rollup_sizes: Dict[str, int] = {}
+        self.rollup_rewrites = 0
+        if rollups:
+            self._init_rollups()
+
+        # strftime predicates rewritten into ranges (read-only), and dim_date + the
+        # OrderDate index written into the database only when asked (see agent.tools.sql_dates)
+        self.sargable_dates = sargable_dates
+        self._date_lock = threading.Lock()
+        self._date_identity = None
+        self._date_columns: set = set()
+        self.date_rewrites = 0
+        if date_dimension:
+            self._init_date_dimension(calendar_path)
+
+        self.pool = ConnectionPool(db_path, size=pool_size)
+        self._pool_identity = self._db_identity()
+
+        # Introspected schema + rendered strings, keyed on (file identity, schema_version)
+        self._schema_lock = threading.Lock()
+        self._schema_key = None
+        self._schema_tables: Dict[str, Dict[str, Any]] = {}
+        self._schema_rendered: Dict[str, str] = {}
+        self._schema_catalog: Dict[str, List[str]] = {}
+        self._schema_fks: List[tuple] = []
+
     def _init_views(self):
         """
         Creates lowercase views as suggested in the assignment.
@@ -27,50 +264,564 @@ class SQLiteTool:
         except Exception as e:
             print(f"Warning: Could not create views: {e}")
 
-    def execute_query(self, query: str) -> Union[List[Dict[str, Any]], str]:
+    def _init_rollups(self, rebuild: bool = False):
         """
-        Executes a read-only SQL query and returns results.
+        Builds the rollup tables if they are missing, outdated or marked dirty
+        by the base-table triggers, then records the column names the
+        rewriter needs to resolve unqualified references.
         """
-        forbidden = ["UPDATE", "DELETE", "DROP", "INSERT", "ALTER"]
-        if any(cmd in query.upper() for cmd in forbidden):
-            return f"Error: Unsafe query detected. Only SELECT is allowed."
+        try:
+            with closing(sqlite3.connect(self.db_path)) as conn:
+                meta = None
+                if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'rollup_meta'").fetchone():
+                    meta = conn.execute("SELECT version, dirty FROM rollup_meta").fetchone()
+                if rebuild or meta != (ROLLUP_VERSION, 0):
+                    print("📦 Building KPI rollup tables...")
+                    with conn:
+                        for sql in rollup_statements():
+                            conn.execute(sql)
+
+                columns = {}
+                for table, role in TABLE_ROLES.items():
+                    rows = conn.execute(f"PRAGMA table_info('{table}')").fetchall()
+                    if rows:
+                        columns[role] = {row[1].lower() for row in rows}
+
+                # Product columns that identify one product (for per-product order counts)
+                unique = set()
+                for name in columns.get("p", ()):
+                    total, distinct = conn.execute(
+                        f'SELECT COUNT("{name}"), COUNT(DISTINCT "{name}") FROM Products'
+                    ).fetchone()
+                    if total and total == distinct == conn.execute("SELECT COUNT(*) FROM Products").fetchone()[0]:
+                        unique.add(name)
 
+                # Row count of each rollup against the order lines it summarizes
+                lines = conn.execute('SELECT COUNT(*) FROM "Order Details"').fetchone()[0]
+                sizes = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in ROLLUPS}
+                compact = {table for table, rows in sizes.items() if rows <= _ROLLUP_MAX_RATIO * lines}
+
+            with self._rollup_lock:
+                self._rollup_columns = columns
+                self._rollup_unique = {"p": unique}
+                self._rollup_compact = compact
+                self.rollup_sizes = {**sizes, "Order Details": lines}
+                self._rollup_identity = self._db_identity()
+                self._rollup_ready = True
+        except Exception as e:
+            print(f"Warning: Could not build rollup tables: {e}")
+            self._rollup_ready = False
+
+    def refresh_rollups(self):
+        """Rebuilds the rollups from the base tables (e.g. after loading new orders)."""
+        self._init_rollups(rebuild=True)
+        if hasattr(self, "pool"):
+            self.pool.close()
+
+    def _rollups_usable(self) -> bool:
+        """False once the base tables changed after the last build (dirty flag)."""
+        if not self._rollup_columns:
+            return False
+        identity = self._db_identity()
+        with self._rollup_lock:
+            if identity != self._rollup_identity:
+                uri = f"file:{quote(os.path.abspath(self.db_path))}?mode=ro"
+                with closing(sqlite3.connect(uri, uri=True)) as conn:
+                    meta = conn.execute("SELECT version, dirty FROM rollup_meta").fetchone()
+                ready = meta == (ROLLUP_VERSION, 0)
+                if self._rollup_ready and not ready:
+                    print("Warning: Base tables changed, rollups disabled until refresh_rollups()")
+                self._rollup_ready = ready
+                self._rollup_identity = identity
+            return self._rollup_ready
+
+    def _init_date_dimension(self, calendar_path: Optional[str]):
+        """
+        Builds dim_date over the years of Orders.OrderDate, tagged with the
+        campaigns of the marketing calendar, unless an up-to-date one exists.
+        """
+        campaigns = []
+        if calendar_path and os.path.exists(calendar_path):
+            with open(calendar_path, "r", encoding="utf-8") as f:
+                campaigns = sorted(parse_campaigns(f.read()))
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                # Use pandas for easy sql -> dict conversion
-                df = pd.read_sql_query(query, conn)
-                
-                if df.empty:
-                    return "Query executed successfully but returned no results."
-                
-                return df.to_dict(orient="records")
-                
+            with closing(sqlite3.connect(self.db_path)) as conn:
+                years = conn.execute(
+                    "SELECT CAST(substr(MIN(OrderDate), 1, 4) AS INTEGER), CAST(substr(MAX(OrderDate), 1, 4) AS INTEGER) "
+                    "FROM Orders WHERE date(OrderDate) IS NOT NULL"
+                ).fetchone()
+                if years[0] is None:
+                    return
+                meta = None
+                if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'dim_date_meta'").fetchone():
+                    meta = conn.execute("SELECT version, first_year, last_year, campaigns FROM dim_date_meta").fetchone()
+                if meta != (DATE_DIMENSION_VERSION, years[0], years[1], repr(campaigns)):
+                    print("📅 Building date dimension...")
+                    with conn:
+                        for sql in date_dimension_statements(years[0], years[1], campaigns):
+                            conn.execute(sql)
         except Exception as e:
+            print(f"Warning: Could not build date dimension: {e}")
+
+    def _sargable_date_columns(self) -> set:
+        """
+        Lower-case names of the date columns that hold canonical ISO text in
+        every table they appear in (safe for rewrite_date_predicates).
+        Rechecked whenever the DB file changes.
+        """
+        identity = self._db_identity()
+        with self._date_lock:
+            if identity == self._date_identity:
+                return self._date_columns
+
+            uri = f"file:{quote(os.path.abspath(self.db_path))}?mode=ro"
+            candidates, unsafe = set(), set()
+            with closing(sqlite3.connect(uri, uri=True)) as conn:
+                tables = [row[0] for row in conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+                )]
+                for table in tables:
+                    for col in conn.execute(f"PRAGMA table_info('{table}')"):
+                        name, col_type = col[1], (col[2] or "").upper()
+                        if not (name.lower().endswith("date") or "DATE" in col_type or "TIME" in col_type):
+                            continue
+                        candidates.add(name.lower())
+                        if conn.execute(f'SELECT 1 FROM "{table}" WHERE {canonical_date_check(name)} LIMIT 1').fetchone():
+                            unsafe.add(name.lower())
+
+            self._date_columns = candidates - unsafe
+            self._date_identity = identity
+            return self._date_columns
+
+    def _rewrite(self, query: str) -> str:
+        """
+        The query redirected onto a rollup table when provably equivalent, and
+        with strftime date filters turned into index-friendly ranges.
+        """
+        sql = query
+        try:
+            rollups = self._rollups_usable()
+        except (OSError, sqlite3.Error):
+            rollups = False
+        if rollups:
+            rewritten = rewrite_for_rollups(query, self._rollup_columns, self._rollup_unique)
+            if rewritten is not None and rewritten[1] in self._rollup_compact:
+                with self._rollup_lock:
+                    self.rollup_rewrites += 1
+                sql = rewritten[0]
+
+        if self.sargable_dates:
+            try:
+                columns = self._sargable_date_columns()
+            except (OSError, sqlite3.Error):
+                columns = set()
+            ranged = rewrite_date_predicates(sql, columns) if columns else None
+            if ranged is not None:
+                with self._date_lock:
+                    self.date_rewrites += 1
+                sql = ranged
+        return sql
+
+    def run_query(self, query: str, cancel: Optional[CancelToken] = None) -> Union[QueryResult, str]:
+        """
+        Executes a read-only SQL query, streaming rows with fetchmany.
+        Stops at max_rows / max_bytes and reports it via `truncated`.
+        Goes through the result cache when one is configured.
+        `cancel.cancel()` stops this call only (a GUARD_CANCELLED error).
+        """
+        error, query = check_statement(query)
+        if error:
+            return error
+
+        if self.result_cache is None:
+            return self._run_uncached(query, cancel)
+
+        try:
+            fingerprint = (self._db_identity(), self.max_rows, self.max_bytes)
+        except OSError as e:
             return f"SQL Error: {str(e)}"
+        result = self.result_cache.get_or_run(
+            query, fingerprint, lambda: self._run_uncached(query, cancel), relabel=self._column_names
+        )
+        if isinstance(result, str) and guard_kind(result) == GUARD_CANCELLED and not (cancel and cancel.cancelled):
+            # Shared the execution of a caller that cancelled it: run it for this one
+            result = self._run_uncached(query, cancel)
+        return result
+
+    def _run_uncached(self, query: str, cancel: Optional[CancelToken] = None) -> Union[QueryResult, str]:
+        try:
+            self._reopen_if_replaced()
+            sql = self._rewrite(query)
+            with self.pool.connection() as conn:
+                if self.max_plan_cost:
+                    error = self._check_plan_cost(conn, sql)
+                    if error:
+                        return error
+
+                start = time.perf_counter()
+                with self._guard(conn, cancel) as guard:
+                    try:
+                        cursor = conn.execute(sql)
+                        columns = [d[0] for d in cursor.description or []]
+                        rows = []
+                        size = 0
+                        truncated = False
+
+                        while not truncated:
+                            batch = cursor.fetchmany(self.fetch_size)
+                            if not batch:
+                                break
+                            for row in batch:
+                                size += _row_size(row)
+                                if len(rows) >= self.max_rows or size > self.max_bytes:
+                                    truncated = True
+                                    break
+                                rows.append(list(row))
+                        cursor.close()
+                    except sqlite3.OperationalError as e:
+                        if "interrupt" not in str(e):
+                            raise
+                        return self._guard_error(guard["tripped"], time.perf_counter() - start)
+
+                if self.query_log is not None:
+                    self._log_query(conn, query, sql, (time.perf_counter() - start) * 1000, len(rows))
+
+                return {
+                    "columns": columns,
+                    "rows": rows,
+                    "row_count": len(rows),
+                    "truncated": truncated
+                }
 
-    def get_schema(self) -> str:
+        except Exception as e:
+            return f"SQL Error: {str(e)}"
+
+    # --- Execution guard ---
+
+    @contextmanager
+    def _guard(self, conn: sqlite3.Connection, cancel: Optional[CancelToken] = None):
         """
-        Returns schema. We focus on the SIMPLIFIED VIEWS to help the LLM.
+        Enforces timeout_s / max_vm_steps (and `cancel`) through the progress
+        handler for the duration of the block; the yielded dict records which
+        limit tripped.
+        """
+        state = {"tripped": None, "steps": 0}
+        deadline = time.monotonic() + self.timeout_s if self.timeout_s else None
+
+        def progress():
+            if cancel is not None and cancel.cancelled:
+                state["tripped"] = GUARD_CANCELLED
+                return 1
+            state["steps"] += _PROGRESS_INTERVAL
+            if self.max_vm_steps and state["steps"] > self.max_vm_steps:
+                state["tripped"] = GUARD_STEPS
+                return 1
+            if deadline is not None and time.monotonic() > deadline:
+                state["tripped"] = GUARD_TIMEOUT
+                return 1
+            return 0
+
+        conn.set_progress_handler(progress, _PROGRESS_INTERVAL)
+        with self._running_lock:
+            self._running.add(conn)
+        if cancel is not None:
+            cancel._bind((self, conn))
+        try:
+            yield state
+        finally:
+            if cancel is not None:
+                cancel._bind(None)
+            with self._running_lock:
+                self._running.discard(conn)
+            conn.set_progress_handler(None, 0)
+
+    def interrupt(self, conn: sqlite3.Connection):
+        """Cancels the query running on `conn`, if any (see CancelToken); other connections are left alone."""
+        with self._running_lock:
+            if conn in self._running:
+                conn.interrupt()
+
+    def _guard_error(self, kind: Optional[str], elapsed: float) -> str:
+        hint = "Add filters or a LIMIT, and make sure every JOIN has an ON condition."
+        if kind == GUARD_TIMEOUT:
+            return guard_error(kind, f"Query cancelled after {elapsed:.1f}s (limit {self.timeout_s}s). {hint}")
+        if kind == GUARD_STEPS:
+            return guard_error(kind, f"Query cancelled after {self.max_vm_steps:,} SQLite VM steps. {hint}")
+        return guard_error(GUARD_CANCELLED, "Query was cancelled.")
+
+    def _table_rows(self, conn: sqlite3.Connection, table: str) -> Optional[int]:
+        """Row count of a base table, cached per DB file identity."""
+        identity = self._db_identity()
+        with self._running_lock:
+            if identity != self._row_counts_identity:
+                self._row_counts = {}
+                self._row_counts_identity = identity
+            if table in self._row_counts:
+                return self._row_counts[table]
+        count = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+        with self._running_lock:
+            self._row_counts[table] = count
+        return count
+
+    def _check_plan_cost(self, conn: sqlite3.Connection, sql: str) -> Optional[str]:
+        """A cost_limit error when EXPLAIN QUERY PLAN suggests more than max_plan_cost row visits."""
+        try:
+            plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+            with self._schema_lock:
+                self._refresh_schema(conn)
+                catalog, fks = self._schema_catalog, self._schema_fks
+        except sqlite3.Error:
+            return None  # let the execution report it
+
+        names = {}  # plan name (alias / table) -> (base table, name used in the query)
+        for table, alias in referenced_tables(sql):
+            base = SCHEMA_TABLES.get(table, table).lower()
+            if base in catalog:
+                names[alias or table] = (base, alias or table)
+                names.setdefault(base, (base, alias or table))
+
+        def resolve(name: str):
+            return names.get(name.lower()) or ((name.lower(), name) if name.lower() in catalog else None)
+
+        def rows(name: str) -> Optional[int]:
+            target = resolve(name)
+            return self._table_rows(conn, target[0]) if target else None
+
+        estimate = estimate_plan_cost(plan, rows)
+        if estimate["cost"] <= self.max_plan_cost:
+            return None
+
+        message = f"Query plan too expensive (~{estimate['cost']:,} row visits, limit {self.max_plan_cost:,})."
+        for outer, inner in estimate["nested_scans"]:
+            a, b = resolve(outer), resolve(inner)
+            if not a or not b:
+                continue
+            message += f" {b[1]} is fully scanned for every row of {a[1]}: missing join condition?"
+            for src, src_col, dst, dst_col in fks:
+                if {src, dst} == {a[0], b[0]}:
+                    left, right = (a, b) if src == a[0] else (b, a)
+                    message += f" Join them with ON {left[1]}.{src_col} = {right[1]}.{dst_col}."
+                    break
+            break
+        else:
+            message += " Add filters or a LIMIT, or aggregate in a subquery first."
+        return guard_error(GUARD_COST, message)
+
+    def _log_query(self, conn: sqlite3.Connection, query: str, sql: str, elapsed_ms: float, row_count: int):
+        """Records the executed query and its plan; logging never fails the query."""
+        try:
+            plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+            self.query_log.append(query, sql, plan, elapsed_ms, row_count)
+        except Exception as e:
+            print(f"Warning: Could not log query: {e}")
+
+    def _column_names(self, query: str) -> List[str]:
+        """Result column names of `query` without running it (LIMIT 0 wrapper)."""
+        try:
+            self._reopen_if_replaced()
+            with self.pool.connection() as conn:
+                cursor = conn.execute(f"SELECT * FROM ({query.strip().rstrip(';')}) LIMIT 0")
+                return [d[0] for d in cursor.description or []]
+        except Exception:
+            return []
+
+    def execute_query(self, query: str) -> Union[List[Dict[str, Any]], str]:
+        """
+        Executes a read-only SQL query and returns results.
+        """
+        result = self.run_query(query)
+        if isinstance(result, str):
+            return result
+
+        if result["row_count"] == 0:
+            return "Query executed successfully but returned no results."
+
+        return to_records(result)
+
+    def _db_identity(self) -> tuple:
+        """Cheap fingerprint of the DB file; changes when the file is replaced or written."""
+        st = os.stat(self.db_path)
+        return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _introspect(self, conn: sqlite3.Connection) -> Dict[str, Dict[str, Any]]:
         """
+        One pass over SCHEMA_TABLES collecting columns, types, foreign keys, a
+        few sample values and the values of small text domains (category
+        names, countries) for the schema linker. Every verbosity level is
+        rendered from this.
+        """
+        base_to_view = {base.lower(): view for view, base in SCHEMA_TABLES.items()}
+        tables = {}
+        cursor = conn.cursor()
+
+        for table, base_table in SCHEMA_TABLES.items():
+            cursor.execute(f"PRAGMA table_info('{table}')")
+            # Col format: (cid, name, type, notnull, dflt, pk)
+            columns = [(col[1], col[2] or "") for col in cursor.fetchall()]
+
+            # FKs live on the base tables, report them with the view names
+            cursor.execute(f"PRAGMA foreign_key_list('{base_table}')")
+            foreign_keys = []
+            for fk in cursor.fetchall():
+                # FK format: (id, seq, table, from, to, on_update, on_delete, match)
+                target = base_to_view.get(fk[2].lower(), fk[2])
+                foreign_keys.append((fk[3], target, fk[4] or fk[3]))
+
+            cursor.execute(f"SELECT * FROM '{table}' LIMIT 3")
+            sample_rows = cursor.fetchall()
+            samples = {}
+            for i, (name, _) in enumerate(columns):
+                values = []
+                for row in sample_rows:
+                    if row[i] is not None and row[i] not in values and not isinstance(row[i], bytes):
+                        values.append(row[i])
+                samples[name] = values
+
+            domains = {}
+            for name, col_type in columns:
+                if "CHAR" in col_type.upper() or "TEXT" in col_type.upper():
+                    cursor.execute(f'SELECT DISTINCT "{name}" FROM \'{table}\' WHERE "{name}" IS NOT NULL '
+                                   f'LIMIT {_LINK_VALUES_MAX + 1}')
+                    distinct = [str(row[0]) for row in cursor.fetchall()]
+                    if len(distinct) <= _LINK_VALUES_MAX:
+                        domains[name] = distinct
+
+            tables[table] = {"columns": columns, "foreign_keys": foreign_keys, "samples": samples,
+                             "values": domains}
+        return tables
+
+    def _render_schema(self, level: str, selection: Optional[Dict[str, List[str]]] = None) -> str:
+        """Renders every table, or only the tables / columns of `selection`."""
         schema_str = []
-        # ADD 'categories' HERE so it can look up "Beverages" -> ID 1
-        target_tables = ['orders', 'order_items', 'products', 'customers', 'categories'] 
-        
+        for table, info in self._schema_tables.items():
+            if selection is not None and table not in selection:
+                continue
+            keep = set(selection[table]) if selection is not None else None
+            columns = [(name, col_type) for name, col_type in info["columns"] if keep is None or name in keep]
+            schema_str.append(f"Table: {table}")
+            if level == "names":
+                col_names = [name for name, _ in columns]
+            else:
+                col_names = [f"{name} {col_type}".strip() for name, col_type in columns]
+            schema_str.append(f"Columns: {', '.join(col_names)}")
+
+            if level == "full":
+                foreign_keys = [fk for fk in info["foreign_keys"]
+                                if selection is None or (fk[0] in keep and fk[1] in selection)]
+                if foreign_keys:
+                    fks = [f"{src} -> {target}.{dst}" for src, target, dst in foreign_keys]
+                    schema_str.append(f"Foreign keys: {', '.join(fks)}")
+                samples = [
+                    f"{name}={', '.join(repr(v)[:30] for v in values)}"
+                    for name, values in info["samples"].items() if values and (keep is None or name in keep)
+                ]
+                if samples:
+                    schema_str.append(f"Samples: {'; '.join(samples)}")
+            schema_str.append("-" * 20)
+        return "\n".join(schema_str)
+
+    def get_schema(self, level: str = "names") -> str:
+        """
+        Returns schema. We focus on the SIMPLIFIED VIEWS to help the LLM.
+
+        `level` is one of "names" (column names), "types" (names + types) or
+        "full" (names + types + foreign keys + sample values). The rendered
+        string is memoized and only rebuilt when the DB file identity or
+        PRAGMA schema_version changes.
+        """
+        if level not in SCHEMA_LEVELS:
+            raise ValueError(f"Unknown schema level '{level}', expected one of {SCHEMA_LEVELS}")
+
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                for table in target_tables:
-                    cursor.execute(f"PRAGMA table_info('{table}')")
-                    columns = cursor.fetchall()
-                    
-                    # Col format: (cid, name, type, notnull, dflt, pk)
-                    col_names = [col[1] for col in columns]
-                    schema_str.append(f"Table: {table}")
-                    schema_str.append(f"Columns: {', '.join(col_names)}")
-                    schema_str.append("-" * 20)
-                    
+            self._reopen_if_replaced()
+            with self.pool.connection() as conn:
+                with self._schema_lock:
+                    self._refresh_schema(conn)
+                    if level not in self._schema_rendered:
+                        self._schema_rendered[level] = self._render_schema(level)
+                    return self._schema_rendered[level]
+
+        except Exception as e:
+            return f"Error retrieving schema: {str(e)}"
+
+    def link_schema(self, question: str, context: str = "") -> Optional[SchemaLink]:
+        """The tables / columns (plus join keys) relevant to a question, None if nothing links."""
+        self._reopen_if_replaced()
+        with self.pool.connection() as conn:
+            with self._schema_lock:
+                self._refresh_schema(conn)
+                tables = self._schema_tables
+        values = {table: info["values"] for table, info in tables.items()}
+        return link_schema(tables, question, context, values)
+
+    def get_linked_schema(self, question: str, context: str = "", level: str = "names") -> str:
+        """
+        get_schema() restricted to what link_schema() finds relevant for the
+        question (and retrieved `context`); the full schema when nothing links.
+        """
+        if level not in SCHEMA_LEVELS:
+            raise ValueError(f"Unknown schema level '{level}', expected one of {SCHEMA_LEVELS}")
+        try:
+            link = self.link_schema(question, context)
+            if link is None:
+                return self.get_schema(level)
+            with self._schema_lock:
+                return self._render_schema(level, link["tables"])
         except Exception as e:
             return f"Error retrieving schema: {str(e)}"
-            
-        return "\n".join(schema_str)
\ No newline at end of file
+
+    def _refresh_schema(self, conn: sqlite3.Connection):
+        """Re-introspects when the DB file or its schema changed. Call with _schema_lock held."""
+        key = (self._db_identity(), conn.execute("PRAGMA schema_version").fetchone()[0])
+        if key != self._schema_key:
+            self._schema_tables = self._introspect(conn)
+            self._schema_catalog = {
+                name.lower(): [col[1] for col in conn.execute(f"PRAGMA table_info('{name}')")]
+                for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")
+            }
+            # Foreign keys as (table, column, referenced table, referenced column), lower-case tables
+            self._schema_fks = [
+                (name.lower(), fk[3], fk[2].lower(), fk[4] or fk[3])
+                for name in self._schema_catalog
+                for fk in conn.execute(f"PRAGMA foreign_key_list('{name}')")
+            ]
+            self._schema_rendered = {}
+            self._schema_key = key
+
+    def _reopen_if_replaced(self):
+        """Reopens the pool when the DB file changed since it was opened (its connections are immutable)."""
+        identity = self._db_identity()
+        if identity != self._pool_identity:
+            self._pool_identity = identity
+            self.pool.close()
+
+    def validate(self, query: str) -> Tuple[Optional[str], str]:
+        """
+        Pre-flight check without running the query: (error, statement).
+
+        The statement must be a single SELECT; table and `alias.column` names
+        are checked against the cached schema (with "Did you mean" hints);
+        finally SQLite compiles it with EXPLAIN, which catches syntax errors
+        and anything else it would reject. `error` is None when valid, the
+        statement comes back cleaned (no trailing ';').
+        """
+        error, statement = check_statement(query)
+        if error:
+            return error, statement
+        try:
+            self._reopen_if_replaced()
+            with self.pool.connection() as conn:
+                with self._schema_lock:
+                    self._refresh_schema(conn)
+                    catalog = self._schema_catalog
+                problems = check_references(statement, catalog)
+                if problems:
+                    return "SQL Error: " + " ".join(problems), statement
+                try:
+                    conn.execute(f"EXPLAIN {statement}").fetchall()
+                except sqlite3.Error as e:
+                    return f"SQL Error: {explain_diagnostic(str(e), statement, catalog)}", statement
+        except Exception as e:
+            # Validation is best effort: let the executor report real failures
+            print(f"Warning: Could not validate query: {e}")
+        return None, statement
@@ -1,17 +1,162 @@
+import asyncio
 import click
 import json
 import os
-from typing import List, Dict, Any
-from agent.graph_hybrid import app  # Import compiled graph
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, Optional
+from agent.graph_hybrid import build_app, get_components  # Cheap: components load lazily
+from agent.batch_io import Checkpoint, completed_ids, in_shard, iter_jsonl, parse_shard
+from agent.metrics import Metrics
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
+def build_initial_state(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Builds the graph input state for one batch item."""
+    return {
+        "question": item['question'],
+        "format_hint": item.get('format_hint', ''),
+        "router_decision": "",
+        "retrieved_docs": [],
+        "sql_query": "",
+        "sql_result": "",
+        "sql_truncated": False,
+        "sql_error": None,
+        "retry_count": 0,
+        "final_answer": "",
+        "explanation": "",
+        "citations": []
+    }
+
+def build_output_record(question_id: str, final_state: Dict[str, Any]) -> Dict[str, Any]:
+    """Turns the final graph state into the output JSONL record."""
+    # Calculate Heuristic Confidence
+    confidence = 0.5
+    if final_state.get('sql_result') and not final_state.get('sql_error'):
+        confidence += 0.3
+    if final_state.get('retrieved_docs'):
+        confidence += 0.1
+    if final_state.get('retry_count', 0) > 0:
+        confidence -= 0.2
+    confidence = max(0.0, min(1.0, confidence))
+
+    return {
+        "id": question_id,
+        "final_answer": final_state.get("final_answer", "Error"),
+        "sql": final_state.get("sql_query", ""),
+        "confidence": round(confidence, 2),
+        "explanation": final_state.get("explanation", "No explanation provided."),
+        "citations": final_state.get("citations", [])
+    }
+
+def build_error_record(question_id: str, error: Exception) -> Dict[str, Any]:
+    return {
+        "id": question_id,
+        "final_answer": "Error",
+        "sql": "",
+        "confidence": 0.0,
+        "explanation": str(error),
+        "citations": []
+    }
+
+async def answer_question(app, item: Dict[str, Any], position: str,
+                          metrics_sink: Optional[Metrics] = None) -> Dict[str, Any]:
+    """Runs one question through the async graph and returns its output record."""
+    question_id = item['id']
+    print(f"\n[{position}] Processing ID: {question_id}")
+
+    try:
+        if metrics_sink is None:
+            final_state = await app.ainvoke(build_initial_state(item))
+        else:
+            with metrics_sink.question(question_id):
+                final_state = await app.ainvoke(build_initial_state(item))
+        return build_output_record(question_id, final_state)
+    except Exception as e:
+        print(f"❌ Error processing {question_id}: {e}")
+        return build_error_record(question_id, e)
+
+async def run_batch(items: Iterable[Dict[str, Any]], f_out, concurrency: int, app=None,
+                    on_record: Optional[Callable[[Dict[str, Any], Dict[str, Any]], None]] = None,
+                    metrics_sink: Optional[Metrics] = None):
+    """
+    Runs up to `concurrency` questions at once over a (possibly streamed)
+    iterable of items, keeping a bounded window of them in flight. Records
+    are written in input order: each one is flushed as soon as it and
+    everything before it is done, then `on_record(item, record)` is called.
+    Questions are timed into `metrics_sink` (pass the same sink to build_app
+    to get the per-node spans tagged with the question id).
+    """
+    app = app or build_app(use_async=True, metrics_sink=metrics_sink)
+    semaphore = asyncio.Semaphore(concurrency)
+    window = deque()
+
+    async def bounded(item: Dict[str, Any], position: str):
+        async with semaphore:
+            return await answer_question(app, item, position, metrics_sink)
+
+    async def write_oldest():
+        item, task = window.popleft()
+        record = await task
+        f_out.write(json.dumps(record) + "\n")
+        f_out.flush()
+        if on_record is not None:
+            on_record(item, record)
+
+    for i, item in enumerate(items):
+        window.append((item, asyncio.create_task(bounded(item, f"#{i+1}"))))
+        # A few queued behind the running ones, so a slow head does not idle the workers
+        if len(window) >= concurrency * 4:
+            await write_oldest()
+
+    while window:
+        await write_oldest()
+
 @click.command()
 @click.option('--batch', required=True, help='Path to input JSONL file')
 @click.option('--out', required=True, help='Path to output JSONL file')
-def run(batch, out):
+@click.option('--concurrency', default=1, show_default=True, type=click.IntRange(min=1),
+              help='Number of questions processed at the same time')
+@click.option('--resume', is_flag=True,
+              help='Append to --out and skip question IDs it already contains')
+@click.option('--shard', default=None, metavar='I/N',
+              help='Only answer the questions of shard I of N (0-based, assigned by ID)')
+@click.option('--checkpoint-every', default=25, show_default=True, type=click.IntRange(min=1),
+              help='Write <out>.checkpoint.json every N records')
+@click.option('--metrics', 'show_metrics', is_flag=True,
+              help='Print p50/p95/p99 latency per graph node at the end of the batch')
+@click.option('--metrics-dir', default=None,
+              help='Write per-node events (events.jsonl, appended) and a Prometheus summary (metrics.prom) here')
+@click.option('--lm-record', default=None, metavar='PATH',
+              help='Record every LLM request/response to a JSONL fixture (turns the LM cache off)')
+@click.option('--lm-replay', default=None, metavar='PATH',
+              help='Answer LLM calls from a recorded fixture instead of the model')
+@click.option('--replay-latency-ms', default=None, type=click.FloatRange(min=0),
+              help='Fixed delay per replayed call (default: the recorded time)')
+@click.option('--replay-latency-scale', default=1.0, show_default=True, type=click.FloatRange(min=0),
+              help='Multiplier on the recorded time per replayed call (0 = no delay)')
+@click.option('--replay-on-miss', type=click.Choice(['error', 'live']), default='error', show_default=True,
+              help='What to do with a request the fixture does not contain')
+@click.option('--lm-cache/--no-lm-cache', default=True, show_default=True,
+              help='Reuse cached LLM responses across runs')
+@click.option('--lm-cache-path', default='.cache/lm_responses.sqlite', show_default=True)
+@click.option('--lm-cache-max-mb', default=256, show_default=True, type=click.IntRange(min=1))
+@click.option('--lm-cache-ttl', default=None, type=float, help='Default entry TTL in seconds')
+@click.option('--lm-cache-disable', multiple=True, metavar='SIGNATURE',
+              help='Do not cache this signature (Router, TextToSQL, HybridSynthesizer); repeatable')
+@click.option('--lm-cache-signature-ttl', multiple=True, metavar='SIGNATURE=SECONDS',
+              help='Per-signature TTL override; repeatable')
+@click.option('--sql-candidates', default=1, show_default=True, type=click.IntRange(min=1),
+              help='SQL candidates generated and run in parallel per attempt (1: sequential repair loop)')
+@click.option('--candidate-selection', type=click.Choice(['first', 'vote']), default='first', show_default=True,
+              help='Keep the first candidate that runs, or the result most candidates agree on')
+@click.option('--candidate-sampling', type=click.Choice(['concurrent', 'n']), default='concurrent',
+              show_default=True, help='K parallel LLM calls, or one call asking for K completions')
+def run(batch, out, concurrency, resume, shard, checkpoint_every, show_metrics, metrics_dir, lm_record, lm_replay,
+        replay_latency_ms, replay_latency_scale, replay_on_miss, lm_cache, lm_cache_path, lm_cache_max_mb,
+        lm_cache_ttl, lm_cache_disable, lm_cache_signature_ttl, sql_candidates, candidate_selection,
+        candidate_sampling):
     """
     Main entry point to run the Retail Analytics Copilot.
     Reads questions from --batch, runs the graph, and writes to --out.
@@ -19,85 +164,117 @@ def run(batch, out):
     print(f"🚀 Starting Retail Copilot...")
     print(f"📂 Reading from: {batch}")
     print(f"💾 Writing to: {out}")
+    print(f"⚡ Concurrency: {concurrency}")
+    try:
+        shard_spec = parse_shard(shard)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--shard')
+    if shard_spec:
+        print(f"🧩 Shard: {shard_spec[0]}/{shard_spec[1]}")
+
+    from agent.lm_cache import LMCache, parse_policies
+
+    config = {"sql_candidates": sql_candidates, "candidate_selection": candidate_selection,
+              "candidate_sampling": candidate_sampling}
+    if sql_candidates > 1:
+        print(f"🎲 SQL candidates: {sql_candidates} ({candidate_sampling}, {candidate_selection})")
+    components = get_components(config)
+    transport = None
+    if lm_record and lm_replay:
+        raise click.UsageError("--lm-record and --lm-replay are mutually exclusive")
+    if lm_record:
+        from agent.lm_replay import RecordingTransport
+        transport = RecordingTransport(lm_record)
+        lm_cache = False  # cache hits would never reach the fixture
+    elif lm_replay:
+        lm_cache = False  # every call replays (latency, misses), and fixture responses stay out of the cache
+        from agent.lm_replay import ReplayTransport
+        if not os.path.exists(lm_replay):
+            raise click.BadParameter(f"Fixture '{lm_replay}' not found", param_hint='--lm-replay')
+        transport = ReplayTransport(lm_replay, latency_ms=replay_latency_ms, latency_scale=replay_latency_scale,
+                                    on_miss=replay_on_miss)
+    components.configure_lm_transport(transport)
+    if transport is not None:
+        print(f"🎞️ LM transport: {transport.stats()}")
+
+    cache = None
+    if lm_cache:
+        try:
+            policies = parse_policies(lm_cache_disable, lm_cache_signature_ttl)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint='--lm-cache-signature-ttl')
+        cache = LMCache(
+            path=lm_cache_path,
+            max_bytes=lm_cache_max_mb * 1024 * 1024,
+            ttl=lm_cache_ttl,
+            policies=policies,
+        )
+    components.configure_lm_cache(cache)
+    print(f"🧠 LM cache: {lm_cache_path if cache else 'disabled'}")
 
-    results = []
-    
     if not os.path.exists(batch):
         print(f"Error: Input file '{batch}' not found.")
         return
 
-    with open(batch, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
+    checkpoint = Checkpoint(out, batch, shard_spec, every=checkpoint_every)
+    done = set()
+    start = 0
+    if resume:
+        done = completed_ids(out)
+        start = checkpoint.resume_offset()
+        if start and checkpoint.state["last_id"] is not None and str(checkpoint.state["last_id"]) not in done:
+            start = 0  # checkpoint is ahead of the output: re-read the input
+        print(f"⏩ Resuming: {len(done)} answered, input offset {start}")
 
-    with open(out, 'w', encoding='utf-8') as f_out:
-        for i, line in enumerate(lines):
-            if not line.strip():
+    def pending():
+        """Streams the questions this invocation still has to answer."""
+        for offset, item in iter_jsonl(batch, start):
+            if not in_shard(item.get('id'), shard_spec):
                 continue
-                
-            try:
-                item = json.loads(line)
-            except json.JSONDecodeError:
-                print(f"⚠️ Skipping invalid JSON line: {line[:50]}...")
+            if str(item.get('id')) in done:
+                checkpoint.skip()
                 continue
+            item['_offset'] = offset
+            yield item
+
+    def on_record(item, record):
+        checkpoint.record(record['id'], item['_offset'])
+
+    # Load docs, DB and DSPy modules up front rather than inside the first task
+    components.warm_up()
+    metrics_sink = None
+    if metrics_dir or show_metrics:
+        metrics_sink = Metrics(os.path.join(metrics_dir, "events.jsonl") if metrics_dir else None)
+    app = build_app(config, use_async=True, metrics_sink=metrics_sink)
 
-            question_id = item['id']
-            question_text = item['question']
-            format_hint = item.get('format_hint', '') 
-            
-            print(f"\n[{i+1}/{len(lines)}] Processing ID: {question_id}")
-            
-            initial_state = {
-                "question": question_text,
-                "format_hint": format_hint, 
-                "router_decision": "",
-                "retrieved_docs": [],
-                "sql_query": "",
-                "sql_result": "",
-                "sql_error": None,
-                "retry_count": 0,
-                "final_answer": "",
-                "explanation": "",
-                "citations": []
-            }
-            
-            try:
-                final_state = app.invoke(initial_state)
-                
-                # Calculate Heuristic Confidence
-                confidence = 0.5
-                if final_state.get('sql_result') and not final_state.get('sql_error'):
-                    confidence += 0.3
-                if final_state.get('retrieved_docs'):
-                    confidence += 0.1
-                if final_state.get('retry_count', 0) > 0:
-                    confidence -= 0.2
-                confidence = max(0.0, min(1.0, confidence))
-
-                output_record = {
-                    "id": question_id,
-                    "final_answer": final_state.get("final_answer", "Error"),
-                    "sql": final_state.get("sql_query", ""),
-                    "confidence": round(confidence, 2),
-                    "explanation": final_state.get("explanation", "No explanation provided."),
-                    "citations": final_state.get("citations", [])
-                }
-                
-                f_out.write(json.dumps(output_record) + "\n")
-                f_out.flush()
-                
-            except Exception as e:
-                print(f"❌ Error processing {question_id}: {e}")
-                error_record = {
-                    "id": question_id,
-                    "final_answer": "Error",
-                    "sql": "",
-                    "confidence": 0.0,
-                    "explanation": str(e),
-                    "citations": []
-                }
-                f_out.write(json.dumps(error_record) + "\n")
+    with open(out, 'a' if resume else 'w', encoding='utf-8') as f_out:
+        try:
+            asyncio.run(run_batch(pending(), f_out, concurrency, app, on_record=on_record,
+                                  metrics_sink=metrics_sink))
+        finally:
+            checkpoint.save()
+            if metrics_sink is not None and metrics_dir:
+                metrics_sink.write_prometheus(os.path.join(metrics_dir, "metrics.prom"))
+    checkpoint.save(complete=True)
+    print(f"📍 Checkpoint: {checkpoint.path} ({checkpoint.state['written']} written, "
+          f"{checkpoint.state['skipped']} already answered)")
 
+    print(f"⚡ Fast router: {components.fast_router.stats()}")
+    print(f"📦 Context packer: {components.context_packer.stats()}")
+    if components.demo_store is not None:
+        print(f"📚 Demo store: {components.demo_store.stats()}")
+    if cache is not None:
+        print(f"🧠 LM cache: {cache.stats()}")
+    if transport is not None:
+        print(f"🎞️ LM transport: {transport.stats()}")
+    if components.sql_tool.result_cache is not None:
+        print(f"🗄️ SQL result cache: {components.sql_tool.result_cache.stats()}")
+    if metrics_sink is not None and metrics_dir:
+        print(f"📊 Metrics: {metrics_sink.events_path}, {os.path.join(metrics_dir, 'metrics.prom')} "
+              f"(run {metrics_sink.run_id})")
+    if show_metrics:
+        print(f"\n📊 Latency per node (ms):\n{metrics_sink.format_table()}")
     print(f"\n✅ Done! Results saved to {out}")
 
 if __name__ == '__main__':
-    run()
\ No newline at end of file
+    run()
@@ -0,0 +1,90 @@
+"""
+BM25 retrieval: sparse-matrix BM25Index vs rank_bm25 + full sort (the previous
+LocalRetriever) on synthetic corpora built from the docs/ vocabulary.
+
+Run from the repo root:
+    python -m scripts.bench_bm25 --chunks 10000 --chunks 100000
+"""
+import glob
+import os
+import random
+import tempfile
+import time
+
+import click
+from rank_bm25 import BM25Okapi
+
+from agent.rag.index import BM25Index, tokenize
+
+def _vocabulary(docs_path):
+    words = set()
+    for filepath in glob.glob(os.path.join(docs_path, "*.md")):
+        with open(filepath, "r", encoding="utf-8") as f:
+            words.update(tokenize(f.read()))
+    return sorted(words)
+
+def _write_corpus(directory, n_chunks, vocab, rng, per_file=1000, words_per_chunk=40):
+    # Zipf-ish sampling so a few terms are frequent, like real policy text
+    weights = [1.0 / (rank + 1) for rank in range(len(vocab))]
+    for start in range(0, n_chunks, per_file):
+        paragraphs = [
+            " ".join(rng.choices(vocab, weights=weights, k=words_per_chunk))
+            for _ in range(min(per_file, n_chunks - start))
+        ]
+        with open(os.path.join(directory, f"doc{start // per_file:05d}.md"), "w", encoding="utf-8") as f:
+            f.write("\n\n".join(paragraphs))
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+@click.command()
+@click.option('--chunks', multiple=True, type=int, default=(10_000, 100_000), show_default=True)
+@click.option('--queries', default=200, show_default=True)
+@click.option('--top-k', default=3, show_default=True)
+@click.option('--docs', default="docs", show_default=True)
+def main(chunks, queries, top_k, docs):
+    rng = random.Random(0)
+    vocab = _vocabulary(docs)
+    questions = [" ".join(rng.sample(vocab, 6)) for _ in range(queries)]
+
+    for n_chunks in chunks:
+        with tempfile.TemporaryDirectory() as tmp:
+            corpus = os.path.join(tmp, "docs")
+            os.makedirs(corpus)
+            _write_corpus(corpus, n_chunks, vocab, rng)
+            files = glob.glob(os.path.join(corpus, "*.md"))
+
+            index = BM25Index(os.path.join(tmp, "bm25.json"))
+            _, cold = _timed(lambda: index.sync(files))
+            _, warm = _timed(lambda: BM25Index(index.path).sync(files))
+
+            tokenized = [tokenize(chunk["content"]) for chunk in index.chunks]
+            bm25, old_build = _timed(lambda: BM25Okapi(tokenized))
+
+            def old_retrieve():
+                for q in questions:
+                    scores = bm25.get_scores(tokenize(q))
+                    sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:top_k]
+
+            def new_retrieve():
+                for q in questions:
+                    index.top_k(index.get_scores(q), top_k)
+
+            def new_batch():
+                for row in index.get_scores_batch(questions):
+                    index.top_k(row, top_k)
+
+            _, old_t = _timed(old_retrieve)
+            _, new_t = _timed(new_retrieve)
+            _, batch_t = _timed(new_batch)
+
+        print(f"\n📚 {n_chunks:,} chunks, {len(index.vocab):,} terms, {queries} queries, top_k={top_k}")
+        print(f"   build: rank_bm25 {old_build:.2f}s | BM25Index cold {cold:.2f}s, warm (from index file) {warm:.2f}s")
+        print(f"   rank_bm25 + sort        {old_t / queries * 1000:8.2f} ms/query")
+        print(f"   BM25Index.retrieve      {new_t / queries * 1000:8.2f} ms/query  ({old_t / new_t:.1f}x)")
+        print(f"   BM25Index batch matmul  {batch_t / queries * 1000:8.2f} ms/query  ({old_t / batch_t:.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Size of the retrieved-docs context in the SQL generator and synthesizer
+prompts, as the retrieved chunks (whole) vs packed into the configured token
+budgets, for every question of the benchmark that retrieves docs. Tokens are
+the packer's estimate (~4 characters per token).
+
+Run from the repo root:
+    python -m scripts.bench_context_packing
+    python -m scripts.bench_context_packing --sql-budget 120 --synth-budget 200 --show
+"""
+import json
+
+import click
+
+from agent.graph_hybrid import get_components
+from agent.rag.context_packer import ContextPacker
+
+@click.command()
+@click.option('--dataset', default="benchmark_dataset.jsonl", show_default=True)
+@click.option('--top-k', default=3, show_default=True, type=click.IntRange(min=1))
+@click.option('--sql-budget', default=None, type=click.IntRange(min=0), help="Default: the agent config's")
+@click.option('--synth-budget', default=None, type=click.IntRange(min=0), help="Default: the agent config's")
+@click.option('--show', is_flag=True, help="Print the packed contexts")
+def main(dataset, top_k, sql_budget, synth_budget, show):
+    components = get_components()
+    config = components.config
+    budgets = {
+        "sql": sql_budget if sql_budget is not None else config["sql_context_tokens"] or 200,
+        "synth": synth_budget if synth_budget is not None else config["synth_context_tokens"] or 350,
+    }
+    packer = ContextPacker(components.retriever.chunks, budgets)
+
+    with open(dataset, "r", encoding="utf-8") as f:
+        items = [json.loads(line) for line in f if line.strip()]
+
+    print(f"\nBudgets: {budgets}")
+    print(f"\n{'question':<40} {'docs tok':>8} {'sql':>5} {'synth':>6}  sources kept (synth)")
+    totals = {"docs": 0, "sql": 0, "synth": 0}
+    for item in items:
+        route = components.fast_router.route(item["question"], item.get("format_hint")) or "hybrid"
+        if route == "sql":
+            continue  # no docs in its prompts
+        docs = components.retriever.retrieve(item["question"], top_k=top_k)
+        sql = packer.pack(item["question"], docs, "sql") if route == "hybrid" else None
+        synth = packer.pack(item["question"], docs, "synth")
+        # Retries pack again: served from the cache
+        packer.pack(item["question"], docs, "synth")
+
+        totals["docs"] += synth["input_tokens"] * (2 if sql else 1)
+        totals["sql"] += sql["tokens"] if sql else 0
+        totals["synth"] += synth["tokens"]
+        sql_tokens = sql["tokens"] if sql else "-"
+        print(f"{item['id']:<40} {synth['input_tokens']:>8} {sql_tokens:>5} {synth['tokens']:>6}  "
+              f"{len(synth['sources'])}/{len(docs)}")
+        if show:
+            for purpose, packed in (("sql", sql), ("synth", synth)):
+                if packed:
+                    print(f"  [{purpose}]\n    " + packed["text"].replace("\n", "\n    "))
+
+    if not totals["docs"]:
+        print("No questions retrieve docs")
+        return
+    packed_total = totals["sql"] + totals["synth"]
+    print(f"\nDoc context tokens per run: {totals['docs']} -> {packed_total} "
+          f"({1 - packed_total / totals['docs']:.1%} fewer)")
+    print(f"Pack cache: {packer.stats()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Sargable date filters on a scaled-up copy of the database: every query runs
+as written (strftime on OrderDate, one function call per row, no index) and
+as SQLiteTool rewrites it (half-open OrderDate ranges on the OrderDate
+index). Results must match. The last case filters through dim_date's
+campaign tags instead of spelling out the months.
+
+Run from the repo root:
+    python -m scripts.bench_dates --scale 50
+"""
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import closing
+
+import click
+
+from agent.tools.sqlite_tool import SQLiteTool
+
+_REVENUE = "SUM(oi.UnitPrice * oi.Quantity * (1 - oi.Discount))"
+
+# (label, query as generated, equivalent query or None to use the rewrite)
+CASES = [
+    ("orders in a month",
+     "SELECT COUNT(*) FROM orders o WHERE strftime('%Y-%m', o.OrderDate) = '2017-06'", None),
+    ("top freight in a year",
+     "SELECT o.OrderID, o.Freight FROM orders AS o WHERE strftime('%Y', o.OrderDate) = '2017' "
+     "ORDER BY o.Freight DESC LIMIT 1;", None),
+    ("revenue in a month (join)",
+     f"SELECT ROUND({_REVENUE}, 2) FROM orders o JOIN order_items oi ON o.OrderID = oi.OrderID "
+     f"WHERE strftime('%Y-%m', o.OrderDate) = '2017-12'", None),
+    ("AOV over two months (IN)",
+     f"SELECT ROUND({_REVENUE} / COUNT(DISTINCT o.OrderID), 2) FROM orders o JOIN order_items oi "
+     f"ON o.OrderID = oi.OrderID WHERE strftime('%Y-%m', o.OrderDate) IN ('2017-06', '2017-12')", None),
+    ("daily orders, one week",
+     "SELECT strftime('%Y-%m-%d', OrderDate) AS day, COUNT(*) FROM orders "
+     "WHERE strftime('%Y-%m-%d', OrderDate) BETWEEN '2017-06-01' AND '2017-06-07' GROUP BY day", None),
+    ("campaign via dim_date",
+     f"SELECT ROUND({_REVENUE}, 2) FROM orders o JOIN order_items oi ON o.OrderID = oi.OrderID "
+     f"WHERE strftime('%Y-%m', o.OrderDate) = '2017-06'",
+     f"SELECT ROUND({_REVENUE}, 2) FROM dim_date d JOIN orders o ON o.OrderDate >= d.date AND o.OrderDate < d.next_date "
+     f"JOIN order_items oi ON o.OrderID = oi.OrderID WHERE d.campaign = 'Summer Beverages' AND d.year = 2017"),
+]
+
+def scale_up(db_path: str, scale: int):
+    """Appends scale - 1 copies of Orders / "Order Details" with shifted OrderIDs."""
+    with closing(sqlite3.connect(db_path)) as conn:
+        offset = conn.execute("SELECT MAX(OrderID) FROM Orders").fetchone()[0]
+        with conn:
+            for table in ("Orders", '"Order Details"'):
+                columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+                select = ", ".join(f"OrderID + {offset} * k" if c == "OrderID" else f'"{c}"' for c in columns)
+                conn.execute(
+                    f"INSERT INTO {table} WITH RECURSIVE copies(k) AS (SELECT 1 UNION ALL SELECT k + 1 FROM copies "
+                    f"WHERE k < {scale - 1}) SELECT {select} FROM {table}, copies"
+                )
+        conn.execute("ANALYZE")
+
+def _timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+@click.command()
+@click.option('--db', default="data/northwind.sqlite", show_default=True)
+@click.option('--scale', default=50, show_default=True, type=click.IntRange(min=1), help="Copies of the orders")
+@click.option('--repeat', default=5, show_default=True, type=click.IntRange(min=1))
+def main(db, scale, repeat):
+    workdir = tempfile.mkdtemp(prefix="bench_dates_")
+    try:
+        path = os.path.join(workdir, "northwind.sqlite")
+        shutil.copy(db, path)
+        scale_up(path, scale)
+
+        # Rollups off so both sides run on the raw tables
+        tool = SQLiteTool(path, rollups=False, date_dimension=True)
+        raw_tool = SQLiteTool(path, rollups=False, date_dimension=False, sargable_dates=False)
+        orders = raw_tool.run_query("SELECT COUNT(*) FROM Orders")["rows"][0][0]
+        print(f"📈 {orders:,} orders ({scale}x)\n")
+
+        failures = 0
+        print(f"{'case':<28} {'strftime ms':>12} {'ranges ms':>10} {'speedup':>8}")
+        for label, sql, equivalent in CASES:
+            raw, raw_t = _timed(lambda: raw_tool.run_query(sql), repeat)
+            new, new_t = _timed(lambda: tool.run_query(equivalent or sql), repeat)
+            ok = not isinstance(raw, str) and not isinstance(new, str) and raw["rows"] == new["rows"]
+            failures += not ok
+            print(f"{'✅' if ok else '❌'} {label:<26} {raw_t * 1000:>12.1f} {new_t * 1000:>10.1f} {raw_t / new_t:>7.1f}x")
+            if not ok:
+                print(f"      raw: {raw}\n      new: {new}")
+
+        print(f"\n{tool.date_rewrites} strftime predicates rewritten")
+        sys.exit(1 if failures else 0)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+How many LLM Router calls the rule-based FastRouter saves on a question set.
+
+Run from the repo root:
+    python -m scripts.bench_fast_router --batch benchmark_dataset.jsonl
+"""
+import json
+
+import click
+
+from agent.fast_router import FastRouter
+from agent.rag.retrieval import LocalRetriever
+
+@click.command()
+@click.option('--batch', default="benchmark_dataset.jsonl", show_default=True)
+@click.option('--threshold', default=0.75, show_default=True)
+def main(batch, threshold):
+    router = FastRouter(LocalRetriever(), threshold=threshold)
+
+    per_route = {}
+    with open(batch, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            route, confidence = router.classify(item["question"], item.get("format_hint"))
+            fast = confidence >= router.threshold
+            counts = per_route.setdefault(route if fast else "llm", {"questions": 0, "saved": 0})
+            counts["questions"] += 1
+            counts["saved"] += int(fast)
+            print(f"{item['id']:<40} {route:<7} {confidence:.2f}  {'fast' if fast else 'LLM'}")
+
+    total = sum(c["questions"] for c in per_route.values())
+    saved = sum(c["saved"] for c in per_route.values())
+    print(f"\n{'route':<8} {'questions':>9} {'LLM calls saved':>16}")
+    for route, counts in sorted(per_route.items()):
+        print(f"{route:<8} {counts['questions']:>9} {counts['saved']:>16}")
+    print(f"{'total':<8} {total:>9} {saved:>16}  ({saved / max(total, 1):.0%} of router calls)")
+
+if __name__ == "__main__":
+    main()
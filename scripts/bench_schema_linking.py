@@ -0,0 +1,112 @@
+"""
+Prompt size of the TextToSQL call with the full schema vs the linked schema
+(only the tables / columns linked to the question, plus join keys), for the
+SQL and hybrid questions of the benchmark. The prompt is rendered exactly as
+DSPy sends it (signature, demos, question + retrieved docs, schema).
+
+With --ttft it also measures time-to-first-token of both prompts against the
+configured model (prompt evaluation dominates it on CPU), and --outputs
+checks that the columns an earlier run's SQL used are all in the linked schema.
+
+Run from the repo root:
+    python -m scripts.bench_schema_linking --outputs outputs_hybrid.jsonl
+    python -m scripts.bench_schema_linking --ttft --repeat 3
+"""
+import json
+import re
+import statistics
+import time
+
+import click
+import dspy
+import litellm
+
+from agent.graph_hybrid import _build_sql_input, get_components
+
+def _prompt(predictor, question: str, schema: str):
+    return dspy.ChatAdapter().format(predictor.signature, predictor.demos,
+                                     {"question": question, "db_schema": schema})
+
+def _ttft(config, messages, repeat: int) -> float:
+    """Median seconds to the first streamed token."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stream = litellm.completion(model=config["model"], api_base=config["api_base"], messages=messages,
+                                    stream=True, max_tokens=1, temperature=0.0, num_ctx=config["num_ctx"])
+        for _chunk in stream:
+            times.append(time.perf_counter() - start)
+            break
+    return statistics.median(times)
+
+def _used_columns(sql: str):
+    """alias.Column references of a query (enough for the generated SQL style)."""
+    return {column for column in re.findall(r"\b[A-Za-z_]\w*\.([A-Za-z_]\w*)", sql or "")}
+
+@click.command()
+@click.option('--dataset', default="benchmark_dataset.jsonl", show_default=True)
+@click.option('--outputs', default=None, help="Earlier answers whose SQL columns must survive linking")
+@click.option('--ttft', is_flag=True, help="Measure time-to-first-token against the configured model")
+@click.option('--repeat', default=3, show_default=True, type=click.IntRange(min=1))
+def main(dataset, outputs, ttft, repeat):
+    components = get_components()
+    config = components.config
+    predictor = components.sql_generator.predictors()[0]
+    sql_tool = components.sql_tool
+
+    with open(dataset, "r", encoding="utf-8") as f:
+        items = [json.loads(line) for line in f if line.strip()]
+    previous_sql = {}
+    if outputs:
+        with open(outputs, "r", encoding="utf-8") as f:
+            previous_sql = {str(r["id"]): r.get("sql", "") for r in map(json.loads, f) if r.get("sql")}
+
+    print(f"\n{'question':<40} {'full tok':>8} {'linked':>7} {'saved':>6}"
+          + (f" {'TTFT full':>10} {'linked':>8}" if ttft else "") + "  missing columns")
+    totals = {"full": 0, "linked": 0, "ttft_full": [], "ttft_linked": []}
+    for item in items:
+        route = components.fast_router.route(item["question"], item.get("format_hint")) or "hybrid"
+        if route == "rag":
+            continue  # never reaches the SQL generator
+        docs = components.retriever.retrieve(item["question"], top_k=3) if route == "hybrid" else []
+        state = {"question": item["question"], "retrieved_docs": docs}
+        context = "\n".join(d["content"] for d in docs)
+
+        full = _prompt(predictor, _build_sql_input(state), sql_tool.get_schema())
+        linked_schema = sql_tool.get_linked_schema(item["question"], context)
+        linked = _prompt(predictor, _build_sql_input(state), linked_schema)
+        full_tokens = litellm.token_counter(model=config["model"], messages=full)
+        linked_tokens = litellm.token_counter(model=config["model"], messages=linked)
+        totals["full"] += full_tokens
+        totals["linked"] += linked_tokens
+
+        missing = ""
+        if item["id"] in previous_sql:
+            kept = set(re.findall(r"\w+", linked_schema))
+            missing = ", ".join(sorted(_used_columns(previous_sql[item["id"]]) - kept)) or "none"
+
+        line = f"{item['id']:<40} {full_tokens:>8} {linked_tokens:>7} {1 - linked_tokens / full_tokens:>6.0%}"
+        if ttft:
+            try:
+                t_full, t_linked = _ttft(config, full, repeat), _ttft(config, linked, repeat)
+            except Exception as e:
+                print(f"Error: TTFT needs the model at {config['api_base']} ({e})")
+                ttft = False
+            else:
+                totals["ttft_full"].append(t_full)
+                totals["ttft_linked"].append(t_linked)
+                line += f" {t_full * 1000:>8.0f}ms {t_linked * 1000:>6.0f}ms"
+        print(f"{line}  {missing}")
+
+    if not totals["full"]:
+        print("No SQL questions in the dataset")
+        return
+    print(f"\nPrompt tokens: {totals['full']} -> {totals['linked']} "
+          f"({1 - totals['linked'] / totals['full']:.1%} fewer)")
+    if totals["ttft_full"]:
+        full_ms = statistics.median(totals["ttft_full"]) * 1000
+        linked_ms = statistics.median(totals["ttft_linked"]) * 1000
+        print(f"Median TTFT: {full_ms:.0f} ms -> {linked_ms:.0f} ms ({1 - linked_ms / full_ms:.1%} faster)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Speculative SQL vs the sequential repair loop on the benchmark set.
+
+Runs the agent once per variant: the sequential loop (sql_gen -> validator
+-> executor, retried on errors), then K candidates per attempt with each
+selection policy. Reports accuracy and the per-question latency
+distribution (p50 / p95 / p99 / max), LLM calls and tokens, plus how each
+variant's tail compares with the sequential loop. The LM cache is off, so
+latencies are real model calls (or a replayed fixture with --lm-replay).
+
+Run from the repo root:
+    python -m scripts.bench_speculative_sql --candidates 3
+    python -m scripts.bench_speculative_sql --candidates 4 --selection vote --sampling n
+"""
+import os
+
+import click
+
+from agent.metrics import quantile
+from scripts.benchmark import gold_answers, load_jsonl, run_agent, score
+
+def _variants(candidates: int, selections, sampling: str):
+    yield "sequential", {"sql_candidates": 1}
+    for selection in selections:
+        yield f"K={candidates} {selection}", {"sql_candidates": candidates, "candidate_selection": selection,
+                                              "candidate_sampling": sampling}
+
+def _latencies(result):
+    values = [q["latency_ms"] for q in result["questions"].values() if q["latency_ms"] is not None]
+    return {name: quantile(values, q) for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))}
+
+@click.command()
+@click.option('--dataset', default="benchmark_dataset.jsonl", show_default=True)
+@click.option('--reference', default="benchmark_reference.jsonl", show_default=True)
+@click.option('--db', default="data/northwind.sqlite", show_default=True)
+@click.option('--out-dir', default=".cache/bench_speculative", show_default=True)
+@click.option('--candidates', default=3, show_default=True, type=click.IntRange(min=2))
+@click.option('--selection', 'selections', multiple=True, type=click.Choice(['first', 'vote']),
+              help="Selection policies to run (default: both)")
+@click.option('--sampling', type=click.Choice(['concurrent', 'n']), default='concurrent', show_default=True)
+@click.option('--lm-replay', default=None, metavar='PATH', help="Answer LLM calls from a recorded fixture")
+def main(dataset, reference, db, out_dir, candidates, selections, sampling, lm_replay):
+    questions = {item["id"]: item for item in load_jsonl(dataset)}
+    refs = load_jsonl(reference)
+    gold = gold_answers(refs, questions, db)
+    transport = None
+    if lm_replay:
+        from agent.lm_replay import ReplayTransport
+        # Candidates sampled above temperature 0 were never recorded: those go to the model
+        transport = ReplayTransport(lm_replay, on_miss="live")
+
+    rows = []
+    for name, config in _variants(candidates, selections or ("first", "vote"), sampling):
+        print(f"\n🚀 {name}")
+        out = os.path.join(out_dir, name.replace(" ", "_").replace("=", ""), "outputs.jsonl")
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        if transport is not None:
+            from agent.graph_hybrid import get_components
+            get_components(config).configure_lm_transport(transport)
+        timings = run_agent(list(questions.values()), out, 1, lm_cache=False, config=config)
+        answers = {str(record["id"]): record for record in load_jsonl(out)}
+        result = score(questions, gold, refs, answers, timings)
+        rows.append((name, result, _latencies(result)))
+
+    print(f"\n{'variant':<16} {'correct':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+          f"{'LM':>5} {'tokens':>8}")
+    for name, result, latency in rows:
+        print(f"{name:<16} {result['correct']:>4}/{result['total']:<3} {latency['p50']:>8.0f} "
+              f"{latency['p95']:>8.0f} {latency['p99']:>8.0f} {latency['max']:>8.0f} "
+              f"{result['lm_calls'] or 0:>5} {result['tokens'] or 0:>8}")
+    base = rows[0][2]
+    for name, _, latency in rows[1:]:
+        change = {k: (latency[k] - base[k]) / base[k] if base[k] else 0.0 for k in ("p50", "p95", "p99")}
+        print(f"{name}: p50 {change['p50']:+.0%}, p95 {change['p95']:+.0%}, p99 {change['p99']:+.0%} "
+              f"vs sequential")
+    if transport is not None:
+        print(f"\n🎞️ LM transport: {transport.stats()}")
+
+if __name__ == "__main__":
+    main()
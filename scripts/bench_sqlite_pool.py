@@ -0,0 +1,54 @@
+"""
+Queries-per-second benchmark: connect-per-call (old SQLiteTool) vs the pooled,
+read-only, memory-mapped connections now used by SQLiteTool.
+
+Run from the repo root:
+    python -m scripts.bench_sqlite_pool --threads 4 --rounds 50
+"""
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+import pandas as pd
+
+from agent.tools.sqlite_tool import SQLiteTool
+
+# Representative agent queries: scalar KPI, grouped top-k, small lookup
+QUERIES = [
+    "SELECT ROUND(SUM(oi.UnitPrice * oi.Quantity * (1 - oi.Discount)) / COUNT(DISTINCT o.OrderID), 2) AS AOV "
+    "FROM orders o JOIN order_items oi ON o.OrderID = oi.OrderID WHERE strftime('%Y-%m', o.OrderDate) = '2017-12'",
+    "SELECT p.ProductName, ROUND(SUM(oi.UnitPrice * oi.Quantity * (1 - oi.Discount)), 2) AS revenue "
+    "FROM order_items oi JOIN products p ON oi.ProductID = p.ProductID GROUP BY p.ProductID ORDER BY revenue DESC LIMIT 3",
+    "SELECT COUNT(*) FROM Employees WHERE Country = 'USA'",
+    "SELECT OrderID, Freight FROM orders ORDER BY Freight DESC LIMIT 1",
+]
+
+def connect_per_call(db_path: str, query: str):
+    """The pre-pool execution path: fresh connection for every query."""
+    with sqlite3.connect(db_path) as conn:
+        return pd.read_sql_query(query, conn).to_dict(orient="records")
+
+def measure(label: str, fn, threads: int, rounds: int) -> float:
+    workload = QUERIES * rounds
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as ex:
+        list(ex.map(fn, workload))
+    elapsed = time.perf_counter() - start
+    qps = len(workload) / elapsed
+    print(f"{label:<22} {len(workload):>6} queries  {elapsed:8.2f}s  {qps:10.1f} q/s")
+    return qps
+
+@click.command()
+@click.option('--db', default="data/northwind.sqlite", show_default=True)
+@click.option('--threads', default=4, show_default=True)
+@click.option('--rounds', default=25, show_default=True, help='Passes over the query mix')
+def main(db, threads, rounds):
+    tool = SQLiteTool(db, pool_size=threads)
+
+    before = measure("connect-per-call", lambda q: connect_per_call(db, q), threads, rounds)
+    after = measure("pooled (ro + mmap)", tool.execute_query, threads, rounds)
+    print(f"\nSpeedup: {after / before:.2f}x")
+
+if __name__ == "__main__":
+    main()
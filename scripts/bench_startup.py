@@ -0,0 +1,56 @@
+"""
+Cold-start cost of the agent entry points, measured in fresh interpreters
+with `python -X importtime` (cumulative import time of the top module) plus
+the wall-clock time of the whole process.
+
+"eager" reproduces the old behaviour where importing agent.graph_hybrid
+configured the LM, loaded docs/BM25, opened the DB and loaded the optimized
+module; the other cases only pay for what they use.
+
+Run from the repo root:
+    python -m scripts.bench_startup --repeat 3
+"""
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+import click
+
+CASES = [
+    ("import agent.graph_hybrid", "import agent.graph_hybrid"),
+    ("graph topology (generate_graph_image)", "from agent.graph_hybrid import build_app; build_app().get_graph()"),
+    ("run_agent_hybrid --help", "import sys; sys.argv = ['run_agent_hybrid', '--help']; import run_agent_hybrid; run_agent_hybrid.run()"),
+    ("eager: import + warm_up()", "import agent.graph_hybrid as g; g.get_components().warm_up()"),
+]
+
+# Top-level entries only ("| name"); nested imports are indented ("|   name")
+_IMPORTTIME_RE = re.compile(r"^import time:\s+\d+ \|\s+(\d+) \| \S+$", re.MULTILINE)
+
+def _measure(code):
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise click.ClickException(f"`{code}` failed:\n{proc.stderr[-2000:]}")
+
+    # Cumulative time of the top-level imports: everything the snippet imported
+    imported = sum(int(m.group(1)) for m in _IMPORTTIME_RE.finditer(proc.stderr))
+    heavy = [name for name in ("dspy", "litellm", "numpy", "scipy", "pandas", "nltk")
+             if re.search(rf"\|\s+{name}$", proc.stderr, re.MULTILINE)]
+    return wall, imported / 1e6, heavy
+
+@click.command()
+@click.option('--repeat', default=3, show_default=True, type=click.IntRange(min=1))
+def main(repeat):
+    print(f"{'case':<40} {'wall s':>8} {'imports s':>10}  heavy modules loaded")
+    for label, code in CASES:
+        runs = [_measure(code) for _ in range(repeat)]
+        wall = statistics.median(r[0] for r in runs)
+        imported = statistics.median(r[1] for r in runs)
+        print(f"{label:<40} {wall:>8.2f} {imported:>10.2f}  {', '.join(runs[0][2]) or '-'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""
+Accuracy and latency benchmark over benchmark_dataset.jsonl.
+
+Gold answers come from benchmark_reference.jsonl: reference SQL executed
+against the database (or a fixed answer for doc-only questions), shaped by
+the question's format hint. Agent answers are compared with type-aware
+tolerance (floats within a cent, case-insensitive strings, unordered string
+lists). Each question also reports its latency, LLM calls and tokens.
+
+Results are compared with a JSON baseline: losing a question that used to be
+correct, or exceeding the baseline latency / LLM calls / tokens by more than
+the tolerance, exits with 1.
+
+Run from the repo root:
+    python -m scripts.benchmark                       # run the agent, compare with the baseline
+    python -m scripts.benchmark --update-baseline     # ... and record the result as the new baseline
+    python -m scripts.benchmark --outputs outputs_hybrid.jsonl   # score an existing output file only
+    python -m scripts.benchmark --learn-demos         # ... and add the correct SQL to the learned demos
+"""
+import asyncio
+import json
+import math
+import os
+import sqlite3
+import sys
+import time
+from contextlib import closing
+from typing import Any, Dict, List, Optional
+
+import click
+
+from agent.metrics import Metrics, quantile
+from agent.output_parser import compile_format_hint, extract_format_hint_from_question, norm_name
+
+def load_jsonl(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def shape_rows(format_hint: str, rows: List[Dict[str, Any]]) -> Any:
+    """Turns reference SQL rows into an answer of the hinted shape, as the agent's SQL fallback does."""
+    schema = compile_format_hint(format_hint)
+    if not rows and schema.kind != "list":
+        return None
+    if schema.kind == "text":
+        return str(next(iter(rows[0].values())))
+    return schema.from_sql(rows)
+
+def gold_answers(reference: List[Dict[str, Any]], questions: Dict[str, Dict[str, Any]], db: str) -> Dict[str, Any]:
+    """id -> gold answer, executing each reference query on a read-only connection."""
+    gold = {}
+    with closing(sqlite3.connect(f"file:{db}?mode=ro", uri=True)) as conn:
+        conn.row_factory = sqlite3.Row
+        for ref in reference:
+            if ref["id"] not in questions:
+                continue
+            if "sql" in ref:
+                gold[ref["id"]] = shape_rows(format_hint(questions[ref["id"]]), list(map(dict, conn.execute(ref["sql"]))))
+            else:
+                gold[ref["id"]] = ref["answer"]
+    return gold
+
+def format_hint(item: Dict[str, Any]) -> str:
+    """The hint the synthesizer uses: the dataset's, else the one stated in the question."""
+    return item.get("format_hint") or extract_format_hint_from_question(item["question"])
+
+def _number(value: Any) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _text(value: Any) -> str:
+    return " ".join(str(value).split()).casefold()
+
+def answers_match(expected: Any, actual: Any, type_name: str = "", ordered: Optional[bool] = None) -> bool:
+    """
+    Type-aware comparison: ints exactly, floats within 0.01 (answers are
+    rounded to 2 decimals), strings case- and whitespace-insensitively, dicts
+    per field (keys normalized), lists of dicts in order and lists of plain
+    values as a multiset unless `ordered`.
+    """
+    if expected is None:
+        return actual is None
+    if isinstance(expected, dict):
+        if not isinstance(actual, dict):
+            return False
+        by_key = {norm_name(k): v for k, v in actual.items()}
+        return len(by_key) == len(expected) and all(
+            norm_name(k) in by_key and answers_match(v, by_key[norm_name(k)]) for k, v in expected.items()
+        )
+    if isinstance(expected, list):
+        if not isinstance(actual, list) or len(actual) != len(expected):
+            return False
+        if ordered is None:
+            ordered = any(isinstance(v, dict) for v in expected)
+        if ordered:
+            return all(answers_match(e, a) for e, a in zip(expected, actual))
+        return sorted(map(_text, expected)) == sorted(map(_text, actual))
+    if isinstance(expected, (int, float)) and not isinstance(expected, bool):
+        number = _number(actual)
+        if number is None:
+            return False
+        if isinstance(expected, int) and type_name != "float":
+            return number == expected
+        return math.isclose(number, expected, rel_tol=1e-9, abs_tol=0.01 + 1e-9)
+    return _text(expected) == _text(actual)
+
+def score(questions, gold, reference, outputs, timings) -> Dict[str, Any]:
+    """Per-question correctness plus the run's accuracy and latency / LLM totals."""
+    refs = {ref["id"]: ref for ref in reference}
+    per_question = {}
+    for qid, item in questions.items():
+        if qid not in gold:
+            continue
+        record = outputs.get(qid, {})
+        hint = format_hint(item)
+        timing = timings.get(qid, {})
+        per_question[qid] = {
+            "correct": answers_match(gold[qid], record.get("final_answer"), hint, refs[qid].get("ordered")),
+            "expected": gold[qid],
+            "answer": record.get("final_answer"),
+            "latency_ms": timing.get("wall_ms"),
+            "lm_calls": timing.get("lm_calls"),
+            "tokens": (timing["prompt_tokens"] + timing["completion_tokens"]) if timing else None,
+        }
+
+    correct = sum(1 for q in per_question.values() if q["correct"])
+    latencies = [q["latency_ms"] for q in per_question.values() if q["latency_ms"] is not None]
+    result = {
+        "correct": correct,
+        "total": len(per_question),
+        "accuracy": round(correct / len(per_question), 4) if per_question else 0.0,
+        "latency_ms": None,
+        "lm_calls": None,
+        "tokens": None,
+        "questions": per_question,
+    }
+    if latencies:
+        result["latency_ms"] = {
+            "p50": round(quantile(latencies, 0.5), 1),
+            "p95": round(quantile(latencies, 0.95), 1),
+            "mean": round(sum(latencies) / len(latencies), 1),
+        }
+        result["lm_calls"] = sum(q["lm_calls"] or 0 for q in per_question.values())
+        result["tokens"] = sum(q["tokens"] or 0 for q in per_question.values())
+    return result
+
+def regressions(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Human-readable reasons the result is worse than the baseline (empty if it is not)."""
+    problems = []
+    if result["accuracy"] < baseline["accuracy"]:
+        problems.append(f"accuracy {result['accuracy']:.0%} < baseline {baseline['accuracy']:.0%}")
+    for qid, q in result["questions"].items():
+        before = baseline["questions"].get(qid)
+        if before and before["correct"] and not q["correct"]:
+            problems.append(f"{qid}: was correct, now {json.dumps(q['answer'])} (expected {json.dumps(q['expected'])})")
+
+    # Cost checks only when both runs ran the agent (scoring an output file has no timings)
+    if result["latency_ms"] and baseline.get("latency_ms"):
+        for key in ("p50", "p95"):
+            limit = baseline["latency_ms"][key] * (1 + tolerance)
+            if result["latency_ms"][key] > limit:
+                problems.append(f"latency {key} {result['latency_ms'][key]:.0f} ms > "
+                                f"{limit:.0f} ms (baseline {baseline['latency_ms'][key]:.0f} ms + {tolerance:.0%})")
+        for key in ("lm_calls", "tokens"):
+            if baseline.get(key) and result[key] > baseline[key] * (1 + tolerance):
+                problems.append(f"{key} {result[key]} > baseline {baseline[key]} + {tolerance:.0%}")
+    return problems
+
+def run_agent(items: List[Dict[str, Any]], out: str, concurrency: int, lm_cache: bool,
+              config: Optional[Dict[str, Any]] = None) -> Dict[str, Dict[str, Any]]:
+    """Answers `items` with the async graph (for agent `config`) into `out`; returns per-question timings."""
+    from agent.graph_hybrid import build_app, get_components
+    from run_agent_hybrid import run_batch
+
+    components = get_components(config)
+    if not lm_cache:
+        components.configure_lm_cache(None)  # measure real LLM latency, not cache lookups
+    components.warm_up()
+
+    # Events of this run only, like the outputs next to them
+    events_path = os.path.join(os.path.dirname(out), "events.jsonl")
+    if os.path.exists(events_path):
+        os.remove(events_path)
+    metrics_sink = Metrics(events_path, per_question=True)
+    app = build_app(config, use_async=True, metrics_sink=metrics_sink)
+    with open(out, "w", encoding="utf-8") as f_out:
+        asyncio.run(run_batch(items, f_out, concurrency, app, metrics_sink=metrics_sink))
+    return metrics_sink.by_question()
+
+def learn(questions, result: Dict[str, Any], answers: Dict[str, Dict[str, Any]]):
+    """Adds the SQL of every correctly answered SQL / hybrid question to the learned demos."""
+    from agent.demo_store import DemoStore
+    from agent.graph_hybrid import get_components
+
+    config = get_components().config
+    store = DemoStore(config["demo_store_path"], config["demo_learned_path"])
+    added = 0
+    for qid, q in result["questions"].items():
+        sql = answers.get(qid, {}).get("sql") or ""
+        if q["correct"] and sql and sql.strip().rstrip(";").upper() != "SELECT 1":
+            added += store.learn(questions[qid]["question"], sql)
+    print(f"\n📚 {added} demos added to {store.learned_path} ({len(store)} total)")
+
+def _short(value: Any, width: int = 40) -> str:
+    text = json.dumps(value, ensure_ascii=False)
+    return text if len(text) <= width else text[:width - 3] + "..."
+
+def print_report(result: Dict[str, Any]):
+    print(f"\n{'question':<40} {'ok':>3} {'ms':>9} {'LM':>4} {'tokens':>7}")
+    for qid, q in result["questions"].items():
+        ms = f"{q['latency_ms']:.0f}" if q["latency_ms"] is not None else "-"
+        print(f"{qid:<40} {'✅' if q['correct'] else '❌':>2} {ms:>9} {q['lm_calls'] if q['lm_calls'] is not None else '-':>4} "
+              f"{q['tokens'] if q['tokens'] is not None else '-':>7}")
+        if not q["correct"]:
+            print(f"    expected {_short(q['expected'])}, got {_short(q['answer'])}")
+    print(f"\nAccuracy: {result['correct']}/{result['total']} ({result['accuracy']:.0%})")
+    if result["latency_ms"]:
+        print(f"Latency: p50 {result['latency_ms']['p50']:.0f} ms, p95 {result['latency_ms']['p95']:.0f} ms, "
+              f"mean {result['latency_ms']['mean']:.0f} ms | LLM calls {result['lm_calls']} | tokens {result['tokens']}")
+
+@click.command()
+@click.option('--dataset', default="benchmark_dataset.jsonl", show_default=True)
+@click.option('--reference', default="benchmark_reference.jsonl", show_default=True,
+              help="Reference SQL (or fixed answers) per question id")
+@click.option('--db', default="data/northwind.sqlite", show_default=True)
+@click.option('--outputs', default=None, help="Score this output file instead of running the agent")
+@click.option('--out', default=".cache/benchmark/outputs.jsonl", show_default=True,
+              help="Where the agent's answers go when it is run")
+@click.option('--concurrency', default=1, show_default=True, type=click.IntRange(min=1),
+              help="Keep at 1 for comparable latencies")
+@click.option('--lm-cache/--no-lm-cache', default=False, show_default=True,
+              help="Answer from the LLM response cache (latencies then measure the cache)")
+@click.option('--baseline', default="benchmark_baseline.json", show_default=True)
+@click.option('--update-baseline', is_flag=True, help="Record this run as the new baseline")
+@click.option('--tolerance', default=0.25, show_default=True, type=click.FloatRange(min=0),
+              help="Allowed growth of latency p50/p95, LLM calls and tokens over the baseline")
+@click.option('--learn-demos', is_flag=True, help="Add the SQL of correctly answered questions to the learned demos")
+def main(dataset, reference, db, outputs, out, concurrency, lm_cache, baseline, update_baseline, tolerance,
+         learn_demos):
+    questions = {item["id"]: item for item in load_jsonl(dataset)}
+    refs = load_jsonl(reference)
+    missing = sorted(set(questions) - {ref["id"] for ref in refs})
+    if missing:
+        print(f"Warning: no reference for {', '.join(missing)} (not scored)")
+    gold = gold_answers(refs, questions, db)
+
+    timings = {}
+    if outputs is None:
+        os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+        print(f"🚀 Running {len(questions)} questions (LM cache {'on' if lm_cache else 'off'})...")
+        timings = run_agent(list(questions.values()), out, concurrency, lm_cache)
+        outputs = out
+    answers = {str(record["id"]): record for record in load_jsonl(outputs)}
+
+    result = score(questions, gold, refs, answers, timings)
+    print_report(result)
+    if learn_demos:
+        learn(questions, result, answers)
+
+    if update_baseline:
+        from agent.graph_hybrid import get_components
+        result.update(created_at=time.strftime("%Y-%m-%dT%H:%M:%S"), db=db, outputs=outputs,
+                      model=get_components().config["model"])
+        with open(baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"\n📌 Baseline written to {baseline}")
+        return
+
+    if not os.path.exists(baseline):
+        print(f"\nNo baseline at {baseline}; record one with --update-baseline")
+        return
+    with open(baseline, "r", encoding="utf-8") as f:
+        problems = regressions(result, json.load(f), tolerance)
+    if problems:
+        print(f"\n❌ REGRESSION against {baseline}:")
+        for problem in problems:
+            print(f"   - {problem}")
+        sys.exit(1)
+    print(f"\n✅ No regression against {baseline}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Manage the TextToSQL demo store (agent/sql_demos.jsonl by default).
+
+    # Import the fixed demos of the optimized module
+    python -m scripts.demo_store seed
+    # Add a pair; the SQL must run and return rows
+    python -m scripts.demo_store add "Total freight in 2016?" "SELECT SUM(Freight) FROM orders WHERE ..."
+    # Which demos a question would get
+    python -m scripts.demo_store select "Top 5 customers by revenue in 2017" -k 3 --budget 600
+    # TextToSQL prompt tokens with the fixed demos vs the selected ones, per benchmark question
+    python -m scripts.demo_store bench
+
+`python -m scripts.benchmark --learn-demos` adds the SQL of correct answers to
+a separate, untracked file (.cache/sql_demos.learned.jsonl), merged at load.
+"""
+import json
+
+import click
+
+from agent.demo_store import DemoStore
+from agent.graph_hybrid import DEFAULT_CONFIG
+
+@click.group()
+@click.option('--store', default=DEFAULT_CONFIG["demo_store_path"], show_default=True)
+@click.option('--learned', default=DEFAULT_CONFIG["demo_learned_path"], show_default=True)
+@click.pass_context
+def cli(ctx, store, learned):
+    ctx.obj = DemoStore(store, learned)
+
+@cli.command()
+@click.option('--module', default=DEFAULT_CONFIG["optimized_sql_module"], show_default=True)
+@click.pass_obj
+def seed(store, module):
+    """Imports the demos saved in an optimized DSPy module."""
+    with open(module, "r", encoding="utf-8") as f:
+        saved = json.load(f)
+    added = 0
+    for name, predictor in saved.items():
+        for demo in predictor.get("demos", []) if isinstance(predictor, dict) else []:
+            if demo.get("question") and demo.get("sql_query"):
+                added += store.append(demo["question"], demo["sql_query"], source="seed")
+    print(f"✅ {added} demos added from {module} ({len(store)} in {store.path})")
+
+@cli.command()
+@click.argument('question')
+@click.argument('sql_query')
+@click.option('--db', default=DEFAULT_CONFIG["db_path"], show_default=True)
+@click.pass_obj
+def add(store, question, sql_query, db):
+    """Adds a question -> SQL pair after checking that the SQL runs and returns rows."""
+    from agent.tools.sqlite_tool import SQLiteTool
+    result = SQLiteTool(db).run_query(sql_query)
+    if isinstance(result, str):
+        raise click.ClickException(result)
+    if not result["row_count"]:
+        raise click.ClickException("The query returned no rows")
+    added = store.append(question, sql_query, source="manual")
+    print(f"✅ Added ({result['row_count']} rows)" if added else "Already in the store")
+
+@cli.command()
+@click.argument('question')
+@click.option('-k', default=DEFAULT_CONFIG["sql_demos"], show_default=True, type=click.IntRange(min=1))
+@click.option('--budget', default=DEFAULT_CONFIG["demo_tokens"], show_default=True, type=click.IntRange(min=0))
+@click.pass_obj
+def select(store, question, k, budget):
+    """Shows the demos a question would be prompted with."""
+    demos = store.select(question, k, budget)
+    if not demos:
+        print("No similar demos (the prompt gets none)")
+    for demo in demos:
+        print(f"[{demo['source']}] {demo['question']}\n    {demo['sql_query']}\n")
+
+@cli.command()
+@click.option('--dataset', default="benchmark_dataset.jsonl", show_default=True)
+@click.pass_obj
+def bench(store, dataset):
+    """Prompt tokens of the SQL generator with the module's fixed demos vs the store's picks."""
+    import dspy
+    import litellm
+    from agent.graph_hybrid import _build_sql_input, _schema_context, _select_demos, get_components
+
+    components = get_components({"demo_store_path": store.path, "demo_learned_path": store.learned_path})
+    predictor = components.sql_generator.predictors()[0]
+    model = components.config["model"]
+    with open(dataset, "r", encoding="utf-8") as f:
+        items = [json.loads(line) for line in f if line.strip()]
+
+    def tokens(demos, state):
+        inputs = {"question": _build_sql_input(state), "db_schema": _schema_context(state, components)}
+        return litellm.token_counter(model=model, messages=dspy.ChatAdapter().format(predictor.signature, demos, inputs))
+
+    print(f"\n{'question':<40} {'fixed':>6} {'picked':>7} {'demos':>6}")
+    totals = [0, 0]
+    for item in items:
+        route = components.fast_router.route(item["question"], item.get("format_hint")) or "hybrid"
+        if route == "rag":
+            continue
+        docs = components.retriever.retrieve(item["question"], top_k=3) if route == "hybrid" else []
+        state = {"question": item["question"], "retrieved_docs": docs}
+        demos = _select_demos(state, components)
+        fixed, picked = tokens(predictor.demos, state), tokens(demos if demos is not None else predictor.demos, state)
+        totals[0] += fixed
+        totals[1] += picked
+        print(f"{item['id']:<40} {fixed:>6} {picked:>7} {len(demos) if demos is not None else '-':>6}")
+    if totals[0]:
+        print(f"\nPrompt tokens: {totals[0]} -> {totals[1]} ({1 - totals[1] / totals[0]:.1%} fewer)")
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,170 @@
+"""
+Local stand-in for the Ollama HTTP API, answering from a recorded LM fixture
+(see `run_agent_hybrid.py --lm-record`) so the whole stack — litellm, DSPy,
+the graph — runs without a model. Serves /api/generate, /api/chat (single
+response, also when streaming is requested), /api/tags, /api/show and
+/api/version.
+
+A request is matched to the fixture entry whose last message it contains.
+Unknown requests get --default-response, or a 404 without one. Every reply
+waits --latency-ms plus completion tokens / --tokens-per-s.
+
+Run from the repo root, then point the agent at it (the default api_base):
+    python -m scripts.fake_ollama --fixture .cache/lm_fixture.jsonl --latency-ms 200
+"""
+import json
+import signal
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+import click
+
+from agent.lm_replay import LMFixture
+
+class FakeOllama:
+    """Fixture lookup, synthetic latency and counters shared by the request handlers."""
+
+    def __init__(self, fixture: Optional[LMFixture], model: str, latency_ms: float = 0.0,
+                 tokens_per_s: Optional[float] = None, default_response: Optional[str] = None):
+        self.fixture = fixture
+        self.model = model
+        self.latency_ms = latency_ms
+        self.tokens_per_s = tokens_per_s
+        self.default_response = default_response
+        self._lock = threading.Lock()
+        self.counts = {"matched": 0, "default": 0, "missing": 0}
+
+    def _count(self, key: str):
+        with self._lock:
+            self.counts[key] += 1
+
+    def answer(self, text: str) -> Optional[Tuple[str, int, int]]:
+        """(content, prompt tokens, completion tokens) for a prompt / last message; None if unknown."""
+        entry = self.fixture.find_text(text) if self.fixture is not None and text else None
+        if entry is not None:
+            self._count("matched")
+            response = entry["response"]
+            usage = response.get("usage") or {}
+            content = response["choices"][0]["message"]["content"]
+            return content, usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0
+        if self.default_response is not None:
+            self._count("default")
+            return self.default_response, len(text.split()), len(self.default_response.split())
+        self._count("missing")
+        return None
+
+    def delay(self, completion_tokens: int):
+        seconds = self.latency_ms / 1000
+        if self.tokens_per_s:
+            seconds += completion_tokens / self.tokens_per_s
+        time.sleep(seconds)
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt
+
+def make_handler(server: FakeOllama):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass  # one line per request would drown the agent's output
+
+        def _send(self, status: int, body: Any, content_type: str = "application/json"):
+            data = body.encode("utf-8") if isinstance(body, str) else json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _body(self) -> Dict[str, Any]:
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                return json.loads(self.rfile.read(length) or b"{}")
+            except json.JSONDecodeError:
+                return {}
+
+        def do_GET(self):
+            if self.path in ("/", ""):
+                self._send(200, "Ollama is running", "text/plain")
+            elif self.path == "/api/tags":
+                self._send(200, {"models": [{"name": server.model, "model": server.model, "size": 0}]})
+            elif self.path == "/api/version":
+                self._send(200, {"version": "0.0.0-fake"})
+            else:
+                self._send(404, {"error": f"unknown endpoint {self.path}"})
+
+        def do_POST(self):
+            body = self._body()
+            if self.path == "/api/show":
+                self._send(200, {"modelfile": "", "parameters": "", "template": "{{ .Prompt }}",
+                                 "details": {"family": "fake"}, "model_info": {}, "capabilities": ["completion"]})
+                return
+            if self.path == "/api/generate":
+                text = str(body.get("prompt", ""))
+            elif self.path == "/api/chat":
+                messages = body.get("messages") or []
+                text = str(messages[-1].get("content", "")) if messages else ""
+            else:
+                self._send(404, {"error": f"unknown endpoint {self.path}"})
+                return
+
+            answer = server.answer(text)
+            if answer is None:
+                self._send(404, {"error": f"no recorded response for: {text[-120:]!r}"})
+                return
+            content, prompt_tokens, completion_tokens = answer
+            server.delay(completion_tokens)
+
+            reply = {
+                "model": body.get("model", server.model),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "done": True,
+                "done_reason": "stop",
+                "prompt_eval_count": prompt_tokens,
+                "eval_count": completion_tokens,
+            }
+            if self.path == "/api/chat":
+                reply["message"] = {"role": "assistant", "content": content}
+            else:
+                reply["response"] = content
+            if body.get("stream"):
+                self._send(200, json.dumps(reply) + "\n", "application/x-ndjson")
+            else:
+                self._send(200, reply)
+
+    return Handler
+
+@click.command()
+@click.option('--fixture', default=None, help="Recorded LM fixture (JSONL) to answer from")
+@click.option('--host', default="127.0.0.1", show_default=True)
+@click.option('--port', default=11434, show_default=True, type=int)
+@click.option('--model', default="phi3.5:3.8b-mini-instruct-q4_K_M", show_default=True,
+              help="Model name listed by /api/tags")
+@click.option('--latency-ms', default=0.0, show_default=True, type=click.FloatRange(min=0),
+              help="Fixed delay per generation")
+@click.option('--tokens-per-s', default=None, type=click.FloatRange(min=0, min_open=True),
+              help="Extra delay per completion token (simulated decode speed)")
+@click.option('--default-response', default=None, help="Reply for requests the fixture does not contain")
+def main(fixture, host, port, model, latency_ms, tokens_per_s, default_response):
+    if fixture is None and default_response is None:
+        raise click.UsageError("Give --fixture, --default-response or both")
+    loaded = LMFixture(fixture) if fixture else None
+    server = FakeOllama(loaded, model, latency_ms, tokens_per_s, default_response)
+    httpd = ThreadingHTTPServer((host, port), make_handler(server))
+    print(f"🦙 Fake Ollama on http://{host}:{port} "
+          f"({len(loaded) if loaded else 0} recorded responses, {latency_ms:.0f} ms latency)")
+    # Also stop cleanly (printing the counters) when run in the background
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        print(f"\n🦙 Requests: {server.counts}")
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,7 @@
-from agent.graph_hybrid import app
+from agent.graph_hybrid import build_app
+
+# Only the topology is needed: no LM, docs or database are loaded
+app = build_app()
 
 def save_graph_syntax():
     print("Generating graph syntax...")
@@ -0,0 +1,61 @@
+"""
+Workload-driven index advisor: reads the query log SQLiteTool writes
+(.cache/query_log.jsonl, see agent/tools/query_log.py), proposes covering
+indexes for the full scans / temp B-trees in the logged plans, tries each one
+on an in-memory copy of the database and reports estimated (plan-based) and
+measured speedups. Nothing is changed unless --apply is given.
+
+Run from the repo root:
+    python -m scripts.index_advisor
+    python -m scripts.index_advisor --apply
+"""
+import click
+
+from agent.tools.index_advisor import IndexAdvisor
+from agent.tools.query_log import read_query_log
+
+@click.command()
+@click.option('--log', 'log_path', default=".cache/query_log.jsonl", show_default=True)
+@click.option('--db', default="data/northwind.sqlite", show_default=True)
+@click.option('--repeat', default=5, show_default=True, type=click.IntRange(min=1),
+              help="Timed runs per query (best is kept)")
+@click.option('--min-gain', default=0.1, show_default=True, help="Minimum measured gain to recommend an index")
+@click.option('--apply', is_flag=True, help="Create the recommended indexes")
+def main(log_path, db, repeat, min_gain, apply):
+    advisor = IndexAdvisor(db)
+    workload = advisor.load_workload(read_query_log(log_path))
+    if not workload:
+        raise click.ClickException(f"No queries in {log_path}; run the agent first")
+    print(f"📜 {sum(q['count'] for q in workload)} logged executions, {len(workload)} distinct queries")
+
+    candidates = advisor.candidates(workload)
+    if not candidates:
+        print("✅ No full scans or temp B-trees worth an index")
+        return
+    report = advisor.evaluate(workload, candidates, repeat=repeat, min_gain=min_gain)
+
+    print(f"\n{'':2} {'est.':>8} {'measured':>9}  index (reason, queries)")
+    for r in report["candidates"]:
+        c = r["candidate"]
+        status = "✅" if r["recommended"] else ("➖" if r["used"] else "❌")
+        measured = f"{r['measured_speedup']:.2f}x" if r["measured_speedup"] else "-"
+        print(f"{status} {r['estimated_speedup']:>7.2f}x {measured:>9}  "
+              f"{c['table']}({', '.join(c['columns'])})  [{c['reason']}, {len(c['queries'])}]")
+
+    total = report["workload"]
+    print(f"\n📊 Workload with {len(report['recommended'])} recommended index(es): "
+          f"{total['before_ms']:.1f} ms -> {total['after_ms']:.1f} ms "
+          f"(estimated {total['estimated_speedup']}x, measured {total['measured_speedup']}x)")
+
+    if not report["recommended"]:
+        return
+    if apply:
+        for ddl in advisor.apply(report["recommended"]):
+            print(f"🔧 {ddl}")
+    else:
+        print("\nRe-run with --apply to create:")
+        for c in report["recommended"]:
+            print(f"  {c['table']}({', '.join(c['columns'])})")
+
+if __name__ == "__main__":
+    main()
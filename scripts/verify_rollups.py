@@ -0,0 +1,105 @@
+"""
+Checks the rollup rewriter against the raw tables: every query runs once on
+the base tables and once as rewritten, results must match (floats within a
+tolerance), and queries the rewriter cannot prove equivalent must be left
+alone. Also prints the speedup per rewritten query; rollups with too many rows
+per order line are built but not queried ("skip": the raw query runs).
+
+Run from the repo root (exits with 1 on any mismatch):
+    python -m scripts.verify_rollups
+"""
+import math
+import sys
+import time
+
+import click
+
+from agent.tools.sqlite_tool import SQLiteTool
+from agent.tools.sql_rewrite import rewrite_for_rollups
+
+# (query, expected rollup table or None when it must stay on the raw tables)
+CASES = [
+    # The optimized module's demos (what TextToSQL actually produces)
+    ("SELECT cat.CategoryName, SUM(oi.Quantity) AS TotalQuantitySold FROM orders AS o JOIN order_items AS oi ON o.OrderID = oi.OrderID JOIN products AS p ON oi.ProductID = p.ProductID JOIN categories AS cat ON p.CategoryID = cat.CategoryID WHERE strftime('%Y-%m', o.OrderDate) IN ('2017-06') GROUP BY cat.CategoryName ORDER BY TotalQuantitySold DESC LIMIT 1;",
+     "rollup_product_daily"),
+    ("SELECT ROUND(SUM(oi.UnitPrice * oi.Quantity * (1 - oi.Discount)) / COUNT(DISTINCT o.OrderID), 2) AS AOV FROM orders o JOIN order_items oi ON o.OrderID = oi.OrderID WHERE strftime('%Y-%m', o.OrderDate) = '2017-12';",
+     "rollup_daily"),
+    ("SELECT p.ProductName, ROUND(SUM(oi.UnitPrice * oi.Quantity * (1 - oi.Discount)), 2) AS total_revenue FROM order_items AS oi JOIN products AS p ON oi.ProductID = p.ProductID GROUP BY p.ProductID, p.ProductName ORDER BY total_revenue DESC LIMIT 3;",
+     "rollup_product_daily"),
+    ("SELECT ROUND(SUM(oi.UnitPrice * oi.Quantity * (1 - oi.Discount)), 2) AS revenue FROM orders o JOIN order_items oi ON o.OrderID = oi.OrderID JOIN products p ON oi.ProductID = p.ProductID JOIN categories cat ON p.CategoryID = cat.CategoryID WHERE cat.CategoryName = 'Beverages' AND strftime('%Y-%m', o.OrderDate) = '2017-06';",
+     "rollup_product_daily"),
+    ("SELECT c.CompanyName, ROUND(SUM((oi.UnitPrice * 0.3) * oi.Quantity * (1 - oi.Discount)), 2) AS total_gross_margin FROM customers AS c JOIN orders AS o ON c.CustomerID = o.CustomerID JOIN order_items AS oi ON o.OrderID = oi.OrderID WHERE strftime('%Y', o.OrderDate) = '2017' GROUP BY c.CompanyName ORDER BY total_gross_margin DESC LIMIT 1;",
+     "rollup_customer_daily"),  # dimension first in FROM
+    ("SELECT c.CompanyName, ROUND(SUM((oi.UnitPrice * 0.3) * oi.Quantity * (1 - oi.Discount)), 2) AS total_gross_margin FROM orders AS o JOIN order_items AS oi ON o.OrderID = oi.OrderID JOIN customers AS c ON c.CustomerID = o.CustomerID WHERE strftime('%Y', o.OrderDate) = '2017' GROUP BY c.CompanyName ORDER BY total_gross_margin DESC LIMIT 1;",
+     "rollup_customer_daily"),
+    ("SELECT ROUND(SUM(oi.UnitPrice * oi.Quantity * (1 - oi.Discount)), 2) AS total_revenue FROM orders o JOIN order_items oi ON o.OrderID = oi.OrderID JOIN products p ON oi.ProductID = p.ProductID JOIN categories cat ON p.CategoryID = cat.CategoryID WHERE strftime('%Y', o.OrderDate) = '2017' AND cat.CategoryName = 'Condiments';",
+     "rollup_product_daily"),
+
+    # Variants the rewriter has to see through
+    ("select sum(oi.Quantity * oi.UnitPrice * (1.0 - oi.Discount)) from orders o join order_items oi on oi.OrderID = o.OrderID where o.OrderDate between '2017-01-01' and '2017-03-31'",
+     "rollup_daily"),
+    ("SELECT strftime('%Y-%m', o.OrderDate) AS month, SUM(oi.Quantity), COUNT(DISTINCT o.OrderID) AS orders FROM orders o JOIN order_items oi ON o.OrderID = oi.OrderID GROUP BY month ORDER BY month",
+     "rollup_daily"),
+    ("SELECT o.CustomerID, COUNT(DISTINCT oi.OrderID) AS n FROM orders o INNER JOIN \"Order Details\" oi ON o.OrderID = oi.OrderID GROUP BY o.CustomerID ORDER BY n DESC, o.CustomerID LIMIT 5",
+     "rollup_customer_daily"),
+    ("SELECT p.ProductName, COUNT(DISTINCT o.OrderID) AS orders FROM orders o JOIN order_items oi ON o.OrderID = oi.OrderID JOIN products p ON p.ProductID = oi.ProductID GROUP BY p.ProductName ORDER BY orders DESC, p.ProductName LIMIT 5",
+     "rollup_product_daily"),
+    ("SELECT SUM(Quantity) FROM order_items", "rollup_daily"),
+
+    # Must stay on the raw tables
+    ("SELECT cat.CategoryName, COUNT(DISTINCT o.OrderID) FROM orders o JOIN order_items oi ON o.OrderID = oi.OrderID JOIN products p ON oi.ProductID = p.ProductID JOIN categories cat ON p.CategoryID = cat.CategoryID GROUP BY cat.CategoryName",
+     None),  # an order spans several products of a category
+    ("SELECT AVG(oi.UnitPrice) FROM order_items oi", None),
+    ("SELECT COUNT(*) FROM orders o JOIN order_items oi ON o.OrderID = oi.OrderID", None),
+    ("SELECT SUM(oi.UnitPrice * oi.Quantity) FROM orders o JOIN order_items oi ON o.OrderID = oi.OrderID", None),
+    ("SELECT SUM(oi.Quantity) FROM orders o JOIN order_items oi ON o.OrderID = oi.OrderID WHERE oi.Discount > 0", None),
+    ("SELECT o.OrderID, o.Freight FROM orders AS o WHERE strftime('%Y', o.OrderDate) = '2017' ORDER BY o.Freight DESC LIMIT 1;", None),
+    ("SELECT SUM(oi.Quantity) FROM orders o LEFT JOIN order_items oi ON o.OrderID = oi.OrderID", None),
+    ("SELECT SUM(oi.Quantity) FROM order_items oi WHERE oi.OrderID IN (SELECT OrderID FROM orders)", None),
+]
+
+def _same(a, b, rel=1e-9, abs_tol=1e-6) -> bool:
+    if isinstance(a, dict):
+        return a["columns"] == b["columns"] and len(a["rows"]) == len(b["rows"]) and all(
+            _same(x, y) for ra, rb in zip(a["rows"], b["rows"]) for x, y in zip(ra, rb)
+        )
+    if isinstance(a, float) or isinstance(b, float):
+        return isinstance(b, (int, float)) and math.isclose(a, b, rel_tol=rel, abs_tol=abs_tol)
+    return a == b
+
+def _timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+@click.command()
+@click.option('--db', default="data/northwind.sqlite", show_default=True)
+@click.option('--repeat', default=5, show_default=True)
+def main(db, repeat):
+    raw_tool = SQLiteTool(db, rollups=False)
+    tool = SQLiteTool(db, rollups=True)
+    print(f"Rows: {tool.rollup_sizes} (used: {', '.join(sorted(tool._rollup_compact)) or 'none'})\n")
+
+    failures = 0
+    for sql, expected in CASES:
+        rewritten = rewrite_for_rollups(sql, tool._rollup_columns, tool._rollup_unique)
+        table = rewritten[1] if rewritten else None
+        raw, raw_t = _timed(lambda: raw_tool.run_query(sql), repeat)
+        new, new_t = _timed(lambda: tool.run_query(sql), repeat)
+
+        ok = table == expected and not isinstance(raw, str) and _same(raw, new)
+        failures += not ok
+        status = "✅" if ok else "❌"
+        speed = f"{raw_t / new_t:5.1f}x" if table in tool._rollup_compact else ("  raw" if not table else " skip")
+        print(f"{status} {speed} {table or '-':<22} {sql[:90]}")
+        if not ok:
+            print(f"      expected table: {expected}\n      rewritten: {rewritten}\n      raw: {raw}\n      new: {new}")
+
+    print(f"\n{len(CASES) - failures}/{len(CASES)} queries match")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()